@@ -1,19 +1,22 @@
 import os
 import re
 import argparse
+import asyncio
 import random
 import json
 
 from copy import deepcopy
+from openai import AsyncOpenAI
 from tqdm import tqdm
 from AutoFormalization.utils import (
-    GPT4,
+    AsyncGPT4,
     ROOT_DIR,
     EXAMPLE_DIR,
     process_image,
     lean_error,
     parse_error,
 )
+from E3.store import DEFAULT_STORE_PATH, ResultStore
 from E3.validator import Validator
 
 
@@ -72,6 +75,174 @@ def examples(dataset, category, num, reasoning):
     return content
 
 
+async def formalize(
+    args,
+    category,
+    i,
+    instruction,
+    example_content,
+    validator,
+    result_dir,
+    store,
+    client,
+    semaphore,
+    validation_semaphore,
+):
+    """
+    Run the conversation for statement ``i`` until the model produces a well-formed
+    formalization or runs out of queries, and write the result to ``result_dir`` (or record it
+    in ``store`` under its path there, if given).
+    """
+    c = category
+    result_file = os.path.join(result_dir, str(i) + ".json")
+    model = AsyncGPT4(
+        model=args.model
+        or (
+            "gpt-4-vision-preview"
+            if args.reasoning == "multi-modal"
+            else "gpt-4-1106-preview"
+        ),
+        client=client,
+    )
+    content = deepcopy(example_content)
+
+    problem_text = ""
+    if args.dataset == "UniGeo":
+        diagram2text_path = os.path.join(
+            ROOT_DIR, args.dataset, c, "diagrams2texts", f"{i}.txt"
+        )
+        with open(diagram2text_path) as f:
+            problem_text += f.read().rstrip("\n") + " "
+
+    text_path = os.path.join(ROOT_DIR, args.dataset, c, "texts", f"{i}.txt")
+    with open(text_path) as f:
+        problem_text += f.read()
+
+    file_name = f"Prop{i:02d}.lean" if args.dataset == "Book" else f"Thm{i:02d}.lean"
+    formalization_path = os.path.join(ROOT_DIR, args.dataset, c, file_name)
+    with open(formalization_path) as f:
+        formalization = f.read()
+        pattern = r"theorem\s?\w+\s?:\s?(.*?)\s?\:\="
+        match = re.search(pattern, formalization, re.DOTALL)
+        formal_statement = match.group(1)
+        formal_statement = re.sub(r"\s+", " ", formal_statement)
+
+    content.append({"type": "text", "text": "Here is your problem:\n"})
+
+    if args.reasoning == "multi-modal":
+        image_path = os.path.join(ROOT_DIR, args.dataset, c, "diagrams", f"{i}.png")
+        image = process_image(image_path)
+        content.append(
+            {
+                "type": "image_url",
+                "image_url": {"url": f"data:image/png;base64,{image}"},
+            }
+        )
+
+    content.append(
+        {
+            "type": "text",
+            "text": f"English Statement: {problem_text}\nFormalized Statement: ",
+        }
+    )
+
+    model.add_message("system", instruction)
+    model.add_message("user", content)
+
+    for q in range(args.num_query):
+        response = None
+        try:
+            async with semaphore:
+                response = await model.get_response()
+        except Exception as e:
+            tqdm.write(f"An error occurred: {e}")
+
+        if response:
+            pattern = r"<<<(.*?)>>>"
+            match = re.search(pattern, response, re.DOTALL)
+
+            if match:
+                pred = match.group(1)
+                pred = re.sub(r"\s+", " ", pred).strip()
+                # validation blocks on Lean, so it runs in a worker thread
+                async with validation_semaphore:
+                    error_message = await asyncio.to_thread(
+                        validator.validate, pred, str(i)
+                    )
+                if error_message is None:
+                    data = {"prediction": pred, "groud_truth": formal_statement}
+                    if store is not None:
+                        store.put_json("statement", result_file, data)
+                    else:
+                        with open(result_file, "w", encoding="utf-8") as f:
+                            json.dump(data, f, ensure_ascii=False)
+                    break
+                else:
+                    model.add_message("assistant", response)
+                    model.add_message("user", lean_error(error_message))
+                    tqdm.write(f"Query {q} failed for statement {i}: {error_message}")
+
+            else:
+                model.add_message("assistant", response)
+                model.add_message("user", parse_error())
+                tqdm.write(
+                    f"Query {q} failed for statement {i}: incorrect output format"
+                )
+
+
+def pending_statements(indices, result_dir, store):
+    """
+    Return the statements in ``indices`` that have no result yet in ``result_dir`` (or in
+    ``store``, if given), so that an interrupted run resumes where it stopped.
+    """
+    pending = []
+    for i in indices:
+        result_file = os.path.join(result_dir, str(i) + ".json")
+        if store.has(result_file) if store is not None else os.path.isfile(result_file):
+            tqdm.write(f"Skipping statement {i}: {result_file} already exists")
+            continue
+        pending.append(i)
+    return pending
+
+
+async def formalize_all(
+    args, category, indices, instruction, example_content, validator, result_dir, store
+):
+    """
+    Formalize the statements in ``indices`` concurrently, with at most ``args.concurrency``
+    requests to the model in flight at a time, and at most ``args.validation_jobs``
+    predictions being validated at a time.
+    """
+    client = AsyncOpenAI(base_url=args.base_url, max_retries=0)
+    semaphore = asyncio.Semaphore(args.concurrency)
+    validation_semaphore = asyncio.Semaphore(args.validation_jobs)
+    tasks = [
+        asyncio.create_task(
+            formalize(
+                args,
+                category,
+                i,
+                instruction,
+                example_content,
+                validator,
+                result_dir,
+                store,
+                client,
+                semaphore,
+                validation_semaphore,
+            )
+        )
+        for i in indices
+    ]
+    try:
+        for task in tqdm(asyncio.as_completed(tasks), total=len(tasks)):
+            await task
+    finally:
+        for task in tasks:
+            task.cancel()
+        await client.close()
+
+
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument(
@@ -109,7 +280,46 @@ def main():
     parser.add_argument(
         "--num_examples", type=int, default=0, help="Number of examples"
     )
+    parser.add_argument(
+        "--backend",
+        choices=["subprocess", "server"],
+        default="subprocess",
+        help="Validate each prediction in a fresh Lean process, or reuse a long-lived E3 server",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=8,
+        help="Maximum number of requests to the model in flight at a time",
+    )
+    parser.add_argument(
+        "--validation-jobs",
+        type=int,
+        default=1,
+        help="Maximum number of predictions validated by Lean at a time",
+    )
+    parser.add_argument(
+        "--base-url",
+        type=str,
+        default=None,
+        help="Base URL of an OpenAI-compatible API (default: $OPENAI_BASE_URL, or OpenAI)",
+    )
+    parser.add_argument(
+        "--model",
+        type=str,
+        default=None,
+        help="Model name, overriding the default for the reasoning type",
+    )
+    parser.add_argument(
+        "--store",
+        nargs="?",
+        const=DEFAULT_STORE_PATH,
+        default=None,
+        help="Record predictions in this store instead of result files, and skip the statements "
+        "already recorded there (default when given: %(const)s)",
+    )
     args = parser.parse_args()
+    store = ResultStore(args.store) if args.store else None
 
     random.seed(42)
 
@@ -138,7 +348,8 @@ def main():
                 args.reasoning,
                 str(args.num_examples) + "-shot",
                 c,
-            )
+            ),
+            backend=args.backend,
         )
         result_dir = str(
             os.path.join(
@@ -164,106 +375,20 @@ def main():
         else:
             testing_idx = [i for i in range(1, 49) if i not in {2, 6, 12, 32, 42}]
 
-        for i in tqdm(testing_idx):
-            result_file = os.path.join(result_dir, str(i) + ".json")
-            if os.path.isfile(result_file):
-                tqdm.write(f"Skipping statement {i}: {result_file} already exists")
-                continue
-            model = GPT4(
-                model=(
-                    "gpt-4-vision-preview"
-                    if args.reasoning == "multi-modal"
-                    else "gpt-4-1106-preview"
-                )
-            )
-            content = deepcopy(example_content)
-
-            problem_text = ""
-            if args.dataset == "UniGeo":
-                diagram2text_path = os.path.join(
-                    ROOT_DIR, args.dataset, c, "diagrams2texts", f"{i}.txt"
-                )
-                with open(diagram2text_path) as f:
-                    problem_text += f.read().rstrip("\n") + " "
-
-            text_path = os.path.join(ROOT_DIR, args.dataset, c, "texts", f"{i}.txt")
-            with open(text_path) as f:
-                problem_text += f.read()
-
-            file_name = (
-                f"Prop{i:02d}.lean" if args.dataset == "Book" else f"Thm{i:02d}.lean"
-            )
-            formalization_path = os.path.join(ROOT_DIR, args.dataset, c, file_name)
-            with open(formalization_path) as f:
-                formalization = f.read()
-                pattern = r"theorem\s?\w+\s?:\s?(.*?)\s?\:\="
-                match = re.search(pattern, formalization, re.DOTALL)
-                formal_statement = match.group(1)
-                formal_statement = re.sub(r"\s+", " ", formal_statement)
-
-            content.append({"type": "text", "text": "Here is your problem:\n"})
-
-            if args.reasoning == "multi-modal":
-                image_path = os.path.join(
-                    ROOT_DIR, args.dataset, c, "diagrams", f"{i}.png"
-                )
-                image = process_image(image_path)
-                content.append(
-                    {
-                        "type": "image_url",
-                        "image_url": {"url": f"data:image/png;base64,{image}"},
-                    }
-                )
-
-            content.append(
-                {
-                    "type": "text",
-                    "text": f"English Statement: {problem_text}\nFormalized Statement: ",
-                }
+        asyncio.run(
+            formalize_all(
+                args,
+                c,
+                pending_statements(testing_idx, result_dir, store),
+                instruction,
+                example_content,
+                validator,
+                result_dir,
+                store,
             )
+        )
 
-            model.add_message("system", instruction)
-            model.add_message("user", content)
-
-            for q in range(args.num_query):
-                response = None
-                try:
-                    response = model.get_response()
-                except Exception as e:
-                    tqdm.write(f"An error occurred: {e}")
-
-                if response:
-                    pattern = r"<<<(.*?)>>>"
-                    match = re.search(pattern, response, re.DOTALL)
-
-                    if match:
-                        pred = match.group(1)
-                        pred = re.sub(r"\s+", " ", pred).strip()
-                        error_message = validator.validate(pred, str(i))
-                        if error_message is None:
-                            with open(result_file, "w", encoding="utf-8") as f:
-                                json.dump(
-                                    {
-                                        "prediction": pred,
-                                        "groud_truth": formal_statement,
-                                    },
-                                    f,
-                                    ensure_ascii=False,
-                                )
-                            break
-                        else:
-                            model.add_message("assistant", response)
-                            model.add_message("user", lean_error(error_message))
-                            tqdm.write(
-                                f"Query {q} failed for statement {i}: {error_message}"
-                            )
-
-                    else:
-                        model.add_message("assistant", response)
-                        model.add_message("user", parse_error())
-                        tqdm.write(
-                            f"Query {q} failed for statement {i}: incorrect output format"
-                        )
+        validator.close()
 
 
 if __name__ == "__main__":
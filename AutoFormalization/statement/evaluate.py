@@ -3,7 +3,11 @@ import json
 import argparse
 
 from tqdm import tqdm
+from E3.cache import DEFAULT_CACHE_PATH, ResultCache
 from E3.checker import Checker
+from E3.pool import CheckerPool, CheckJob
+from E3.smt_cache import DEFAULT_SMT_CACHE_DIR
+from E3.store import DEFAULT_STORE_PATH, ResultStore
 from E3.utils import ROOT_DIR
 
 
@@ -47,10 +51,84 @@ def main():
     parser.add_argument(
         "--num_examples", type=int, default=0, help="Number of examples"
     )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        help="Maximum number of E3 checker processes to run concurrently",
+    )
+    parser.add_argument(
+        "--backend",
+        choices=["subprocess", "server"],
+        default="subprocess",
+        help="Run each check in a fresh Lean process, or reuse long-lived E3 servers",
+    )
+    parser.add_argument(
+        "--cache",
+        nargs="?",
+        const=DEFAULT_CACHE_PATH,
+        default=None,
+        help="Reuse E3 results cached in this database (default when given: %(const)s)",
+    )
+    parser.add_argument(
+        "--chooser-budget-ms",
+        type=int,
+        default=None,
+        help="Time budget of the permutation chooser, in milliseconds, for approximate checks",
+    )
+    parser.add_argument(
+        "--chooser-memo",
+        action="store_true",
+        help="Let the permutation chooser reuse its outputs for instances seen in earlier runs",
+    )
+    parser.add_argument(
+        "--binary-parallelism",
+        type=int,
+        default=1,
+        help="Number of solvers run concurrently by each binary check (up to 3)",
+    )
+    parser.add_argument(
+        "--approx-parallelism",
+        type=int,
+        default=1,
+        help="Number of solvers run concurrently by each approximate check",
+    )
+    parser.add_argument(
+        "--solver-session-queries",
+        type=int,
+        default=None,
+        help="Check SMT queries in incremental z3 sessions, recycled after this many queries",
+    )
+    parser.add_argument(
+        "--smt-cache",
+        nargs="?",
+        const=DEFAULT_SMT_CACHE_DIR,
+        default=None,
+        help="Reuse SMT query results cached in this directory (default when given: %(const)s)",
+    )
+    parser.add_argument(
+        "--capture-smt",
+        default=None,
+        metavar="DIR",
+        help="Save every SMT query issued by the checks in this directory, for replay",
+    )
+    parser.add_argument(
+        "--store",
+        nargs="?",
+        const=DEFAULT_STORE_PATH,
+        default=None,
+        help="Read predictions from and record results in this store instead of result files "
+        "(default when given: %(const)s)",
+    )
     args = parser.parse_args()
 
+    cache = ResultCache(args.cache) if args.cache else None
+    store = ResultStore(args.store) if args.store else None
+
     cnt = 0
     tot = 0
+    queue: list[CheckJob] = []
+    checkers: list[Checker] = []
 
     for c in args.category:
         print("Category: ", c)
@@ -86,32 +164,52 @@ def main():
             ),
             mode=args.mode,
             result_path=result_dir,
+            backend=args.backend,
+            cache=cache,
+            chooser_budget_ms=args.chooser_budget_ms,
+            chooser_memo=args.chooser_memo,
+            binary_parallelism=args.binary_parallelism,
+            approx_parallelism=args.approx_parallelism,
+            solver_session_queries=args.solver_session_queries,
+            smt_cache=args.smt_cache,
+            capture_dir=args.capture_smt,
+            store=store,
         )
+        checkers.append(checker)
 
         if args.dataset == "UniGeo":
             testing_idx = range(1, 21)
         else:
             testing_idx = [i for i in range(1, 49) if i not in {2, 6, 12, 32, 42}]
 
-        for i in tqdm(testing_idx):
+        for i in testing_idx:
             pred_file = os.path.join(pred_dir, str(i) + ".json")
 
-            if os.path.isfile(pred_file):
-                tot += 1
+            data = None
+            if store is not None:
+                data = store.get_json(pred_file)
+            elif os.path.isfile(pred_file):
                 with open(pred_file, "r", encoding="utf-8") as f:
                     data = json.load(f)
 
+            if data is not None:
+                tot += 1
                 pred = data["prediction"]
                 formalization = data["groud_truth"]
-
-                try:
-                    if checker.check(formalization, pred, str(i)):
-                        cnt += 1
-                except Exception as e:
-                    tqdm.write(str(e))
-                    continue
+                queue.append(CheckJob(checker, formalization, pred, str(i)))
             else:
-                tqdm.write(f"Skipping {i}: {pred_file} doesn't exist or is not a file.")
+                print(f"Skipping {i}: {pred_file} doesn't exist or is not a file.")
+
+    with tqdm(total=len(queue)) as progress:
+        for _, result in CheckerPool(args.jobs).run(queue):
+            if isinstance(result, Exception):
+                tqdm.write(str(result))
+            elif result:
+                cnt += 1
+            progress.update()
+
+    for checker in checkers:
+        checker.terminate()
 
     print(f"cnt: {cnt}, tot: {tot}, acc: {(cnt / tot) * 100 if tot != 0 else 0:.2f}%")
 
@@ -1,9 +1,18 @@
 import os
+import asyncio
 import base64
+import random
 import re
 import signal
 
-from openai import OpenAI
+from openai import (
+    APIConnectionError,
+    APITimeoutError,
+    AsyncOpenAI,
+    InternalServerError,
+    OpenAI,
+    RateLimitError,
+)
 
 
 ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
@@ -32,6 +41,82 @@ class GPT4:
         return completion.choices[0].message.content
 
 
+class AsyncGPT4:
+    """
+    Asynchronous counterpart of :class:`GPT4`, for running many conversations concurrently.
+
+    Requests that are rate limited or fail transiently are retried with exponential backoff,
+    honouring the ``Retry-After`` header when the server sends one.
+    """
+
+    def __init__(
+        self,
+        model="gpt-4-1106-preview",
+        temperature=0.2,
+        max_tokens=300,
+        client: AsyncOpenAI | None = None,
+        max_retries=8,
+        initial_backoff=1.0,
+        max_backoff=60.0,
+    ):
+        """
+        :param client: shared client; defaults to one configured by the ``OPENAI_API_KEY`` and
+            ``OPENAI_BASE_URL`` environment variables
+        """
+        # retries are handled here, so that they count towards the caller's concurrency limit
+        self.client = client or AsyncOpenAI(max_retries=0)
+        self.model = model
+        self.temperature = temperature
+        self.max_tokens = max_tokens
+        self.max_retries = max_retries
+        self.initial_backoff = initial_backoff
+        self.max_backoff = max_backoff
+        # kept apart from the global generator, which seeds the choice of prompt examples
+        self._jitter = random.Random()
+        self.messages = []
+
+    def add_message(self, role, content):
+        self.messages.append({"role": role, "content": content})
+
+    async def get_response(self):
+        for attempt in range(self.max_retries + 1):
+            try:
+                completion = await self.client.chat.completions.create(
+                    model=self.model,
+                    messages=self.messages,
+                    temperature=self.temperature,
+                    max_tokens=self.max_tokens,
+                )
+                break
+            except (
+                RateLimitError,
+                APIConnectionError,
+                APITimeoutError,
+                InternalServerError,
+            ) as e:
+                if attempt == self.max_retries:
+                    raise
+                await asyncio.sleep(self._backoff(attempt, e))
+        print(f"Full response: {completion}")
+        return completion.choices[0].message.content
+
+    def _backoff(self, attempt: int, error: Exception) -> float:
+        """
+        Return the number of seconds to wait before retrying after ``error``.
+        """
+        response = getattr(error, "response", None)
+        if response is not None:
+            retry_after = response.headers.get("retry-after")
+            try:
+                return min(float(retry_after), self.max_backoff)
+            except (TypeError, ValueError):
+                pass
+        # full jitter, so that concurrent conversations don't retry in lockstep
+        return self._jitter.uniform(
+            0, min(self.initial_backoff * 2**attempt, self.max_backoff)
+        )
+
+
 def process_image(image_path):
     with open(image_path, "rb") as image_file:
         encoded_string = base64.b64encode(image_file.read()).decode("utf-8")
@@ -1,3 +1,4 @@
 import E3.Engine.Main
 import E3.Engine.Wf
+import E3.Engine.Server
 import UniGeo.Relations
@@ -1,3 +1,4 @@
 import E3.Data.E3Result
 import E3.Data.Config
+import E3.Data.Chooser
 import E3.Data.EvalCtx
@@ -1,5 +1,6 @@
 import Lean
 import E3.Util.String
+import E3.Data.Chooser
 
 set_option autoImplicit false
 
@@ -10,6 +11,7 @@ open Lean
 structure ImpResult where
   totalConjuncts : Nat
   solvedConjuncts : Nat
+deriving Inhabited
 
 namespace ImpResult
 
@@ -45,15 +47,17 @@ end PermutationResult
 
 structure ApproxResult where
   mapping : HashMap String PermutationResult
+  -- how completely `choosePerms.py` searched for the unifications in `mapping`
+  chooserStats : Option ChooserStats := none
 
 namespace ApproxResult
 
 def addResult : ApproxResult → String → HashMap String String → ImpResult → ImpResult → ImpResult → ImpResult → ApproxResult
-| .mk m, nm, perm, fwdL, bwdL, fwdR, bwdR => .mk <| m.insert nm <| .mk perm fwdL bwdL fwdR bwdR
+| r, nm, perm, fwdL, bwdL, fwdR, bwdR => {r with mapping := r.mapping.insert nm <| .mk perm fwdL bwdL fwdR bwdR}
 
 def toJson : ApproxResult → String
-| .mk mapping =>
-  let mapJson := mapping.toList.map (λ ⟨key,val⟩ => wrapObject s!"\"{key}\" : {val}")
+| r =>
+  let mapJson := r.mapping.toList.map (λ ⟨key,val⟩ => wrapObject s!"\"{key}\" : {val}")
   s!"{mapJson}"
 
 
@@ -0,0 +1,31 @@
+import E3.Util.String
+
+set_option autoImplicit false
+
+/--
+A long-running `choosePerms.py --serve` process, which answers permutation-choice requests over
+stdin/stdout, one JSON object per line. Its stderr is inherited, so that it never blocks on a
+pipe that nobody reads.
+-/
+structure ChooserService where
+  child : IO.Process.Child { stdin := .piped, stdout := .piped, stderr := .inherit }
+
+/--
+How much of the search space `choosePerms.py` covered: it scored `explored` of the `total`
+candidate unifications, and `complete` is false if it stopped early (e.g. at its time budget)
+-/
+structure ChooserStats where
+  strategy : String
+  explored : Nat
+  total : Nat
+  complete : Bool
+
+namespace ChooserStats
+
+def toJson : ChooserStats → String
+| ⟨strategy, explored, total, complete⟩ =>
+  wrapObject s!"\"strategy\" : \"{strategy}\", \"explored\" : {explored}, \"total\" : {total}, \"complete\" : \"{complete}\""
+
+instance : ToString ChooserStats := ⟨toJson⟩
+
+end ChooserStats
@@ -17,5 +17,19 @@ structure EvalConfig where
   mode : EvalMode := .justBvars
   writeResult : Bool := false
   outputFile : String  := E3.default_out_dir
+  -- time budget of `choosePerms.py` in milliseconds; 0 to search without one
+  chooserBudgetMs : Nat := 0
+  -- reuse the outputs of `choosePerms.py` memoized across runs
+  chooserMemo : Bool := false
+  -- number of solvers run concurrently by the binary checker (both directions and the unsat check)
+  binaryParallelism : Nat := 1
+  -- number of solvers run concurrently by the approximate checker
+  approxParallelism : Nat := 1
+  -- check SMT queries in incremental solver sessions recycled after this many queries; 0 for a fresh solver per query
+  solverSessionQueries : Nat := 0
+  -- directory of the cache of SMT query results; empty to disable it
+  smtCacheDir : String := ""
+  -- directory in which every SMT query is captured for offline replay; empty to disable capture
+  smtCaptureDir : String := ""
 
 instance : Inhabited EvalConfig := ⟨{}⟩
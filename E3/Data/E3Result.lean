@@ -7,12 +7,14 @@ structure E3Result where
   equiv : Option EquivResult := none
   approx : Option ApproxResult := none
   testUnsat : Bool := false
+  -- milliseconds spent in each phase, see `timed`
+  timings : Array (String × Nat) := #[]
 
 
 namespace E3Result
 
 def equivSuccess : E3Result → Bool
-| .mk _ (some r) _ _ => r.isEquiv
+| .mk _ (some r) _ _ _ => r.isEquiv
 | _ => false
 
 def addEquivResult : E3Result → EquivResult → E3Result :=
@@ -25,10 +27,12 @@ def addTestUnsatResult : E3Result → Bool → E3Result :=
   λ x b => {x with testUnsat := b}
 
 def toJson (name : String) : E3Result → String
-| .mk bvars bin approx b =>
+| .mk bvars bin approx b timings =>
   let bin_str := match bin with | none => "\"none\"" | some r => r.toJson
   let approx_str := match approx with | none => "\"none\"" | some r => r.toJson
-  let contents := wrapObject s!"\"bvars\" : {bvars.toJson}, \n \"binary_check\" : {bin_str}, \n \"approx_check\" : {approx_str}, \n\"testUnsat\" : \"{b}\""
+  let chooser_str := match approx >>= (·.chooserStats) with | none => "\"none\"" | some s => s.toJson
+  let timings_str := wrapObject <| ", ".intercalate <| timings.toList.map (λ ⟨phase, ms⟩ => s!"\"{phase}\" : {ms}")
+  let contents := wrapObject s!"\"bvars\" : {bvars.toJson}, \n \"binary_check\" : {bin_str}, \n \"approx_check\" : {approx_str}, \n \"chooser\" : {chooser_str}, \n\"testUnsat\" : \"{b}\", \n \"timings\" : {timings_str}"
   wrapObject s!"\"{name}\" : \n {contents}"
 
 instance : ToString E3Result := ⟨toJson "E3-result"⟩
@@ -1,5 +1,6 @@
 import E3.Data.BoundVars
 import E3.Data.Config
+import E3.Data.Chooser
 import UniGeo.Relations
 
 open Lean Elab Tactic Meta SystemE.Smt
@@ -25,6 +26,8 @@ structure EvalCtx where
   negativeFormG : Bool := false
   negativeFormT : Bool := false
   testUnsat : Bool := false
+  -- A running permutation chooser to reuse across instances; `none` to spawn one per instance
+  chooser : Option ChooserService := none
 
   -- When checking the forward direction of an implication (Ground ==> Test),
   -- The clauses of the ground proposition never changes between permutations of bound variables,
@@ -35,6 +38,9 @@ structure EvalCtx where
   learnedLHS : LearnedProofs := {}
   learnedRHS : LearnedProofs := {}
 
+  -- Milliseconds spent in each phase so far, in the order they ran
+  timings : Array (String × Nat) := #[]
+
 deriving Inhabited
 
 abbrev PropEvalM := StateT EvalCtx MetaM
@@ -53,6 +59,9 @@ def getEvalConfig : PropEvalM EvalConfig := do
 def getTestUnsat : PropEvalM Bool := do
   get >>= pure ∘ EvalCtx.testUnsat
 
+def getChooser : PropEvalM (Option ChooserService) := do
+  get >>= pure ∘ EvalCtx.chooser
+
 def getInstName : PropEvalM String := do
   get >>= pure ∘ EvalCtx.instanceName
 
@@ -147,7 +156,17 @@ def addProofLHS (x : EAssertion) (b : Bool) : PropEvalM Unit :=
   modify (λ s => {s with learnedLHS := s.learnedLHS.insert x b})
 
 def addProofRHS (x : EAssertion) (b : Bool) : PropEvalM Unit :=
-  modify (λ s => {s with learnedLHS := s.learnedLHS.insert x b})
+  modify (λ s => {s with learnedRHS := s.learnedRHS.insert x b})
+
+def addTiming (phase : String) (ms : Nat) : PropEvalM Unit :=
+  modify (λ s => {s with timings := s.timings.push (phase, ms)})
+
+/-- Run `x`, and record its (monotonic) running time under `phase` -/
+def timed {α : Type} (phase : String) (x : PropEvalM α) : PropEvalM α := do
+  let start ← IO.monoMsNow
+  let r ← x
+  addTiming phase ((← IO.monoMsNow) - start)
+  return r
 
 /- Queries-/
 
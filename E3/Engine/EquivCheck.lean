@@ -8,125 +8,234 @@ set_option autoImplicit false
 
 open Lean Elab Command Tactic Meta Smt.Solver SystemE.Smt SystemE.Tactics
 
+/--
+An SMT query of E3: refute `assertion` within `timeout` seconds, against a background theory
+that depends on the context (see `SmtQuery.background`)
+-/
+structure SmtQuery where
+  -- if we are just checking to see whether `Test` is unsatisfiable
+  unsatCheck : Bool := false
+  -- the context of the clause being checked, or `none` at the formula-level
+  ctx : Option Esmt := none
+  timeout : Nat
+  assertion : EAssertion
+  -- where the query comes from, recorded if queries are captured (see `systemE.captureDir`)
+  tags : List (String × String) := []
+
+/-- The background theories of E3's queries, built once (see `SystemE.Cache.Theory`) -/
+def unsatBackground : SystemE.Cache.Theory := .of (euclidTheory ++ euclidConstructionRulesFull)
+def formulaBackground : SystemE.Cache.Theory := .of (euclidTheory ++ euclidConstructionRulesShort)
+
+/-- Similar to the normal usage in `euclid_*` tactics, except we include different background theories depending on the context -/
+def SmtQuery.background (q : SmtQuery) : SystemE.Cache.Theory :=
+  if q.unsatCheck then unsatBackground
+  else match q.ctx with
+    -- if we are checking equivalence at teh formula-level
+    | none => formulaBackground
+    -- if we are checking individual clauses
+    | some _ => SystemE.Tactics.Translation.euclidBackground
+
+/-- The context of the clause (if any) and the assertion to refute -/
+def SmtQuery.goal (q : SmtQuery) : List Smt.Command :=
+  let ctx := match q.ctx with
+    | some ctx => SystemE.Tactics.Translation.fromEsmt ctx
+    | none => []
+  ctx ++ [s!"{q.assertion}" |> Smt.Term.literalT |> Smt.Command.assert]
+
+/-- Run a query on a fresh solver (or portfolio, or incremental session, see `checkCommands`), and return whether it is `unsat` -/
+def SmtQuery.run (q : SmtQuery) : MetaM Bool := do
+  match ← SystemE.Tactics.Translation.checkCommands q.background q.goal q.timeout q.tags with
+  | .unsat => return true
+  | _ => return false
+
+/-- Run a query, and return whether it is `unsat` and how many milliseconds it took -/
+def SmtQuery.timedRun (q : SmtQuery) : MetaM (Bool × Nat) := do
+  let start ← IO.monoMsNow
+  let r ← q.run
+  return (r, (← IO.monoMsNow) - start)
+
 /-- Modified version of `evalSmt`used by E3. Similar to the normal usage in `euclid_*` tactics, except we include different background theoeries depending on the context -/
-def evalSmt' (unsatCheck : Bool) (Γ : Option Esmt) (t : Nat) (x : EAssertion) : PropEvalM Bool := do
-  let background :=
-    -- if we are just checking to see whether `Test` is unsatisfiable
-    if unsatCheck then euclidTheory ++ euclidConstructionRulesFull
-    else match Γ with
-      -- if we are checking equivalence at teh formula-level
-      | none => euclidTheory ++ euclidConstructionRulesShort
-      -- if we are checking individual clauses
-      | some ctx => euclidTheory ++ SystemE.Tactics.Translation.fromEsmt ctx
-  let assertion :=  s!"{x}" |> Smt.Term.literalT |> Smt.Command.assert
-  let query := addCommands (background ++ [assertion]) *> checkSat
-  let solverState ← Smt.Solver.create t
-  let result ← (StateT.run' query solverState : MetaM _)
-  match result with | .unsat => return true | _ => return false
+def evalSmt' (unsatCheck : Bool) (Γ : Option Esmt) (t : Nat) (x : EAssertion) : PropEvalM Bool :=
+  SmtQuery.run {unsatCheck := unsatCheck, ctx := Γ, timeout := t, assertion := x}
 
+/--
+Run `queries` on at most `lanes` solvers at a time, and return whether each is `unsat`,
+and how many milliseconds it took.
+Each lane is a dedicated task that runs the next query not yet taken until none are left,
+in a copy of the current `CoreM` context.
+-/
+def runSmtQueries (queries : Array SmtQuery) (lanes : Nat) : PropEvalM (Array (Bool × Nat)) := do
+  if lanes ≤ 1 || queries.size ≤ 1 then
+    let mut results := #[]
+    for q in queries do
+      results := results.push (← q.timedRun)
+    return results
+  let coreCtx ← readThe Core.Context
+  let coreState ← getThe Core.State
+  let next ← IO.mkRef 0
+  let lane : IO (Array (Nat × Bool × Nat)) := do
+    let mut results := #[]
+    repeat
+      let i ← next.modifyGet (λ i => (i, i + 1))
+      if h : i < queries.size then
+        let ⟨r, _⟩ ← Meta.MetaM.toIO queries[i].timedRun coreCtx coreState
+        results := results.push (i, r)
+      else
+        break
+    return results
+  let mut tasks := #[]
+  for _ in [:min (max lanes 1) queries.size] do
+    tasks := tasks.push (← IO.asTask lane Task.Priority.dedicated)
+  let mut results := mkArray queries.size (false, 0)
+  for task in tasks do
+    for ⟨i, r⟩ in ← IO.ofExcept task.get do
+      results := results.set! i r
+  return results
 
 /- Check `Ground <==> Test`
    Also try to check whether `Test` is actually unsatisfiable
+   The two directions and the unsatisfiability check are independent, so they run on up to
+   `binaryParallelism` concurrent solvers
 -/
 def checkFullIff : PropEvalM EquivResult := do
   let groundProp ← translateGroundExpr
   let testProp ← translateTestExpr
-  let fwd : EAssertion := .neg <| .imp groundProp testProp
-  let bwd : EAssertion := .neg <| .imp testProp groundProp
-  let fwdResult ← evalSmt' false none (←getEvalConfig).equivSolverTime fwd
-  let bwdResult ← evalSmt' false none (←getEvalConfig).equivSolverTime bwd
+  let cfg ← getEvalConfig
+  let t := cfg.equivSolverTime
+  let inst ← getInstName
+  let tags (phase : String) := [("instance", inst), ("phase", phase)]
+  let fwd : SmtQuery := {timeout := t, assertion := .neg <| .imp groundProp testProp, tags := tags "binary_fwd"}
+  let bwd : SmtQuery := {timeout := t, assertion := .neg <| .imp testProp groundProp, tags := tags "binary_bwd"}
   /- TODO (Logan): Make unsat check time a configuration option-/
-  if ← evalSmt' true none 10 testProp then
+  let unsatCheck : SmtQuery := {unsatCheck := true, timeout := 10, assertion := testProp, tags := tags "unsat_check"}
+  let results ← runSmtQueries #[fwd, bwd, unsatCheck] cfg.binaryParallelism
+  let ⟨⟨fwdResult, fwdMs⟩, ⟨bwdResult, bwdMs⟩, ⟨testUnsat, unsatMs⟩⟩ := (results[0]!, results[1]!, results[2]!)
+  addTiming "binary_fwd" fwdMs
+  addTiming "binary_bwd" bwdMs
+  addTiming "unsat_check" unsatMs
+  if testUnsat then
     logInfo "test assertion is unsatisfiable"
     modify (λ s => {s with testUnsat := true})
   return { groundImpTest := fwdResult, testImpGround := bwdResult}
 
+/--
+  One round of the approximate checker: prove each of `goals` in `ctx`.
+  Rounds of the forward direction on the LHS, whose context is the same for every permutation,
+  reuse the proofs `learned` for earlier permutations.
+-/
+structure ApproxRound where
+  ctx : Esmt
+  goals : List EAssertion
+  learned : Bool := false
+  -- the phase and permutation of the round, see `SmtQuery.tags`
+  tags : List (String × String) := []
+
 /--
   Check `Test ⟹ GroundTruth` in the approximate checker.
-  This function is used for both the LHS (comparing preconditions) and RHS (comparing postconditions)
+  This round is used for both the LHS (comparing preconditions) and RHS (comparing postconditions)
 -/
-def solveBwd (test ground : EAssertion) (ctx : Esmt) (assumptions : List EAssertion) : PropEvalM ImpResult := do
-  let assumptions := assumptions ++ test.splitConjuncts
-  let obligations := ground.splitConjuncts
-  let total := obligations.length
-  let ctx' : Esmt := {ctx with asserts := assumptions.toArray}
-  let mut solved : Nat := 0
-  for goal in obligations do
-    if ← evalSmt' false ctx' (← getEvalConfig).approxSolverTime (.neg goal) then
-      solved := solved + 1
-  return .mk total solved
+def bwdRound (test ground : EAssertion) (ctx : Esmt) (assumptions : List EAssertion) : ApproxRound :=
+  { ctx := {ctx with asserts := (assumptions ++ test.splitConjuncts).toArray}, goals := ground.splitConjuncts }
 
 /--
   Assuming preconditions of `GroundTruth`, prove preconditions of `Test`.
 -/
-def solveFwdLHS (ground test : EAssertion) (ctx : Esmt)   : PropEvalM ImpResult := do
-  let assumptions := ground.splitConjuncts
-  let obligations := test.splitConjuncts
-  let ctx' : Esmt := {ctx with asserts := assumptions.toArray}
-  let mut solved : Nat := 0
-  for goal in obligations do
-    if ← seenGoalLHS goal then
-      if ← isProvenLHS goal then solved := solved + 1 else continue
-    else
-      if ← evalSmt' false ctx' (← getEvalConfig).approxSolverTime (.neg goal) then
-        addProofLHS goal true
-        solved := solved + 1
-      else addProofLHS goal false
-  return .mk obligations.length solved
+def fwdLHSRound (ground test : EAssertion) (ctx : Esmt) : ApproxRound :=
+  { ctx := {ctx with asserts := ground.splitConjuncts.toArray}, goals := test.splitConjuncts, learned := true }
 
 /--
   Assuming postconditions of `GroundTruth`, prove postconditions of `Test`.
+  Its results are not learned: `assumptions` depend on whether the LHS of the permutation was proved,
+  so the same goal may be provable for one permutation and not for another.
 -/
-def solveFwdRHS (ground test : EAssertion) (ctx : Esmt)  (assumptions : List EAssertion) : PropEvalM ImpResult := do
-  let assumptions := assumptions ++ ground.splitConjuncts
-  let obligations := test.splitConjuncts
-  let total := obligations.length
-  let ctx' : Esmt := {ctx with asserts := assumptions.toArray}
-  let mut solved : Nat := 0
-  for goal in obligations do
-    if ← seenGoalRHS goal then
-      if ← isProvenRHS goal then solved := solved + 1 else continue
-    else
-      if ← evalSmt' false ctx' (←getEvalConfig).approxSolverTime (.neg goal) then
-        addProofRHS goal true
-        solved := solved + 1
-      else addProofRHS goal false
-  return .mk total solved
-
-/-- Check (one half of) `GroundTruth <===> Test` using the approximate checker.
-    Note that this function operates on either the preconditions (LHS) or postconditions (RHS)
+def fwdRHSRound (ground test : EAssertion) (ctx : Esmt) (assumptions : List EAssertion) : ApproxRound :=
+  { ctx := {ctx with asserts := (assumptions ++ ground.splitConjuncts).toArray}, goals := test.splitConjuncts }
+
+/-- Where the result of one goal of a round comes from -/
+inductive GoalResult
+| learned (proved : Bool)
+| query (i : Nat)
+
+/--
+  Solve `rounds` together: their SMT queries run concurrently on up to `approxParallelism` solvers.
+  A goal of a round that learns proofs is only queried once, and its result is recorded in `learnedLHS`,
+  so that the results are the same as when solving the rounds in order.
 -/
-def checkIffApprox (ground test : EAssertion) (isLHS : Bool) (assumptions : List EAssertion)  : PropEvalM (ImpResult × ImpResult) := do
-  -- IO.println "checking fwd direction..."
-  let fwd ←
-    if isLHS then
-      solveFwdLHS ground test (← getGroundCtx)
-    else
-      solveFwdRHS ground test (← getGroundCtx) assumptions
-  -- IO.println "checking bwd direction..."
-  let bwd ← solveBwd test ground (← getGroundCtx) assumptions
-  return ⟨fwd, bwd⟩
+def solveRounds (rounds : Array ApproxRound) : PropEvalM (Array ImpResult) := do
+  let cfg ← getEvalConfig
+  let mut queries : Array SmtQuery := #[]
+  -- the query of each goal that is not learned yet
+  let mut pending : HashMap EAssertion Nat := {}
+  let mut plans : Array (Array GoalResult) := #[]
+  let inst := ("instance", ← getInstName)
+  for round in rounds do
+    let mut plan := #[]
+    for ⟨j, goal⟩ in round.goals.enum do
+      let tags := inst :: round.tags ++ [("conjunct", toString j)]
+      let query : SmtQuery := {ctx := some round.ctx, timeout := cfg.approxSolverTime, assertion := .neg goal, tags := tags}
+      if !round.learned then
+        plan := plan.push (.query queries.size)
+        queries := queries.push query
+      else if let some b := (← get).learnedLHS.find? goal then
+        plan := plan.push (.learned b)
+      else if let some i := pending.find? goal then
+        plan := plan.push (.query i)
+      else
+        pending := pending.insert goal queries.size
+        plan := plan.push (.query queries.size)
+        queries := queries.push query
+    plans := plans.push plan
+  let results ← runSmtQueries queries cfg.approxParallelism
+  for ⟨goal, i⟩ in pending.toList do addProofLHS goal results[i]!.1
+  let proved : GoalResult → Bool
+    | .learned b => b
+    | .query i => results[i]!.1
+  -- the solver time of each round is that of the queries whose results it uses
+  let elapsed : GoalResult → Nat
+    | .learned _ => 0
+    | .query i => results[i]!.2
+  for ⟨round, plan⟩ in rounds.zip plans do
+    addTiming ("/".intercalate ("approx" :: round.tags.map Prod.snd)) (plan.foldl (· + elapsed ·) 0)
+  return plans.map (λ plan => .mk plan.size (plan.filter proved).size)
 
+/--
+  Check each permutation with the approximate checker: first the LHS of all of them, then the RHS,
+  each as one batch of concurrent solver queries.
+-/
 def solvePerms
   (groundNames : List String)
   (perms : List (List String)) : PropEvalM ApproxResult := do
   let init_map ← getTestNameMap
-  let mut result : ApproxResult := .mk {}
-  let mut i : Nat := 0
+  let groundCtx ← getGroundCtx
+  let groundLHS ← getGroundLHS
+  let groundRHS ← getGroundRHS
+  let mut tests : Array (HashMap String String × EAssertion × EAssertion) := #[]
   for perm in perms do
-    -- IO.println "Checking perm..."
     let subst : HashMap String String := HashMap.ofList <| perm.zip groundNames
     setTestNames <| ← mergeMaps init_map subst
-    -- IO.println "checking LHS ..."
-    let ⟨fwdLHS, bwdLHS⟩ ← checkIffApprox (← getGroundLHS) (← translateTestLHS) true []
+    tests := tests.push (subst, ← translateTestLHS, ← translateTestRHS)
+  let tag (phase : String) (i : Nat) : ApproxRound → ApproxRound :=
+    λ r => {r with tags := [("phase", phase), ("permutation", toString i)]}
+  let mut lhsRounds := #[]
+  for i in [:tests.size] do
+    let ⟨_, testLHS, _⟩ := tests[i]!
+    lhsRounds := lhsRounds.push (tag "fwdLHS" i <| fwdLHSRound groundLHS testLHS groundCtx)
+      |>.push (tag "bwdLHS" i <| bwdRound testLHS groundLHS groundCtx [])
+  let lhs ← timed "approx_lhs" <| solveRounds lhsRounds
+  let mut rhsRounds := #[]
+  for i in [:tests.size] do
+    let ⟨_, _, testRHS⟩ := tests[i]!
     let mut assumptions : List EAssertion := []
-    if fwdLHS.success && bwdLHS.success then
-      --  IO.println "LHS proved equivalent; preconditions will be included for RHS"
-       assumptions := (← getGroundLHS).splitConjuncts
-    -- IO.println "checking RHS ..."
-    let ⟨fwdRHS, bwdRHS⟩ ← checkIffApprox (←getGroundRHS) (← translateTestRHS) false assumptions
-    result := result.addResult s!"permutation_{i}" subst fwdLHS bwdLHS fwdRHS bwdRHS
-    i := i + 1
+    if lhs[2 * i]!.success && lhs[2 * i + 1]!.success then
+      --  LHS proved equivalent; preconditions will be included for RHS
+      assumptions := groundLHS.splitConjuncts
+    rhsRounds := rhsRounds.push (tag "fwdRHS" i <| fwdRHSRound groundRHS testRHS groundCtx assumptions)
+      |>.push (tag "bwdRHS" i <| bwdRound testRHS groundRHS groundCtx assumptions)
+  let rhs ← timed "approx_rhs" <| solveRounds rhsRounds
+  let mut result : ApproxResult := {mapping := {}}
+  for i in [:tests.size] do
+    let ⟨subst, _, _⟩ := tests[i]!
+    result := result.addResult s!"permutation_{i}" subst lhs[2 * i]! lhs[2 * i + 1]! rhs[2 * i]! rhs[2 * i + 1]!
   return result
 
 /--
@@ -146,9 +255,12 @@ def approxChecker  : PropEvalM ApproxResult := do
     rawGroundLHSExpr := q(True)
   let rawFull : String := Format.pretty (← pretty groundE) (width := 10000)
   let guardedFull : String := Format.pretty (← pretty guardedE) (width := 10000)
-  match ← permutationHeuristic (permInFile (←getInstName)) (permOutFile (←getInstName)) rawFull guardedFull tjson gjson (← getEvalConfig).nPermutations with
-      | .error _ => return .mk {}
-      | .ok ⟨ground, perms⟩ =>
+  let chooser ← getChooser
+  let name ← getInstName
+  let cfg ← getEvalConfig
+  match ← timed "chooser" (monadLift <| permutationHeuristic chooser name rawFull guardedFull tjson gjson cfg) with
+      | .error _ => return {mapping := {}}
+      | .ok ⟨ground, perms, stats⟩ =>
         -- E3.clean_tmp_dir (← getInstName)
         let r ← solvePerms ground perms
-        return r
+        return {r with chooserStats := stats}
@@ -6,8 +6,8 @@ open Lean
 set_option autoImplicit false
 
 def runStdEquiv (cfg : EvalConfig) (ctx : EvalCtx)  (old : E3Result) : MetaM E3Result := do
-  let ⟨eq,ctx'⟩ ← checkFullIff.run ctx
-  let tmp := old.addEquivResult eq
+  let ⟨eq,ctx'⟩ ← (timed "binary" checkFullIff).run {ctx with timings := old.timings}
+  let tmp := {old.addEquivResult eq with timings := ctx'.timings}
   if cfg.writeResult = false then
     IO.println s!"[E3] {eq}"
   if ← getTestUnsat.run' ctx' then
@@ -17,16 +17,16 @@ def runStdEquiv (cfg : EvalConfig) (ctx : EvalCtx)  (old : E3Result) : MetaM E3R
 def runApproxEquiv (r : E3Result) (cfg : EvalConfig) (ctx : EvalCtx) : MetaM Unit := do
     if !r.bvarDelta.isMatch then throwError "[E3] info: skipping approximate equivalence checking due to mismatched bvars" ; return ()
     else
-      let ⟨res,_⟩ ← approxChecker.run ctx
-      let result := r.addApproxResult res
+      let ⟨res,ctx'⟩ ← (timed "approx" approxChecker).run {ctx with timings := r.timings}
+      let result := {r.addApproxResult res with timings := ctx'.timings}
       if cfg.writeResult = false then
         IO.println s!"[E3] {result}"
       else
         writeResult cfg.instanceName cfg.outputFile result
 
 def E3Main (init : EvalCtx) : MetaM Unit := do
-  let ⟨bvars,ctx⟩ ← splitAndCollectBvars.run init
-  let mut result : E3Result :=  {bvarDelta := bvars}
+  let ⟨bvars,ctx⟩ ← (timed "bvars" splitAndCollectBvars).run init
+  let mut result : E3Result :=  {bvarDelta := bvars, timings := ctx.timings}
   let cfg := ctx.config
   match cfg.mode with
   | .justBvars =>
@@ -60,8 +60,20 @@ def parseArgs (args : List String) : IO (Option EvalConfig) := do
     let eqSolverTime := args[3]!.toNat!
     let appSolverTime := args[4]!.toNat!
     let ⟨writeResult, outFile⟩ ←  getWriteResultArgs args
-    return some { instanceName := name, mode := mode, nPermutations := nPermutations, equivSolverTime := eqSolverTime, approxSolverTime := appSolverTime, writeResult := writeResult, outputFile := outFile}
+    let cfg : EvalConfig := { instanceName := name, mode := mode, nPermutations := nPermutations, equivSolverTime := eqSolverTime, approxSolverTime := appSolverTime, writeResult := writeResult, outputFile := outFile}
+    return some <| (args.drop 7).foldl setOption cfg
   where
+    -- optional `key=value` arguments after the output file
+    setOption (cfg : EvalConfig) (arg : String) : EvalConfig :=
+      match arg.splitOn "=" with
+      | ["chooserBudgetMs", v] => {cfg with chooserBudgetMs := v.toNat!}
+      | ["chooserMemo", v] => {cfg with chooserMemo := v == "true"}
+      | ["binaryParallelism", v] => {cfg with binaryParallelism := v.toNat!}
+      | ["approxParallelism", v] => {cfg with approxParallelism := v.toNat!}
+      | ["solverSessionQueries", v] => {cfg with solverSessionQueries := v.toNat!}
+      | ["smtCache", v] => {cfg with smtCacheDir := v}
+      | ["smtCapture", v] => {cfg with smtCaptureDir := v}
+      | _ => cfg
     getWriteResultArgs (args : List String) : IO (Bool × String) := do
     let writeResult := match args[5]! with | "true" => true | _ => false
     if writeResult then
@@ -70,10 +82,33 @@ def parseArgs (args : List String) : IO (Option EvalConfig) := do
     else
       return ⟨false, E3.default_out_dir⟩
 
+/-- The options of the SystemE solvers selected by `cfg` -/
+def EvalConfig.smtOptions (cfg : EvalConfig) : Options := Id.run do
+  let mut opts : Options := {}
+  if cfg.solverSessionQueries != 0 then
+    opts := (opts.setBool `systemE.incremental true).setNat `systemE.sessionQueries cfg.solverSessionQueries
+  if !cfg.smtCacheDir.isEmpty then
+    opts := opts.setString `systemE.cacheDir cfg.smtCacheDir
+  if !cfg.smtCaptureDir.isEmpty then
+    opts := opts.setString `systemE.captureDir cfg.smtCaptureDir
+  return opts
+
+/--
+Run E3 on `ground` and `test` in an already-imported environment,
+optionally reusing a running permutation chooser
+-/
+def runE3 (env : Environment) (ground test : Expr) (cfg : EvalConfig) (chooser : Option ChooserService := none)
+    (timings : Array (String × Nat) := #[]) : IO Unit := do
+  let start ← IO.monoMsNow
+  let ⟨⟨g,t⟩,_⟩ ← Meta.MetaM.toIO (preprocessExpr ground test) E3Ctx {env := env}
+  let timings := timings.push ("preprocess", (← IO.monoMsNow) - start)
+  let y : EvalCtx := {instanceName := cfg.instanceName, groundExpr := g, testExpr := t, config := cfg, chooser := chooser, timings := timings}
+  let _ ← Meta.MetaM.toIO (E3Main y) {E3Ctx with options := cfg.smtOptions} {env := env}
+  return ()
+
 def runE3fromIO (ground test : Expr) : Option EvalConfig →  IO Unit
 | none => return ()
 | some cfg => do
-  let ⟨⟨g,t⟩,_⟩ ← Meta.MetaM.toIO (preprocessExpr ground test) E3Ctx (← E3State)
-  let y : EvalCtx := {instanceName := cfg.instanceName, groundExpr := g, testExpr := t, config := cfg}
-  let _ ← Meta.MetaM.toIO (E3Main y) E3Ctx (← E3State)
-  return ()
+  let start ← IO.monoMsNow
+  let env ← E3Env
+  runE3 env ground test cfg (timings := #[("import", (← IO.monoMsNow) - start)])
@@ -0,0 +1,112 @@
+import E3.Engine.Main
+import E3.Engine.Wf
+
+open Lean Elab Meta
+
+set_option autoImplicit false
+
+/-
+A long-lived E3 process, used by the Python wrapper to avoid re-importing the environment
+for every instance. The server reads one JSON request per line from stdin, e.g.
+
+  {"id" : 0, "kind" : "check", "ground" : "...", "test" : "...", "args" : ["1", "skipApprox", ...]}
+  {"id" : 1, "kind" : "validate", "test" : "..."}
+
+where `args` are the same arguments accepted by `parseArgs`. For each request it writes one line
+`{"id" : _, "output" : _, "error" : _}` to stdout. `output` is the message the validator would
+have printed (or `null`), and `error` is set if the request could not be completed.
+Anything else written to stdout by E3 itself is not valid JSON and is ignored by the client.
+
+The server also keeps a `choosePerms.py --serve` process for the lifetime of the server, so that
+approximate checks don't start a Python interpreter per instance.
+-/
+
+/-- Everything imported by the files generated in `E3/utils.py` -/
+def E3ServerEnv : IO Environment := importModules #[`SystemE, `UniGeo.Relations, `E3] {}
+
+/--
+  Parse and elaborate a proposition, as `q(...)` would when compiling a generated file.
+  Also return the errors and warnings that elaboration logged instead of throwing,
+  which the compiler would print.
+-/
+def elabPropLogged (input : String) : MetaM (Expr × List Message) := do
+  match Parser.runParserCategory (← getEnv) `term input with
+  | .error msg => throwError "error: {msg}"
+  | .ok stx =>
+    let e ← Term.TermElabM.run' <| Term.withoutErrToSorry do
+      let e ← Term.elabTerm stx (some (.sort .zero))
+      Term.synthesizeSyntheticMVarsNoPostponing
+      instantiateMVars e
+    let logged := (← getThe Core.State).messages.toList.filter (·.severity != .information)
+    return (e, logged)
+
+/-- Like `elabPropLogged`, but fail on a logged error, as the compiler would -/
+def elabPropString (input : String) : MetaM Expr := do
+  let (e, logged) ← elabPropLogged input
+  if let some msg := logged.find? (·.severity == .error) then
+    throwError (← msg.toString)
+  return e
+
+def elabPropLoggedIO (env : Environment) (input : String) : IO (Expr × List Message) :=
+  Prod.fst <$> MetaM.toIO (elabPropLogged input) E3Ctx {env := env}
+
+def elabPropIO (env : Environment) (input : String) : IO Expr :=
+  Prod.fst <$> MetaM.toIO (elabPropString input) E3Ctx {env := env}
+
+private def getStrField (req : Json) (field : String) : IO String :=
+  match req.getObjValAs? String field with
+  | .ok s => return s
+  | .error _ => throw <| IO.userError s!"[E3/server] error: missing field `{field}`"
+
+def handleCheck (env : Environment) (chooser : Option ChooserService) (req : Json) : IO (Option String) := do
+  let start ← IO.monoMsNow
+  let ground ← elabPropIO env (← getStrField req "ground")
+  let test ← elabPropIO env (← getStrField req "test")
+  let elaborated ← IO.monoMsNow
+  let args := match req.getObjValAs? (Array String) "args" with | .ok xs => xs.toList | .error _ => []
+  match ← parseArgs args with
+  | none => throw <| IO.userError "[E3/server] error: invalid checker arguments"
+  | some cfg => runE3 env ground test cfg chooser (timings := #[("elaborate", elaborated - start)])
+  return none
+
+def handleValidate (env : Environment) (req : Json) : IO (Option String) := do
+  let input ← getStrField req "test"
+  try
+    let (e, logged) ← elabPropLoggedIO env input
+    -- like the validator's subprocess, report anything the compiler would print
+    if !logged.isEmpty then
+      return some ("\n".intercalate (← logged.mapM (·.toString)))
+    let r ← WfCheckWithEnv env e
+    return if r == "true" then none else some r
+  catch e =>
+    return some s!"{e}"
+
+def handleRequest (env : Environment) (chooser : Option ChooserService) (line : String) : IO Json := do
+  match Json.parse line with
+  | .error msg => return Json.mkObj [("id", .null), ("output", .null), ("error", Json.str s!"[E3/server] error: {msg}")]
+  | .ok req =>
+    let id := (req.getObjVal? "id").toOption.getD .null
+    try
+      let output ← match req.getObjValAs? String "kind" with
+        | .ok "check" => handleCheck env chooser req
+        | .ok "validate" => handleValidate env req
+        | _ => throw <| IO.userError "[E3/server] error: unknown request kind"
+      return Json.mkObj [("id", id), ("output", toJson output), ("error", .null)]
+    catch e =>
+      return Json.mkObj [("id", id), ("output", .null), ("error", Json.str s!"{e}")]
+
+partial def serverLoop (env : Environment) (chooser : Option ChooserService) (stdin stdout : IO.FS.Stream) : IO Unit := do
+  let line ← stdin.getLine
+  -- end of input
+  if line.isEmpty then return
+  if !line.trim.isEmpty then
+    let response ← handleRequest env chooser line.trim
+    stdout.putStrLn response.compress
+    stdout.flush
+  serverLoop env chooser stdin stdout
+
+def runE3Server : IO Unit := do
+  let env ← E3ServerEnv
+  -- without a chooser service, each check falls back to running `choosePerms.py` on files
+  let chooser ← try some <$> ChooserService.spawn catch _ => pure none
+  serverLoop env chooser (← IO.getStdin) (← IO.getStdout)
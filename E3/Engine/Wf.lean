@@ -27,7 +27,11 @@ def WfCheckerAux (e : Expr) : MetaM String := do
     else
       return "true"
 
+/-- Check well-formedness of `e` in an already-imported environment -/
+def WfCheckWithEnv (env : Environment) (e : Expr) : IO String := do
+  let e ← Prod.fst <$> MetaM.toIO (unfoldGeoAbbrevs e) E3Ctx {env := env}
+  Prod.fst <$> MetaM.toIO (WfCheckerAux e) E3Ctx {env := env}
+
 def WfChecker (e : Expr) : IO Unit := do
-  let e ← Prod.fst <$> MetaM.toIO (unfoldGeoAbbrevs e) E3Ctx (← E3State)
-  let r ← Prod.fst <$> MetaM.toIO (WfCheckerAux e) E3Ctx (← E3State)
+  let r ← WfCheckWithEnv (← E3Env) e
   if r != "true" then IO.println r
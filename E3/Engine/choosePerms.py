@@ -1,10 +1,24 @@
 import Levenshtein
 import heapq
+import hashlib
 import json
 import argparse
-from itertools import permutations, product
+import contextlib
+import io
+import os
+import random
+import sqlite3
+import sys
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice, permutations, repeat
+from operator import itemgetter
+from math import factorial, gcd, prod
 from dataclasses import dataclass, field
 from collections import Counter
+from rapidfuzz import process
+from rapidfuzz.distance import Indel, LCSseq
 
 
 def is_permutation(list1, list2):
@@ -14,6 +28,36 @@ def is_permutation(list1, list2):
 SHORTCIRCUIT_THRESHOLD = 4000000
 SHORTCIRCUIT_SAMPLE_THRESHOLD = 0.88
 SHORTCIRCUIT_SAMPLE_CUTOFF = 50
+# seed for the order in which candidates are sampled when short-circuiting
+SHORTCIRCUIT_SEED = 0
+
+# number of candidates rendered and scored together
+SCORE_BATCH_SIZE = 4096
+# permutation sources at most this long are held in memory while enumerating candidates
+MATERIALIZE_LIMIT = 5040
+
+# with several workers, instances with fewer candidates than this are still scored serially
+SHARD_THRESHOLD = 100000
+# shards per worker, so that uneven shards still balance across the pool
+SHARDS_PER_WORKER = 8
+# with a time budget, candidates are scored one stratum at a time, in a random order of strata
+STRATA = 4096
+# branch-and-bound bounds and scores are rounded differently, so a bound may fall short of the
+# score it bounds by a few ulps; partial candidates are only pruned below the floor by this much
+BOUND_SLACK = 1e-9
+
+STRATEGIES = ["exhaustive", "beam", "bnb", "murty"]
+BEAM_WIDTH = 64
+# number of assignments re-ranked by the `murty` strategy
+POOL_SIZE = 50
+# with --cascade-depth but no value, the number of candidates rescored by string similarity
+CASCADE_DEPTH = 5000
+
+# with --memo but no value, outputs are memoized in this database
+MEMO_PATH = os.path.join(os.path.dirname(__file__), "..", "_tmp", "chooser_memo.sqlite")
+MEMO_MAX_BYTES = 64 * 1024 * 1024
+# bump to invalidate memoized outputs when the choice of unifications changes
+MEMO_VERSION = 1
 
 
 class QuantifierData:
@@ -60,10 +104,54 @@ def has_match(x: PropData, y: PropData):
     )
 
 
+class PermutationSource:
+    """
+    The permutations of ``items``, generated lazily in lexicographic order (by position in
+    ``items``), with ranking and unranking so that any permutation can be addressed by index.
+    """
+
+    def __init__(self, items, prefix=()):
+        self.items = tuple(items)
+        # prepended to every permutation, for the candidates of a shard (see `CandidateSpace`)
+        self.prefix = tuple(prefix)
+
+    def __len__(self):
+        return factorial(len(self.items))
+
+    def __iter__(self):
+        if self.prefix:
+            return (self.prefix + perm for perm in permutations(self.items))
+        return permutations(self.items)
+
+    def unrank(self, index):
+        """
+        Return the permutation at ``index`` in the order of iteration.
+        """
+        pool = list(self.items)
+        perm = []
+        for i in reversed(range(len(pool))):
+            digit, index = divmod(index, factorial(i))
+            perm.append(pool.pop(digit))
+        return self.prefix + tuple(perm)
+
+    def rank(self, perm):
+        """
+        Return the index of ``perm`` in the order of iteration.
+        """
+        pool = list(self.items)
+        perm = perm[len(self.prefix) :]
+        index = 0
+        for i, item in enumerate(perm):
+            digit = pool.index(item)
+            index += digit * factorial(len(perm) - 1 - i)
+            pool.pop(digit)
+        return index
+
+
 class PermutationStruct:
-    pointPerms: list[list[str]]
-    linePerms: list[list[str]]
-    circlePerms: list[list[str]]
+    pointPerms: PermutationSource
+    linePerms: PermutationSource
+    circlePerms: PermutationSource
 
     def __init__(self, points, lines, circles):
         self.pointPerms = points
@@ -71,30 +159,275 @@ class PermutationStruct:
         self.circlePerms = circles
 
     def noPoints(self):
-        return self.pointPerms == [()]
+        return not self.pointPerms.items
 
     def noLines(self):
-        return self.linePerms == [()]
+        return not self.linePerms.items
 
     def noCircles(self):
-        return self.circlePerms == [()]
+        return not self.circlePerms.items
 
 
 def getPermutations(data: QuantifierData):
     return PermutationStruct(
-        list(permutations(data.points)),
-        list(permutations(data.lines)),
-        list(permutations(data.circles)),
+        PermutationSource(data.points),
+        PermutationSource(data.lines),
+        PermutationSource(data.circles),
     )
 
 
+class CandidateSpace:
+    """
+    The product of the permutations of each sort, i.e. every candidate unification, as the
+    concatenated values of one permutation per sort. Candidates are generated lazily, and
+    indexed in mixed radix with the last sort varying fastest, which matches the order of
+    iteration.
+    """
+
+    def __init__(self, univ: PermutationStruct, exist: PermutationStruct):
+        self.sources = [
+            univ.pointPerms,
+            univ.linePerms,
+            univ.circlePerms,
+            exist.pointPerms,
+            exist.linePerms,
+            exist.circlePerms,
+        ]
+
+    def __len__(self):
+        size = 1
+        for source in self.sources:
+            size *= len(source)
+        return size
+
+    def __iter__(self):
+        return nestedProduct(self.sources)
+
+    def bounds(self):
+        """
+        Return the (start, end) positions of the values of each sort in a candidate.
+        """
+        bounds = []
+        start = 0
+        for source in self.sources:
+            bounds.append((start, start + len(source.items)))
+            start += len(source.items)
+        return bounds
+
+    def shards(self, count):
+        """
+        Partition the candidates into at least ``count`` shards (if there are that many
+        candidates), in order. A shard is a prefix of the values of its candidates, which are
+        therefore contiguous in the order of iteration.
+        """
+        bounds = self.bounds()
+        width = bounds[-1][1]
+        shards = [()]
+        while len(shards) < count and len(shards[0]) < width:
+            depth = len(shards[0])
+            start, end = next((s, e) for s, e in bounds if s <= depth < e)
+            items = self.sources[bounds.index((start, end))].items
+            shards = [
+                prefix + (item,)
+                for prefix in shards
+                for item in items
+                if item not in prefix[start:]
+            ]
+        return shards
+
+    def shardSources(self, prefix):
+        """
+        Return the sources of the candidates whose values start with ``prefix``.
+        """
+        sources = []
+        for source, (start, end) in zip(self.sources, self.bounds()):
+            if end <= len(prefix):
+                sources.append([prefix[start:end]])
+            elif start < len(prefix):
+                fixed = prefix[start:]
+                rest = [item for item in source.items if item not in fixed]
+                sources.append(PermutationSource(rest, fixed))
+            else:
+                sources.append(source)
+        return sources
+
+    def iterShard(self, prefix):
+        """
+        Generate the candidates whose values start with ``prefix``, in the order of iteration.
+        """
+        return nestedProduct(self.shardSources(prefix))
+
+    def indexed(self, prefix=(), symmetry=None):
+        """
+        Generate the index and values of the candidates whose values start with ``prefix``, in
+        the order of iteration. With a ``symmetry``, only the canonical candidates are generated
+        (see :func:`canonicalProduct`).
+        """
+        start = self.rank(next(self.iterShard(prefix)))
+        sources = self.shardSources(prefix)
+        if symmetry is None:
+            return enumerate(nestedProduct(sources), start)
+        return canonicalProduct(sources, symmetry, start)
+
+    def unrank(self, index):
+        values = ()
+        for source in reversed(self.sources):
+            index, digit = divmod(index, len(source))
+            values = source.unrank(digit) + values
+        return values
+
+    def rank(self, values):
+        index = 0
+        start = 0
+        for source in self.sources:
+            end = start + len(source.items)
+            index = index * len(source) + source.rank(values[start:end])
+            start = end
+        return index
+
+    def sample(self, rng):
+        """
+        Generate the index of every candidate exactly once, in a pseudo-random order drawn
+        from ``rng``.
+
+        The indices are visited as ``(a * k + b) % n`` for ``k = 0, 1, ...``, which is a full
+        cycle whenever ``a`` is coprime to ``n``, so the order takes constant memory.
+        """
+        n = len(self)
+        a = 1
+        if n > 2:
+            a = rng.randrange(1, n)
+            while gcd(a, n) != 1:
+                a = rng.randrange(1, n)
+        b = rng.randrange(n)
+        for k in range(n):
+            yield (a * k + b) % n
+
+
+def nestedProduct(sources):
+    """
+    Generate the concatenations of one item of each of the six ``sources``, the last varying
+    fastest.
+
+    This uses nested loops rather than `product`, which would materialize every source. Small
+    sources are still materialized, since the inner loops restart them repeatedly.
+    """
+    s0, s1, s2, s3, s4, s5 = (
+        list(source) if len(source) <= MATERIALIZE_LIMIT else source
+        for source in sources
+    )
+    for a in s0:
+        for b in s1:
+            ab = a + b
+            for c in s2:
+                abc = ab + c
+                for d in s3:
+                    abcd = abc + d
+                    for e in s4:
+                        abcde = abcd + e
+                        for f in s5:
+                            yield abcde + f
+
+
+def canonicalProduct(sources, symmetry, start=0):
+    """
+    Generate ``(start + i, values)`` for the ``i``-th concatenation of one item of each of the
+    six ``sources`` (in the order of :func:`nestedProduct`), if it is canonical under
+    ``symmetry``.
+
+    Candidates are extended one source at a time, and compared with their images under each
+    relabelling that maps the values so far to themselves (see :meth:`Symmetry.tied`). A prefix
+    that a relabelling maps to an earlier one is pruned with all its completions, and a
+    relabelling that maps it to a later one is not checked again for its completions. Once no
+    relabelling is left, the remaining sources are enumerated without checks.
+    """
+    sources = [
+        list(source) if len(source) <= MATERIALIZE_LIMIT else source
+        for source in sources
+    ]
+    sizes = [len(source) for source in sources]
+
+    def extend(level, index, prefix, images):
+        if not images:
+            count = prod(sizes[level:])
+            # pad with empty sources, which `nestedProduct` expects six of
+            rest = nestedProduct(sources[level:] + [[()]] * level)
+            for i, suffix in enumerate(rest):
+                yield start + index * count + i, prefix + suffix
+            return
+        if level == len(sources):
+            yield start + index, prefix
+            return
+        for i, part in enumerate(sources[level]):
+            tied = symmetry.tied(part, images)
+            if tied is not None:
+                yield from extend(
+                    level + 1, index * sizes[level] + i, prefix + part, tied
+                )
+
+    return extend(0, 0, (), symmetry.images)
+
+
 @dataclass(order=True)
 class NameMap:
     name: list[str] = field(compare=False)
     sim: float
+    # the negated index of the candidate, so that ties go to the first one enumerated
+    tiebreak: int = 0
 
     def __eq__(self, other) -> bool:
-        self.name == other.name
+        return isinstance(other, NameMap) and tuple(self.name) == tuple(other.name)
+
+
+class TopN:
+    """
+    The best ``N`` distinct candidates seen so far: a min-heap of :class:`NameMap` ordered by
+    ``(sim, tiebreak)``, and the set of their names, so that each candidate is kept at most
+    once and insertion takes O(log N).
+    """
+
+    def __init__(self, N, key=tuple):
+        """
+        :param key: maps the name of a candidate to the key by which duplicates are detected
+        """
+        self.N = N
+        self.key = key
+        self.heap: list[NameMap] = []
+        self.names: set[tuple[str, ...]] = set()
+
+    def __len__(self):
+        return len(self.heap)
+
+    def __iter__(self):
+        return iter(self.heap)
+
+    def full(self):
+        return len(self.heap) >= self.N
+
+    def floor(self, default=0.0):
+        """
+        Return the score a candidate needs to be considered, or ``default`` until there are
+        ``N`` candidates.
+        """
+        return self.heap[0].sim if self.full() else default
+
+    def push(self, candidate: NameMap) -> bool:
+        """
+        Add ``candidate`` if it is among the best ``N``.
+
+        :returns: whether ``candidate`` was added
+        """
+        name = self.key(candidate.name)
+        if name in self.names or self.N <= 0:
+            return False
+        if not self.full():
+            heapq.heappush(self.heap, candidate)
+        elif self.heap[0] < candidate:
+            self.names.discard(self.key(heapq.heapreplace(self.heap, candidate).name))
+        else:
+            return False
+        self.names.add(name)
+        return True
 
 
 def readNames(data):
@@ -105,8 +438,10 @@ def readNames(data):
 
 def readData(inFile):
     permFile = open(inFile, "r")
-    props = json.load(permFile)
+    return parseData(json.load(permFile))
+
 
+def parseData(props):
     reference = props["ground"]
     target = props["guarded_test"]
 
@@ -133,15 +468,874 @@ def checkPerm(names, target, reference, guarded):
     return r
 
 
-def checkAndInsert(heap, name, N):
-    if name in heap:
-        return ()
-    if len(heap) < N:
-        heapq.heappush(heap, name)
+class PermScorer:
+    """
+    Scores candidate unifications of the guarded test names with the ground names.
+
+    ``target`` is tokenized once into a format string with one positional field per occurrence
+    of a guarded name, so a candidate is rendered with a single ``str.format`` instead of a chain
+    of ``str.replace`` calls. Candidates are therefore represented by their *values*: the ground
+    names substituted for ``guarded[0], guarded[1], ...``, one permutation per sort. Batches of
+    rendered candidates are scored by rapidfuzz, whose Indel similarity is the metric computed
+    by ``Levenshtein.ratio``.
+    """
+
+    def __init__(self, target, reference, guarded, names, sizes):
+        self.target = target
+        self.reference = reference
+        self.guarded = guarded
+        self.names = names
+        # the (start, end) of each sort in `guarded` and `names`
+        self.segments = []
+        start = 0
+        for size in sizes:
+            self.segments.append((start, start + size))
+            start += size
+
+        fields = {g: str(i) for i, g in enumerate(guarded)}
+        # escape literal braces, then match the longest names first so that e.g.
+        # `grd_AB` is never read as `grd_A` followed by `B`
+        template = target.replace("{", "{{").replace("}", "}}")
+        if fields:
+            pattern = re.compile(
+                "|".join(map(re.escape, sorted(fields, key=len, reverse=True)))
+            )
+            template = pattern.sub(lambda m: "{" + fields[m.group(0)] + "}", template)
+        self.template = template
+
+        # for bounding partial candidates: the number of occurrences of each field, and the
+        # longest name that could be substituted into it
+        occurrences = Counter(int(i) for i in re.findall(r"(?<!\{)\{(\d+)\}", template))
+        longest = [0] * len(guarded)
+        for start, end in self.segments:
+            for i in range(start, end):
+                longest[i] = max(map(len, names[start:end]))
+        # remaining[d] is the most characters that fields d, d + 1, ... can add
+        self.remaining = [0] * (len(guarded) + 1)
+        for i in reversed(range(len(guarded))):
+            self.remaining[i] = self.remaining[i + 1] + occurrences[i] * longest[i]
+        self.blanks = [""] * len(guarded)
+
+    def render(self, values):
+        return self.template.format(*values)
+
+    def score(self, values):
+        return Indel.normalized_similarity(self.render(values), self.reference)
+
+    def scoreBatch(self, batch, score_cutoff=0.0):
+        """
+        Return ``(i, sim)`` for each ``batch[i]`` whose similarity is at least ``score_cutoff``,
+        in the order of ``batch``.
+        """
+        rendered = [self.template.format(*values) for values in batch]
+        matches = process.extract(
+            self.reference,
+            rendered,
+            scorer=Indel.normalized_similarity,
+            limit=None,
+            score_cutoff=score_cutoff,
+        )
+        return sorted((i, sim) for _, sim, i in matches)
+
+    def upperBound(self, values):
+        """
+        Return an upper bound on the score of every candidate whose values start with ``values``.
+
+        Leaving the remaining fields empty gives a subsequence ``s`` of any completion, which can
+        add at most ``u`` characters, so ``LCS <= LCS(s, reference) + u``. The Indel similarity
+        ``2 * LCS / (len + len(reference))`` is then largest when the completion adds all ``u``.
+        """
+        depth = len(values)
+        partial = self.template.format(*values, *self.blanks[depth:])
+        lcs = LCSseq.similarity(partial, self.reference)
+        u = self.remaining[depth]
+        total = len(partial) + u + len(self.reference)
+        return min(1.0, 2 * (lcs + u) / total) if total else 1.0
+
+    def toPerm(self, values):
+        """
+        Convert the values of a candidate to the guarded name unified with each of ``names``.
+        """
+        perm = []
+        for start, end in self.segments:
+            inverse = dict(zip(values[start:end], self.guarded[start:end]))
+            perm += [inverse[n] for n in self.names[start:end]]
+        return perm
+
+
+def scoreRange(scorer, indexed, candidates: TopN, deadline=None):
+    """
+    Score the candidates generated by ``indexed`` with their indices (see
+    :meth:`CandidateSpace.indexed`), and add the best to ``candidates``.
+    Stop early once ``time.monotonic()`` passes ``deadline``.
+
+    :returns: the number of candidates scored, and whether ``indexed`` was exhausted
+    """
+    explored = 0
+    while chunk := list(islice(indexed, SCORE_BATCH_SIZE)):
+        indices, batch = zip(*chunk)
+        for i, sim in scorer.scoreBatch(batch, candidates.floor()):
+            candidates.push(NameMap(batch[i], sim, -indices[i]))
+        explored += len(batch)
+        if deadline is not None and time.monotonic() >= deadline:
+            return explored, next(indexed, None) is None
+    return explored, True
+
+
+def scoreShard(scorer, space, prefix, N, symmetry=None, deadline=None):
+    """
+    Score the candidates of one shard of ``space`` (see :meth:`CandidateSpace.shards`), or
+    only the canonical ones with a ``symmetry``.
+
+    :returns: the best ``N`` candidates of the shard, the number of candidates scored, and
+        whether the whole shard was scored
+    """
+    candidates = TopN(N)
+    if deadline is not None and time.monotonic() >= deadline:
+        return candidates.heap, 0, False
+    explored, complete = scoreRange(
+        scorer, space.indexed(prefix, symmetry), candidates, deadline
+    )
+    return candidates.heap, explored, complete
+
+
+def scoreSpace(scorer, space, candidates: TopN, seed, workers, symmetry, deadline):
+    """
+    Score every candidate of ``space``, or as many as possible before the ``deadline``, with
+    ``scorer`` (see :func:`exhaustiveSearch`).
+
+    :returns: the number of candidates scored, and whether every candidate was considered
+    """
+    parallel = workers > 1 and len(space) >= SHARD_THRESHOLD
+    if deadline is None and not parallel:
+        return scoreRange(scorer, space.indexed(symmetry=symmetry), candidates)
+
+    if deadline is None:
+        shards = space.shards(workers * SHARDS_PER_WORKER)
     else:
-        k = heapq.nsmallest(1, heap)
-        if k[0] < name:
-            heapq.heapreplace(heap, name)
+        shards = space.shards(STRATA)
+        random.Random(seed).shuffle(shards)
+
+    explored = 0
+    complete = True
+    if not parallel:
+        for prefix in shards:
+            best, count, done = scoreShard(
+                scorer, space, prefix, candidates.N, symmetry, deadline
+            )
+            explored += count
+            complete = complete and done
+            for x in best:
+                candidates.push(x)
+        return explored, complete
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        results = executor.map(
+            scoreShard,
+            repeat(scorer),
+            repeat(space),
+            shards,
+            repeat(candidates.N),
+            repeat(symmetry),
+            repeat(deadline),
+        )
+        for best, count, done in results:
+            explored += count
+            complete = complete and done
+            for x in best:
+                candidates.push(x)
+    return explored, complete
+
+
+def exhaustiveSearch(
+    scorer,
+    univ,
+    exist,
+    candidates: TopN,
+    seed=SHORTCIRCUIT_SEED,
+    workers=1,
+    symmetry=None,
+    deadline=None,
+    cascade_depth=None,
+):
+    """
+    Score every candidate, unless there are too many (see ``SHORTCIRCUIT_THRESHOLD``), in which
+    case candidates are sampled in a random order until enough good ones have been seen.
+
+    With a ``deadline`` (in ``time.monotonic()`` seconds), short-circuiting is replaced by an
+    anytime search: the candidates are split into ``STRATA`` contiguous strata, which are scored
+    in a random order until the deadline passes, and the best candidates found so far are
+    returned.
+
+    With several ``workers``, the candidates are split into shards that are scored by a process
+    pool, and the best ``N`` of each shard are merged. Since ties are broken by the index of the
+    candidate, the result is the same as scoring every candidate in order. Short-circuiting is
+    inherently sequential, so it always runs in this process.
+
+    With a ``symmetry`` of the ground proposition, only the canonical candidates are scored
+    (see :class:`Symmetry`).
+
+    With a ``cascade_depth``, every candidate is first ranked by the cheap
+    :class:`OverlapScorer`, and only the best ``cascade_depth`` are scored by string similarity.
+    Short-circuited searches score every sample by string similarity.
+
+    :returns: the number of candidates scored, and whether every candidate was considered
+    """
+    seen_sc = 0
+    explored = 0
+    space = CandidateSpace(univ, exist)
+    short_circuiting = deadline is None and len(space) > SHORTCIRCUIT_THRESHOLD
+
+    if not short_circuiting:
+        options = (seed, workers, symmetry, deadline)
+        if not cascade_depth:
+            return scoreSpace(scorer, space, candidates, *options)
+        survivors = TopN(cascade_depth)
+        explored, complete = scoreSpace(
+            OverlapScorer(scorer), space, survivors, *options
+        )
+        rescore(scorer, survivors, candidates)
+        return explored, complete
+
+    indices = space.sample(random.Random(seed))
+    while batch := list(islice(indices, SCORE_BATCH_SIZE)):
+        values = [space.unrank(i) for i in batch]
+        if symmetry is not None:
+            kept = [i for i, v in enumerate(values) if symmetry.isCanonical(v)]
+            batch = [batch[i] for i in kept]
+            values = [values[i] for i in kept]
+        explored += len(batch)
+        # candidates above the sampling threshold count towards the cutoff
+        cutoff = min(candidates.floor(), SHORTCIRCUIT_SAMPLE_THRESHOLD)
+        for i, sim in scorer.scoreBatch(values, cutoff):
+            candidates.push(NameMap(values[i], sim, -batch[i]))
+            if sim > SHORTCIRCUIT_SAMPLE_THRESHOLD:
+                seen_sc += 1
+            if seen_sc >= SHORTCIRCUIT_SAMPLE_CUTOFF:
+                return explored, False
+    return explored, True
+
+
+def extensions(scorer, values):
+    """
+    Return the names that can be assigned to the next field after ``values``: those of the
+    same sort which have not been assigned yet.
+    """
+    depth = len(values)
+    for start, end in scorer.segments:
+        if start <= depth < end:
+            used = values[start:]
+            return [n for n in scorer.names[start:end] if n not in used]
+    return []
+
+
+def branchAndBound(scorer, space, candidates: TopN, deadline=None):
+    """
+    Assign names one field at a time (sort by sort), and discard a partial assignment as soon
+    as :meth:`PermScorer.upperBound` shows that it cannot enter the top ``N``.
+    Since the bound is admissible (up to ``BOUND_SLACK`` for rounding), and ties are broken by
+    the rank of candidates in ``space`` as in exhaustive search, this finds the same top ``N``
+    as exhaustive search, unless it is stopped at the ``deadline``.
+
+    :returns: the number of complete candidates scored, and whether the search finished
+    """
+    n_fields = len(scorer.guarded)
+    explored = 0
+    complete = True
+
+    def search(values):
+        nonlocal explored, complete
+        if deadline is not None and time.monotonic() >= deadline:
+            complete = False
+            return
+        if len(values) == n_fields:
+            explored += 1
+            values = tuple(values)
+            candidates.push(NameMap(values, scorer.score(values), -space.rank(values)))
+            return
+        # a candidate scoring the floor may still enter the top `N` by its tiebreak
+        children = []
+        for name in extensions(scorer, values):
+            child = values + [name]
+            bound = scorer.upperBound(child) + BOUND_SLACK
+            if bound >= candidates.floor(-1.0):
+                children.append((bound, child))
+        # most promising first, so that the floor rises quickly
+        children.sort(key=lambda x: x[0], reverse=True)
+        for bound, child in children:
+            if bound >= candidates.floor(-1.0):
+                search(child)
+
+    search([])
+    return explored, complete
+
+
+def beamSearch(scorer, space, candidates: TopN, beam_width):
+    """
+    Assign names one field at a time (sort by sort), keeping only the ``beam_width`` partial
+    assignments with the highest :meth:`PermScorer.upperBound` at each step.
+    This is not guaranteed to find the best candidates.
+
+    :returns: the number of complete candidates scored
+    """
+    beam = [[]]
+    for _ in range(len(scorer.guarded)):
+        children = [
+            values + [name] for values in beam for name in extensions(scorer, values)
+        ]
+        bounds = [scorer.upperBound(child) for child in children]
+        ranked = sorted(zip(bounds, range(len(children))), reverse=True)
+        beam = [children[i] for _, i in ranked[:beam_width]]
+
+    for values in beam:
+        values = tuple(values)
+        candidates.push(NameMap(values, scorer.score(values), -space.rank(values)))
+    return len(beam) if scorer.guarded else 0
+
+
+# identifiers, e.g. `grd_AB` or `a₁`, and single symbols, e.g. `∠` or `─`
+TOKEN_PATTERN = re.compile(r"[^\W\d][\w']*|\S")
+
+
+def occurrenceFeatures(text, variables):
+    """
+    Describe the context of each occurrence of each of ``variables`` in ``text``: the
+    predicate (or other non-variable token) it is an argument of with its argument position,
+    and the tokens on either side, with variables abstracted.
+
+    :returns: a :class:`Counter` of features for each variable
+    """
+    tokens = TOKEN_PATTERN.findall(text)
+    abstract = ["·" if t in variables else t for t in tokens]
+    features = {v: Counter() for v in variables}
+    head = None
+    position = 0
+    for i, token in enumerate(tokens):
+        if token not in variables:
+            head = token
+            position = 0
+            continue
+        before = abstract[i - 1] if i > 0 else None
+        after = abstract[i + 1] if i + 1 < len(tokens) else None
+        features[token].update(
+            [("app", head, position), ("before", before), ("after", after)]
+        )
+        position += 1
+    return features
+
+
+def affinityMatrices(scorer):
+    """
+    Return, for each sort, the matrix whose entry ``[t][g]`` counts the occurrence features
+    that guarded test name ``t`` and ground name ``g`` have in common. Names that play the same
+    role in both propositions have a high affinity.
+    """
+    testFeatures = occurrenceFeatures(scorer.target, set(scorer.guarded))
+    groundFeatures = occurrenceFeatures(scorer.reference, set(scorer.names))
+    matrices = []
+    for start, end in scorer.segments:
+        matrices.append(
+            [
+                [
+                    sum((testFeatures[t] & groundFeatures[g]).values())
+                    for g in scorer.names[start:end]
+                ]
+                for t in scorer.guarded[start:end]
+            ]
+        )
+    return matrices
+
+
+def hungarian(cost):
+    """
+    Solve the assignment problem for a square ``cost`` matrix.
+
+    :returns: the total cost and the column assigned to each row
+    """
+    n = len(cost)
+    INF = float("inf")
+    # potentials and matching, 1-indexed with column 0 as a sentinel
+    u = [0] * (n + 1)
+    v = [0] * (n + 1)
+    match = [0] * (n + 1)
+    way = [0] * (n + 1)
+    for i in range(1, n + 1):
+        match[0] = i
+        j0 = 0
+        minv = [INF] * (n + 1)
+        used = [False] * (n + 1)
+        while True:
+            used[j0] = True
+            i0 = match[j0]
+            delta = INF
+            j1 = 0
+            for j in range(1, n + 1):
+                if not used[j]:
+                    cur = cost[i0 - 1][j - 1] - u[i0] - v[j]
+                    if cur < minv[j]:
+                        minv[j] = cur
+                        way[j] = j0
+                    if minv[j] < delta:
+                        delta = minv[j]
+                        j1 = j
+            for j in range(n + 1):
+                if used[j]:
+                    u[match[j]] += delta
+                    v[j] -= delta
+                else:
+                    minv[j] -= delta
+            j0 = j1
+            if match[j0] == 0:
+                break
+        while j0:
+            j1 = way[j0]
+            match[j0] = match[j1]
+            j0 = j1
+    assignment = [0] * n
+    for j in range(1, n + 1):
+        assignment[match[j] - 1] = j - 1
+    return sum(cost[i][assignment[i]] for i in range(n)), tuple(assignment)
+
+
+def kBestAssignments(cost, k):
+    """
+    Enumerate the ``k`` cheapest assignments for a square ``cost`` matrix in order of cost,
+    with Murty's algorithm: after each solution, the remaining solutions are partitioned into
+    subproblems that force some of its pairs and forbid another, each solved with
+    :func:`hungarian`.
+
+    :returns: a list of ``(cost, assignment)``
+    """
+    n = len(cost)
+    if n == 0:
+        return [(0, ())]
+    # forbidden pairs cost more than any complete assignment of allowed pairs
+    forbidden_cost = (max(max(row) for row in cost) + 1) * n + 1
+
+    def solve(forced, forbidden):
+        constrained = [row[:] for row in cost]
+        for r, c in forbidden:
+            constrained[r][c] = forbidden_cost
+        for r, c in forced:
+            for j in range(n):
+                if j != c:
+                    constrained[r][j] = forbidden_cost
+            for i in range(n):
+                if i != r:
+                    constrained[i][c] = forbidden_cost
+        total, assignment = hungarian(constrained)
+        if total >= forbidden_cost:
+            return None
+        return total, assignment
+
+    total, assignment = solve((), ())
+    counter = 0
+    frontier = [(total, counter, assignment, (), ())]
+    solutions = []
+    while frontier and len(solutions) < k:
+        total, _, assignment, forced, forbidden = heapq.heappop(frontier)
+        solutions.append((total, assignment))
+        forcedRows = {r for r, _ in forced}
+        free = [r for r in range(n) if r not in forcedRows]
+        # the last free row is determined by the others
+        for idx, r in enumerate(free[:-1]):
+            subForced = forced + tuple((f, assignment[f]) for f in free[:idx])
+            subForbidden = forbidden + ((r, assignment[r]),)
+            solution = solve(subForced, subForbidden)
+            if solution is not None:
+                counter += 1
+                heapq.heappush(
+                    frontier,
+                    (solution[0], counter, solution[1], subForced, subForbidden),
+                )
+    return solutions
+
+
+def kBestSums(lists, k):
+    """
+    Given lists of ``(cost, item)`` sorted by cost, return the ``k`` cheapest combinations of
+    one item from each list, as ``(total cost, indices)``.
+    """
+    if any(not xs for xs in lists):
+        return []
+    start = (0,) * len(lists)
+    frontier = [(sum(xs[0][0] for xs in lists), start)]
+    seen = {start}
+    combinations = []
+    while frontier and len(combinations) < k:
+        total, indices = heapq.heappop(frontier)
+        combinations.append((total, indices))
+        for s, xs in enumerate(lists):
+            if indices[s] + 1 < len(xs):
+                nxt = indices[:s] + (indices[s] + 1,) + indices[s + 1 :]
+                if nxt not in seen:
+                    seen.add(nxt)
+                    cost = total - xs[indices[s]][0] + xs[indices[s] + 1][0]
+                    heapq.heappush(frontier, (cost, nxt))
+    return combinations
+
+
+def murtySearch(scorer, candidates: TopN, pool_size):
+    """
+    Take the ``pool_size`` unifications with the highest total affinity (see
+    :func:`affinityMatrices`), found per sort with Murty's k-best assignment algorithm, and
+    re-rank them by string similarity. This takes polynomial time in the number of names, but
+    is not guaranteed to find the candidates with the highest similarity.
+
+    :returns: the number of complete candidates scored
+    """
+    perSort = []
+    for (start, end), affinity in zip(scorer.segments, affinityMatrices(scorer)):
+        # maximize affinity by minimizing its complement
+        top = max((max(row) for row in affinity), default=0)
+        cost = [[top - a for a in row] for row in affinity]
+        names = scorer.names[start:end]
+        perSort.append(
+            [
+                (total, tuple(names[g] for g in assignment))
+                for total, assignment in kBestAssignments(cost, pool_size)
+            ]
+        )
+
+    pool = kBestSums(perSort, pool_size)
+    for rank, (_, indices) in enumerate(pool):
+        values = ()
+        for s, i in enumerate(indices):
+            values += perSort[s][i][1]
+        candidates.push(NameMap(values, scorer.score(values), -rank))
+    return len(pool)
+
+
+# connectives at which a proposition is split into clauses, see `clauseStructure`
+IMPLICATIONS = {"→", ","}
+DISJUNCTIONS = {"∨", "↔"}
+BINDERS = {"∀", "∃"}
+SYMMETRIC_RELATIONS = {"=", "≠"}
+# most complete relabellings tried by `Symmetry.fromProposition`
+MAX_AUTOMORPHISM_CHECKS = 100000
+# most relabellings kept by `Symmetry.fromProposition` when closing them under composition
+MAX_AUTOMORPHISMS = 100000
+
+
+def symmetricAtom(tokens):
+    """
+    Return a tokenized atom with the sides of a top-level ``=`` or ``≠`` in a canonical order.
+    """
+    depth = 0
+    for i, token in enumerate(tokens):
+        if token == "(":
+            depth += 1
+        elif token == ")":
+            depth -= 1
+        elif depth == 0 and token in SYMMETRIC_RELATIONS:
+            left, right = tuple(tokens[:i]), tuple(tokens[i + 1 :])
+            return min(left, right) + (token,) + max(left, right)
+    return tuple(tokens)
+
+
+def clauseStructure(tokens):
+    """
+    Return a canonical form of a tokenized proposition that is unchanged by reordering
+    conjuncts: the parts between top-level implications (or binder commas), in order, each as a
+    sorted tuple of its top-level conjuncts (see :func:`symmetricAtom`). Binder lists are
+    sorted, since they only declare the variables. Parts with a top-level disjunction are kept
+    whole.
+    """
+    parts = [[]]
+    depth = 0
+    for token in tokens:
+        if token == "(":
+            depth += 1
+        elif token == ")":
+            depth -= 1
+        if depth == 0 and token in IMPLICATIONS:
+            parts.append([])
+        else:
+            parts[-1].append(token)
+
+    structure = []
+    for part in parts:
+        if part and part[0] in BINDERS:
+            structure.append(("binder", tuple(sorted(part))))
+            continue
+        conjuncts = [[]]
+        depth = 0
+        split = True
+        for token in part:
+            if token == "(":
+                depth += 1
+            elif token == ")":
+                depth -= 1
+            if depth == 0 and token in DISJUNCTIONS:
+                split = False
+            if depth == 0 and token == "∧":
+                conjuncts.append([])
+            else:
+                conjuncts[-1].append(token)
+        if split:
+            structure.append(("and", tuple(sorted(map(symmetricAtom, conjuncts)))))
+        else:
+            structure.append(("part", tuple(part)))
+    return tuple(structure)
+
+
+def closeUnderComposition(relabellings, names, limit=MAX_AUTOMORPHISMS):
+    """
+    Return the non-identity relabellings generated by composing ``relabellings``, or
+    ``relabellings`` themselves if there are more than ``limit`` of those.
+    """
+    identity = tuple(names)
+
+    def key(mapping):
+        return tuple(mapping[n] for n in names)
+
+    generators = []
+    closure = {}
+    for relabelling in relabellings:
+        if key(relabelling) in closure:
+            continue
+        # each new generator at least doubles the group, so there are few of them
+        generators.append(relabelling)
+        closure = {key(g): g for g in generators}
+        frontier = list(closure.values())
+        while frontier:
+            generated = []
+            for mapping in frontier:
+                for generator in generators:
+                    composed = {n: generator[mapping[n]] for n in names}
+                    k = key(composed)
+                    if k == identity or k in closure:
+                        continue
+                    if len(closure) >= limit:
+                        return relabellings
+                    closure[k] = composed
+                    generated.append(composed)
+            frontier = generated
+    return list(closure.values())
+
+
+class Symmetry:
+    """
+    Relabellings of the ground names that map the ground proposition to itself, up to the
+    order of conjuncts (see :func:`clauseStructure`). Two candidates related by such a
+    relabelling are equivalent unifications, so only the canonical one of each orbit, the first
+    in the order of enumeration, needs to be considered.
+
+    The relabellings found are closed under composition, so that they form a group and a
+    candidate is canonical iff no relabelling maps it to an earlier one. If the search for
+    relabellings was cut short (see ``MAX_AUTOMORPHISM_CHECKS``), this group may only be part
+    of the symmetries, whose orbits are then split into several of its orbits: there are fewer
+    candidates per orbit, not necessarily one. Likewise if closing them would take more than
+    ``MAX_AUTOMORPHISMS`` relabellings, in which case they are kept as found; a candidate may
+    then be canonical although relabelling it repeatedly leads to an earlier one.
+    """
+
+    def __init__(self, names, segments, relabellings):
+        # the position of each name in its sort, which orders candidates as they are enumerated
+        self.position = {}
+        for start, end in segments:
+            for i, name in enumerate(names[start:end]):
+                self.position[name] = i
+        self.relabellings = relabellings
+        # the position of the image of each name under each relabelling
+        self.images = [
+            {name: self.position[image] for name, image in mapping.items()}
+            for mapping in relabellings
+        ]
+
+    @classmethod
+    def fromProposition(cls, reference, names, segments):
+        tokens = TOKEN_PATTERN.findall(reference)
+        variables = set(names)
+        target = clauseStructure(tokens)
+
+        # refine the sorts of the names by the contexts they occur in, as in the 1-dimensional
+        # Weisfeiler-Leman algorithm, so that only names of the same color can be swapped
+        color = {}
+        for s, (start, end) in enumerate(segments):
+            for name in names[start:end]:
+                color[name] = f"#{s}"
+        atoms = [
+            conjunct
+            for kind, part in target
+            if kind != "binder"
+            for conjunct in (part if kind == "and" else [part])
+        ]
+        while True:
+            signature = {name: [] for name in names}
+            for atom in atoms:
+                for i, token in enumerate(atom):
+                    if token in variables:
+                        # mark this occurrence, and abstract the other names by their colors
+                        context = [
+                            "*" if j == i else color.get(t, t)
+                            for j, t in enumerate(atom)
+                        ]
+                        signature[token].append(symmetricAtom(context))
+            refined = {
+                name: (color[name], tuple(sorted(signature[name]))) for name in names
+            }
+            classes = {
+                key: f"#{i}" for i, key in enumerate(sorted(set(refined.values())))
+            }
+            refined = {name: classes[refined[name]] for name in names}
+            if len(set(refined.values())) == len(set(color.values())):
+                break
+            color = refined
+
+        relabellings = []
+        checks = 0
+
+        def search(i, mapping, used):
+            nonlocal checks
+            if checks >= MAX_AUTOMORPHISM_CHECKS:
+                return
+            if i == len(names):
+                checks += 1
+                relabelled = [mapping.get(t, t) for t in tokens]
+                if (
+                    any(mapping[n] != n for n in names)
+                    and clauseStructure(relabelled) == target
+                ):
+                    relabellings.append(dict(mapping))
+                return
+            name = names[i]
+            for image in names:
+                if image not in used and color[image] == color[name]:
+                    mapping[name] = image
+                    used.add(image)
+                    search(i + 1, mapping, used)
+                    used.discard(image)
+                    del mapping[name]
+
+        search(0, {}, set())
+        return cls(names, segments, closeUnderComposition(relabellings, names))
+
+    def __len__(self):
+        return len(self.relabellings)
+
+    def tied(self, part, images):
+        """
+        Compare ``part``, the next values of a candidate, with its image under each relabelling
+        of ``images`` (see ``Symmetry.images``). Return the relabellings that map ``part`` to
+        itself, or ``None`` if one maps it to an earlier part: if the relabellings map the values
+        before ``part`` to themselves, no candidate with these values is then canonical.
+        """
+        positions = tuple(self.position[v] for v in part)
+        tied = []
+        for image in images:
+            relabelled = tuple(image[v] for v in part)
+            if relabelled < positions:
+                return None
+            if relabelled == positions:
+                tied.append(image)
+        return tied
+
+    def isCanonical(self, values):
+        return self.tied(values, self.images) is not None
+
+    def canonical(self, values):
+        """
+        Return the canonical candidate in the orbit of ``values``.
+        """
+        values = tuple(values)
+        while True:
+            positions = tuple(self.position[v] for v in values)
+            for mapping in self.relabellings:
+                image = tuple(mapping[v] for v in values)
+                if tuple(self.position[v] for v in image) < positions:
+                    values = image
+                    break
+            else:
+                return values
+
+
+CONNECTIVES = IMPLICATIONS | DISJUNCTIONS | {"∧", "¬"}
+
+
+def predicateTuples(tokens):
+    """
+    Split a tokenized proposition into its atoms at every connective, dropping parentheses and
+    binder declarations, e.g. ``("between", "a", "g", "b")`` or ``("|", "a", "─", "h", "|",
+    "=", "|", "c", "─", "i", "|")``.
+    """
+    atoms = [[]]
+    for token in tokens:
+        if token in CONNECTIVES:
+            atoms.append([])
+        elif token not in "()":
+            atoms[-1].append(token)
+    return [tuple(atom) for atom in atoms if atom and atom[0] not in BINDERS]
+
+
+def flipped(atom):
+    """
+    Return an atom with the sides of its top-level ``=`` or ``≠`` swapped, or ``None``.
+    """
+    for i, token in enumerate(atom):
+        if token in SYMMETRIC_RELATIONS:
+            return atom[i + 1 :] + (token,) + atom[:i]
+    return None
+
+
+class OverlapScorer:
+    """
+    A cheap stand-in for :meth:`PermScorer.scoreBatch`: the score of a candidate is the number
+    of atoms of the target (see :func:`predicateTuples`) that also occur in the reference once
+    the candidate is substituted into them.
+
+    Each atom with guarded names is reduced once to its *skeleton*, with every guarded name
+    abstracted, and an :func:`operator.itemgetter` of the fields of its arguments, so that a
+    candidate is scored with one set lookup per atom and is never rendered.
+    """
+
+    def __init__(self, scorer: PermScorer):
+        names = set(scorer.names)
+        guarded = {g: i for i, g in enumerate(scorer.guarded)}
+
+        # the arguments of the reference atoms with each skeleton, in either order for = and ≠
+        arguments = {}
+        for atom in predicateTuples(TOKEN_PATTERN.findall(scorer.reference)):
+            for variant in (atom, flipped(atom)):
+                if variant is None:
+                    continue
+                skeleton = tuple("·" if t in names else t for t in variant)
+                args = tuple(t for t in variant if t in names)
+                arguments.setdefault(skeleton, set()).add(
+                    args[0] if len(args) == 1 else args
+                )
+
+        self.checks = []
+        for atom in predicateTuples(TOKEN_PATTERN.findall(scorer.target)):
+            fields = [guarded[t] for t in atom if t in guarded]
+            skeleton = tuple("·" if t in guarded else t for t in atom)
+            # atoms without guarded names score the same for every candidate
+            if fields and skeleton in arguments:
+                self.checks.append((itemgetter(*fields), arguments[skeleton]))
+
+    def score(self, values):
+        return sum(get(values) in args for get, args in self.checks)
+
+    def scoreBatch(self, batch, score_cutoff=0.0):
+        """
+        Return ``(i, score)`` for each ``batch[i]`` whose score is at least ``score_cutoff``,
+        in the order of ``batch``.
+        """
+        # one pass over the batch per atom keeps the loops in C
+        hits = [map(args.__contains__, map(get, batch)) for get, args in self.checks]
+        scores = map(sum, zip(*hits)) if hits else repeat(0, len(batch))
+        return [(i, score) for i, score in enumerate(scores) if score >= score_cutoff]
+
+
+def rescore(scorer, survivors: TopN, candidates: TopN):
+    """
+    Score the candidates kept by the cheap stage of a cascade by string similarity, and add the
+    best to ``candidates``. Ties are still broken by the index of the candidate.
+    """
+    survivors = list(survivors)
+    values = [x.name for x in survivors]
+    for i, sim in scorer.scoreBatch(values, candidates.floor()):
+        candidates.push(NameMap(values[i], sim, survivors[i].tiebreak))
 
 
 def choosePermutations(
@@ -152,9 +1346,35 @@ def choosePermutations(
     target,
     reference,
     N,
+    strategy="exhaustive",
+    beam_width=BEAM_WIDTH,
+    seed=SHORTCIRCUIT_SEED,
+    workers=1,
+    pool_size=POOL_SIZE,
+    symmetry=False,
+    deadline=None,
+    cascade_depth=None,
 ):
-    short_circuiting = False
-    seen_sc = 0
+    """
+    Choose the ``N`` unifications of the bound variables of ``test`` with those of ``ground``
+    whose substitution into ``target`` is most similar to ``reference``.
+
+    ``univ`` and ``exist`` hold the permutations of the *ground* names of each sort; each
+    candidate assigns them, in order, to the guarded test names of that sort.
+
+    With ``symmetry``, unifications that are equivalent up to a symmetry of ``reference`` (see
+    :class:`Symmetry`) are only considered once.
+
+    With a ``deadline`` (in ``time.monotonic()`` seconds), the exhaustive and ``bnb`` strategies
+    return the best unifications found by then.
+
+    With a ``cascade_depth``, exhaustive search only scores the ``cascade_depth`` candidates
+    ranked best by :class:`OverlapScorer` by string similarity.
+
+    :returns: the chosen unifications, the ground names, the number of candidates scored, the
+        total number of candidates, whether every candidate was considered, and the number of
+        symmetries found
+    """
     permHeap = []
     asList = (
         ground.univNames.points
@@ -164,53 +1384,60 @@ def choosePermutations(
         + ground.existNames.lines
         + ground.existNames.circles
     )
-    allCombs = product(
-        univ.pointPerms,
-        univ.linePerms,
-        univ.circlePerms,
-        exist.pointPerms,
-        exist.linePerms,
-        exist.circlePerms,
-    )
-
-    nonempty_names = []
-
-    if not univ.noPoints():
-        nonempty_names += [univ.pointPerms]
-    if not univ.noLines():
-        nonempty_names += [univ.linePerms]
-    if not univ.noCircles():
-        nonempty_names += [univ.circlePerms]
-    if not exist.noPoints():
-        nonempty_names += [exist.pointPerms]
-    if not exist.noLines():
-        nonempty_names += [exist.linePerms]
-    if not exist.noCircles():
-        nonempty_names += [exist.circlePerms]
-
-    ceiling = 1
-    for x in nonempty_names:
-        ceiling *= ceiling * len(x)
-    if ceiling > SHORTCIRCUIT_THRESHOLD:
-        short_circuiting = True
+    sizes = [
+        len(x)
+        for x in (
+            test.univNames.points,
+            test.univNames.lines,
+            test.univNames.circles,
+            test.existNames.points,
+            test.existNames.lines,
+            test.existNames.circles,
+        )
+    ]
+    scorer = PermScorer(target, reference, test.asList(), asList, sizes)
+    symmetries = None
+    candidates = TopN(N)
+    if symmetry:
+        symmetries = Symmetry.fromProposition(reference, asList, scorer.segments)
+        if symmetries:
+            candidates = TopN(N, key=symmetries.canonical)
+        else:
+            symmetries = None
 
+    space = CandidateSpace(univ, exist)
     if has_match(ground, remove_all_guards(test)):
         print("match found")
-        sim = checkPerm(
-            ground.asList(), target, reference, replaceGuards(ground.asList())
+        values = tuple(removeGuards(test.asList()))
+        candidates.push(NameMap(values, scorer.score(values), -space.rank(values)))
+
+    if strategy == "exhaustive":
+        explored, complete = exhaustiveSearch(
+            scorer,
+            univ,
+            exist,
+            candidates,
+            seed,
+            workers,
+            symmetries,
+            deadline,
+            cascade_depth,
         )
-        checkAndInsert(permHeap, NameMap(ground.asList(), sim), N)
+    elif strategy == "bnb":
+        explored, complete = branchAndBound(scorer, space, candidates, deadline)
+    elif strategy == "beam":
+        explored = beamSearch(scorer, space, candidates, beam_width)
+        complete = explored >= len(space)
+    elif strategy == "murty":
+        explored = murtySearch(scorer, candidates, pool_size)
+        complete = explored >= len(space)
+    else:
+        raise ValueError(f"Unknown search strategy: {strategy}")
 
-    for uPoints, uLines, uCircles, ePoints, eLines, eCircles in allCombs:
-        perm = uPoints + uLines + uCircles + ePoints + eLines + eCircles
-        sim = checkPerm(asList, target, reference, perm)
-        x = NameMap(perm, sim)
-        checkAndInsert(permHeap, x, N)
-        if short_circuiting and sim > SHORTCIRCUIT_SAMPLE_THRESHOLD:
-            seen_sc += 1
-        if short_circuiting and seen_sc >= SHORTCIRCUIT_SAMPLE_CUTOFF:
-            return permHeap, asList
-    return permHeap, asList
+    for x in candidates:
+        permHeap.append(NameMap(scorer.toPerm(x.name), x.sim, x.tiebreak))
+    n_symmetries = len(symmetries) if symmetries else 0
+    return permHeap, asList, explored, len(space), complete, n_symmetries
 
 
 def removeGuards(data):
@@ -235,34 +1462,288 @@ def remove_all_guards(x: PropData):
     return PropData(univ, exist)
 
 
-def main():
+class ChooserMemo:
+    """
+    A persistent memo of chooser outputs, keyed by a hash of the input, ``N`` and the options
+    that affect the output, so that a recurring instance is answered without scoring.
 
-    parser = argparse.ArgumentParser()
-    parser.add_argument("--inFile", type=str)
-    parser.add_argument("--outFile", type=str)
-    parser.add_argument("--N", type=int)
-    args = parser.parse_args()
-    target, reference, groundNames, testNames = readData(args.inFile)
+    The memo is an SQLite database in WAL mode, so that concurrent choosers can share it, with
+    a size bound enforced by evicting the least recently used outputs.
+    """
+
+    # the options of `choose` that can change its output
+    OPTIONS = (
+        "strategy",
+        "beam_width",
+        "seed",
+        "pool_size",
+        "symmetry",
+        "cascade_depth",
+    )
+
+    def __init__(self, path=MEMO_PATH, max_bytes=MEMO_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with contextlib.closing(self.connect()) as db, db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(
+                """
+                CREATE TABLE IF NOT EXISTS outputs (
+                    key TEXT PRIMARY KEY,
+                    output TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    last_access REAL NOT NULL
+                )
+                """
+            )
+            db.execute(
+                "CREATE INDEX IF NOT EXISTS outputs_last_access ON outputs (last_access)"
+            )
+
+    def connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    @classmethod
+    def key(cls, props, N, options):
+        material = json.dumps(
+            [MEMO_VERSION, props, N, [options[k] for k in cls.OPTIONS]],
+            sort_keys=True,
+            ensure_ascii=False,
+        )
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        with contextlib.closing(self.connect()) as db, db:
+            row = db.execute(
+                "SELECT output FROM outputs WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            db.execute(
+                "UPDATE outputs SET last_access = ? WHERE key = ?", (time.time(), key)
+            )
+        return json.loads(row[0])
+
+    def put(self, key, output):
+        text = json.dumps(output, ensure_ascii=False)
+        size = len(text.encode("utf-8"))
+        with contextlib.closing(self.connect()) as db, db:
+            db.execute(
+                "INSERT OR REPLACE INTO outputs VALUES (?, ?, ?, ?)",
+                (key, text, size, time.time()),
+            )
+            total = db.execute("SELECT COALESCE(SUM(size), 0) FROM outputs").fetchone()[
+                0
+            ]
+            for old, old_size in db.execute(
+                "SELECT key, size FROM outputs ORDER BY last_access"
+            ).fetchall():
+                if total <= self.max_bytes:
+                    break
+                db.execute("DELETE FROM outputs WHERE key = ?", (old,))
+                total -= old_size
+
+
+def choose(
+    props,
+    N,
+    strategy="exhaustive",
+    beam_width=BEAM_WIDTH,
+    seed=SHORTCIRCUIT_SEED,
+    workers=1,
+    pool_size=POOL_SIZE,
+    symmetry=False,
+    time_budget_ms=None,
+    cascade_depth=None,
+    memo=None,
+):
+    """
+    Choose the best ``N`` unifications for an instance in the input format written by E3, and
+    return them in the output format read by E3.
 
-    univTestPermutaions = getPermutations(testNames.univNames)
+    With a ``time_budget_ms``, return the best unifications found within that many
+    milliseconds; the ``stats`` of the output record how much of the search was done.
+
+    With a :class:`ChooserMemo`, a memoized output is returned if there is one, and outputs
+    that do not depend on the time budget are memoized.
+    """
+    if memo is not None:
+        key = ChooserMemo.key(
+            props,
+            N,
+            {
+                "strategy": strategy,
+                "beam_width": beam_width,
+                "seed": seed,
+                "pool_size": pool_size,
+                "symmetry": symmetry,
+                "cascade_depth": cascade_depth,
+            },
+        )
+        output = memo.get(key)
+        if output is not None:
+            output["stats"]["memoized"] = True
+            return output
 
-    existTestPermutaions = getPermutations(testNames.existNames)
+    deadline = None
+    if time_budget_ms is not None:
+        deadline = time.monotonic() + time_budget_ms / 1000
+    target, reference, groundNames, testNames = parseData(props)
 
-    perms, ground = choosePermutations(
+    univPermutations = getPermutations(groundNames.univNames)
+
+    existPermutations = getPermutations(groundNames.existNames)
+
+    perms, ground, explored, total, complete, symmetries = choosePermutations(
         groundNames,
         testNames,
-        univTestPermutaions,
-        existTestPermutaions,
+        univPermutations,
+        existPermutations,
         target,
         reference,
-        args.N,
+        N,
+        strategy=strategy,
+        beam_width=beam_width,
+        seed=seed,
+        workers=workers,
+        pool_size=pool_size,
+        symmetry=symmetry,
+        deadline=deadline,
+        cascade_depth=cascade_depth,
     )
 
     perms = sorted(perms, reverse=True)
     perms = [list(x.name) for x in perms]
     perms = [removeGuards(x) for x in perms]
 
-    dict = {"ground": ground, "perms": perms}
+    output = {
+        "ground": ground,
+        "perms": perms,
+        "stats": {
+            "strategy": strategy,
+            "explored": explored,
+            "total": total,
+            "complete": complete,
+            "symmetries": symmetries,
+        },
+    }
+    # an incomplete anytime search may have found less than the same search with more time
+    if memo is not None and (deadline is None or complete):
+        memo.put(key, output)
+    return output
+
+
+def serve(options):
+    """
+    Answer requests from stdin until it is closed, one JSON object per line:
+    ``{"N": _, "input": _}``, where ``input`` is the contents of an input file, optionally
+    with a ``"time_budget_ms"`` overriding ``--time-budget-ms`` and a boolean ``"memo"``
+    overriding ``--memo`` (with the default memo). Each response is the contents of the
+    corresponding output file, or ``{"error": _}``, on one line.
+    """
+    memo = options["memo"]
+    for line in sys.stdin:
+        if not line.strip():
+            continue
+        try:
+            request = json.loads(line)
+            use_memo = request.get("memo", memo is not None)
+            if use_memo and memo is None:
+                memo = ChooserMemo()
+            # stdout carries the responses, so anything else printed is discarded
+            with contextlib.redirect_stdout(io.StringIO()):
+                response = choose(
+                    request["input"],
+                    request["N"],
+                    **{
+                        **options,
+                        "time_budget_ms": request.get(
+                            "time_budget_ms", options["time_budget_ms"]
+                        ),
+                        "memo": memo if use_memo else None,
+                    },
+                )
+        except Exception as e:
+            response = {"error": f"[E3/choosePerms] error: {type(e).__name__}: {e}"}
+        sys.stdout.write(json.dumps(response) + "\n")
+        sys.stdout.flush()
+
+
+def main():
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--inFile", type=str)
+    parser.add_argument("--outFile", type=str)
+    parser.add_argument("--N", type=int)
+    parser.add_argument("--strategy", choices=STRATEGIES, default="exhaustive")
+    parser.add_argument("--beam-width", type=int, default=BEAM_WIDTH)
+    parser.add_argument("--seed", type=int, default=SHORTCIRCUIT_SEED)
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of processes to score candidates with during exhaustive search",
+    )
+    parser.add_argument(
+        "--pool-size",
+        type=int,
+        default=POOL_SIZE,
+        help="Number of assignments re-ranked by string similarity with --strategy murty",
+    )
+    parser.add_argument(
+        "--symmetry",
+        action="store_true",
+        help="Consider unifications that are equivalent up to a symmetry of the ground "
+        "proposition only once",
+    )
+    parser.add_argument(
+        "--time-budget-ms",
+        type=int,
+        default=None,
+        help="Return the best unifications found within this many milliseconds",
+    )
+    parser.add_argument(
+        "--cascade-depth",
+        type=int,
+        nargs="?",
+        const=CASCADE_DEPTH,
+        default=None,
+        help="During exhaustive search, rank candidates by a cheap predicate-tuple overlap "
+        "first, and only score this many (default when given: %(const)s) by string similarity",
+    )
+    parser.add_argument(
+        "--memo",
+        nargs="?",
+        const=MEMO_PATH,
+        default=None,
+        help="Reuse outputs memoized in this database (default when given: %(const)s)",
+    )
+    parser.add_argument(
+        "--serve",
+        action="store_true",
+        help="Answer requests over stdin/stdout instead of reading --inFile",
+    )
+    args = parser.parse_args()
+    options = {
+        "strategy": args.strategy,
+        "beam_width": args.beam_width,
+        "seed": args.seed,
+        "workers": args.workers,
+        "pool_size": args.pool_size,
+        "symmetry": args.symmetry,
+        "time_budget_ms": args.time_budget_ms,
+        "cascade_depth": args.cascade_depth,
+        "memo": ChooserMemo(args.memo) if args.memo else None,
+    }
+
+    if args.serve:
+        serve(options)
+        return
+
+    with open(args.inFile, "r") as file:
+        props = json.load(file)
+    dict = choose(props, args.N, **options)
     with open(args.outFile, "w") as file:
         json.dump(dict, file)
 
@@ -0,0 +1,4 @@
+import E3
+
+/- Entry point for the persistent E3 server, see `E3/Engine/Server.lean` and `E3/server.py` -/
+def main : IO Unit := runE3Server
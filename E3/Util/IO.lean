@@ -17,25 +17,45 @@ def E3Ctx : Core.Context := {fileName := "<empty>",fileMap := .ofString ""}
 def E3State : IO Core.State := return {env := ← E3Env}
 
 -- Temporarily files for Lean/Python communication,
-def permInFile (name : String) :=  s!"E3/_tmp/{name}_in.json"
-def permOutFile (name : String) := s!"E3/_tmp/{name}_out.json"
+-- tagged with the PID so that concurrent checks of identically-named instances don't collide
+def permInFile (name : String) : IO String := return s!"E3/_tmp/{name}_{← IO.Process.getPID}_in.json"
+def permOutFile (name : String) : IO String := return s!"E3/_tmp/{name}_{← IO.Process.getPID}_out.json"
 
 /-
 The following functions are used for interacting with `choosePerms.py`,
 which chooses unifications of bound variables between ground truth and test propositions
 --/
 
-def permChooser (inFile outFile : String) (nPerms : Nat) :=  IO.Process.spawn  {
+-- `choosePerms.py` flags for the chooser options of `cfg`
+def chooserArgs (cfg : EvalConfig) : Array String :=
+  #["--N", s!"{cfg.nPermutations}"]
+  ++ (if cfg.chooserBudgetMs == 0 then #[] else #["--time-budget-ms", s!"{cfg.chooserBudgetMs}"])
+  ++ (if cfg.chooserMemo then #["--memo"] else #[])
+
+def permChooser (inFile outFile : String) (cfg : EvalConfig) :=  IO.Process.spawn  {
       cmd := "python3",
-      args := #["E3/Engine/choosePerms.py","--inFile", inFile, "--outFile", outFile, "--N", s!"{nPerms}"],
+      args := #["E3/Engine/choosePerms.py","--inFile", inFile, "--outFile", outFile] ++ chooserArgs cfg,
       stdin := .piped
       stdout := .piped
       stderr := .piped
     }
 
 
-def readPermOutput (file: String) : IO (Except String ((List String) × (List (List String)))) := do
-  let jsonString ← IO.FS.readFile file
+/-- The ground names, the chosen unifications of test names with them, and search statistics -/
+abbrev PermOutput := (List String) × (List (List String)) × Option ChooserStats
+
+def parseChooserStats (json : Json) : Option ChooserStats :=
+  match json.getObjVal? "stats" with
+  | .error _ => none
+  | .ok stats => Except.toOption do
+    return {
+      strategy := ← stats.getObjValAs? String "strategy"
+      explored := ← stats.getObjValAs? Nat "explored"
+      total := ← stats.getObjValAs? Nat "total"
+      complete := ← stats.getObjValAs? Bool "complete"
+    }
+
+def parsePermOutput (jsonString : String) : Except String PermOutput :=
   match (Json.parse jsonString) >>= (Json.getObjVal? . "ground") >>= Json.getArr? with
     | .error _ => .error "[E3/choosePerms] error: ground prop. not found"
     | .ok g => match g.mapM Json.getStr? with
@@ -46,12 +66,17 @@ def readPermOutput (file: String) : IO (Except String ((List String) × (List (L
           | .error _ => .error "[E3/choosePerms] error: test prop. names not well-formed"
           | .ok ls => match ls.toList.mapM (λ xs => xs.mapM Json.getStr?) with
             | .error _ => .error "[E3/choosePerms] error: test prop. names not well-formed"
-            | .ok xs => return .ok ⟨gs.toList, xs.map (Array.toList) ⟩
+            | .ok xs =>
+              let stats := (Json.parse jsonString).toOption >>= parseChooserStats
+              return ⟨gs.toList, xs.map (Array.toList), stats⟩
+
+def readPermOutput (file: String) : IO (Except String PermOutput) := do
+  return parsePermOutput (← IO.FS.readFile file)
 
-def permutationHeuristic (inFile outFile raw guarded tjson gjson : String) (nperms : Nat) :  IO (Except String (List String × List (List String))) := do
+def permutationHeuristicFile (inFile outFile raw guarded tjson gjson : String) (cfg : EvalConfig) :  IO (Except String PermOutput) := do
   let fileContents := formatPermutationJson raw guarded tjson gjson
   IO.FS.writeFile inFile fileContents
-  let process ← permChooser inFile outFile nperms
+  let process ← permChooser inFile outFile cfg
   process.stdin.flush
   let (_, process) ← process.takeStdin
   let _ ← process.wait
@@ -61,6 +86,47 @@ def permutationHeuristic (inFile outFile raw guarded tjson gjson : String) (nper
   else
     readPermOutput outFile
 
+/-- Start a `choosePerms.py --serve` process -/
+def ChooserService.spawn : IO ChooserService := do
+  let child ← IO.Process.spawn {
+      cmd := "python3",
+      args := #["E3/Engine/choosePerms.py", "--serve"],
+      stdin := .piped
+      stdout := .piped
+      stderr := .inherit
+    }
+  return ⟨child⟩
+
+/--
+Ask a running chooser for the best `cfg.nPermutations` unifications, with the chooser options
+of `cfg`.
+Throws if the service cannot be reached, and returns `.error` if it rejected the request.
+-/
+def ChooserService.choose (svc : ChooserService) (raw guarded tjson gjson : String) (cfg : EvalConfig) : IO (Except String PermOutput) := do
+  let input ← IO.ofExcept <| Json.parse (formatPermutationJson raw guarded tjson gjson)
+  let budget := if cfg.chooserBudgetMs == 0 then [] else [("time_budget_ms", toJson cfg.chooserBudgetMs)]
+  let request := Json.mkObj <| [("N", toJson cfg.nPermutations), ("input", input), ("memo", toJson cfg.chooserMemo)] ++ budget
+  svc.child.stdin.putStrLn request.compress
+  svc.child.stdin.flush
+  let line ← svc.child.stdout.getLine
+  if line.isEmpty then
+    throw <| IO.userError "[E3/choosePerms] error: chooser service exited"
+  match (Json.parse line) >>= (Json.getObjValAs? . String "error") with
+  | .ok err => return .error err
+  | .error _ => return parsePermOutput line
+
+/--
+Choose unifications with `chooser` if there is one, and otherwise (or if it has died)
+by running `choosePerms.py` on files named after the instance.
+-/
+def permutationHeuristic (chooser : Option ChooserService) (name raw guarded tjson gjson : String) (cfg : EvalConfig) :  IO (Except String PermOutput) := do
+  if let some svc := chooser then
+    try
+      return ← svc.choose raw guarded tjson gjson cfg
+    catch e =>
+      IO.eprintln s!"[E3/choosePerms] warning: falling back to file protocol: {e}"
+  permutationHeuristicFile (← permInFile name) (← permOutFile name) raw guarded tjson gjson cfg
+
 def E3.clean_tmp_dir (name : String)  : IO Unit := do
-    IO.FS.removeFile (permInFile name)
-    IO.FS.removeFile (permOutFile name)
+    IO.FS.removeFile (← permInFile name)
+    IO.FS.removeFile (← permOutFile name)
@@ -0,0 +1,282 @@
+"""
+cache.py
+
+On-disk cache of E3 results, so that re-running an evaluation only re-checks the
+(ground, prediction) pairs that changed.
+
+Entries are keyed by a hash of the whitespace-normalized ground and test propositions and the
+checker configuration. Results that cannot change with a larger solver time budget
+(``binary_check == "equiv"``, or ``bvars`` mode, which runs no solvers) are *definitive* and are
+keyed without ``bin_time``/``approx_time``. All other results may be caused by solver timeouts,
+so they are stored separately and keyed by the time budget as well: raising the budget only
+invalidates those entries. The time budget of the permutation chooser, if any, is part of the
+time budget.
+
+The cache is a single SQLite database with a size bound enforced by LRU eviction.
+
+Usage
+-----
+.. code-block:: console
+
+    $ python -m E3.cache stats
+    $ python -m E3.cache prune --max-size 100000000
+    $ python -m E3.cache prune --timeouts
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+from contextlib import closing
+from typing import Final
+
+from E3.utils import ROOT_DIR
+
+DEFAULT_CACHE_PATH: Final[str] = os.path.join(ROOT_DIR, "tmp", "cache", "e3.sqlite")
+DEFAULT_MAX_BYTES: Final[int] = 256 * 1024 * 1024
+
+DEFINITIVE: Final[str] = "definitive"
+TIMEOUT: Final[str] = "timeout"
+
+
+def normalize(text: str) -> str:
+    return " ".join(text.split())
+
+
+def cache_key(
+    ground: str,
+    test: str,
+    mode: str,
+    n_perms: int,
+    bin_time: int | None = None,
+    approx_time: int | None = None,
+    chooser_budget_ms: int | None = None,
+) -> str:
+    """
+    Hash a checker instance. Leave the time budget unset to get the key of a definitive result.
+    """
+    fields = [normalize(ground), normalize(test), mode, n_perms, bin_time, approx_time]
+    # only appended when set, so that entries cached without a chooser budget keep their keys
+    if chooser_budget_ms is not None:
+        fields.append(chooser_budget_ms)
+    material = json.dumps(fields, ensure_ascii=False)
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+def is_definitive(mode: str, result: dict) -> bool:
+    """
+    Return whether an E3 result is independent of the solver time budget.
+    """
+    return mode == "bvars" or result.get("binary_check") == "equiv"
+
+
+class ResultCache:
+    def __init__(
+        self, path: str = DEFAULT_CACHE_PATH, max_bytes: int = DEFAULT_MAX_BYTES
+    ):
+        self.path = path
+        self.max_bytes = max_bytes
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with closing(self._connect()) as db, db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(
+                """
+                CREATE TABLE IF NOT EXISTS results (
+                    key TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    bin_time INTEGER,
+                    approx_time INTEGER,
+                    result TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    last_access REAL NOT NULL
+                )
+                """
+            )
+            db.execute(
+                "CREATE INDEX IF NOT EXISTS results_last_access ON results (last_access)"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        # a connection per operation keeps the cache safe to share between threads
+        return sqlite3.connect(self.path, timeout=30)
+
+    def get(
+        self,
+        ground: str,
+        test: str,
+        mode: str,
+        n_perms: int,
+        bin_time: int,
+        approx_time: int,
+        chooser_budget_ms: int | None = None,
+    ) -> dict | None:
+        """
+        Return the cached E3 result (the object stored under the instance name), if any.
+        """
+        keys = (
+            cache_key(ground, test, mode, n_perms),
+            cache_key(
+                ground, test, mode, n_perms, bin_time, approx_time, chooser_budget_ms
+            ),
+        )
+        with closing(self._connect()) as db, db:
+            row = db.execute(
+                "SELECT key, result FROM results WHERE key IN (?, ?) ORDER BY kind = ? DESC",
+                (*keys, DEFINITIVE),
+            ).fetchone()
+            if row is None:
+                return None
+            db.execute(
+                "UPDATE results SET last_access = ? WHERE key = ?",
+                (time.time(), row[0]),
+            )
+        return json.loads(row[1])
+
+    def put(
+        self,
+        ground: str,
+        test: str,
+        mode: str,
+        n_perms: int,
+        bin_time: int,
+        approx_time: int,
+        result: dict,
+        chooser_budget_ms: int | None = None,
+    ) -> None:
+        if is_definitive(mode, result):
+            kind = DEFINITIVE
+            key = cache_key(ground, test, mode, n_perms)
+        else:
+            kind = TIMEOUT
+            key = cache_key(
+                ground, test, mode, n_perms, bin_time, approx_time, chooser_budget_ms
+            )
+
+        text = json.dumps(result, ensure_ascii=False)
+        with closing(self._connect()) as db, db:
+            db.execute(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    key,
+                    kind,
+                    bin_time,
+                    approx_time,
+                    text,
+                    len(text.encode("utf-8")),
+                    time.time(),
+                ),
+            )
+        self.evict(self.max_bytes)
+
+    def evict(self, max_bytes: int) -> int:
+        """
+        Delete least recently used entries until the cache holds at most ``max_bytes``.
+
+        :returns: the number of entries deleted
+        """
+        deleted = 0
+        with closing(self._connect()) as db, db:
+            total = db.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[
+                0
+            ]
+            if total <= max_bytes:
+                return 0
+            for key, size in db.execute(
+                "SELECT key, size FROM results ORDER BY last_access"
+            ).fetchall():
+                if total <= max_bytes:
+                    break
+                db.execute("DELETE FROM results WHERE key = ?", (key,))
+                total -= size
+                deleted += 1
+        return deleted
+
+    def prune_timeouts(self, below_bin_time: int | None = None) -> int:
+        """
+        Delete results that may have been caused by solver timeouts, optionally only those
+        obtained with a binary-check budget below ``below_bin_time`` seconds.
+
+        :returns: the number of entries deleted
+        """
+        with closing(self._connect()) as db, db:
+            if below_bin_time is None:
+                cursor = db.execute("DELETE FROM results WHERE kind = ?", (TIMEOUT,))
+            else:
+                cursor = db.execute(
+                    "DELETE FROM results WHERE kind = ? AND bin_time < ?",
+                    (TIMEOUT, below_bin_time),
+                )
+            return cursor.rowcount
+
+    def clear(self) -> None:
+        with closing(self._connect()) as db, db:
+            db.execute("DELETE FROM results")
+
+    def stats(self) -> dict[str, tuple[int, int]]:
+        """
+        Return the number of entries and total size in bytes of each kind of entry.
+        """
+        with closing(self._connect()) as db:
+            rows = db.execute(
+                "SELECT kind, COUNT(*), SUM(size) FROM results GROUP BY kind"
+            ).fetchall()
+        stats = {DEFINITIVE: (0, 0), TIMEOUT: (0, 0)}
+        stats.update({kind: (count, size) for kind, count, size in rows})
+        return stats
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Inspect and prune the E3 result cache."
+    )
+    parser.add_argument(
+        "--path",
+        type=str,
+        default=DEFAULT_CACHE_PATH,
+        help="Path to the cache database (default: %(default)s)",
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("stats", help="Print the number and size of cached results")
+    prune = subparsers.add_parser("prune", help="Delete cached results")
+    prune.add_argument(
+        "--max-size",
+        type=int,
+        help="Evict least recently used results until the cache is at most this many bytes",
+    )
+    prune.add_argument(
+        "--timeouts",
+        action="store_true",
+        help="Delete all results that may have been caused by solver timeouts",
+    )
+    prune.add_argument(
+        "--below-bin-time",
+        type=int,
+        help="With --timeouts, only delete results obtained with a smaller binary-check budget",
+    )
+    subparsers.add_parser("clear", help="Delete all cached results")
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    cache = ResultCache(args.path)
+
+    if args.command == "stats":
+        for kind, (count, size) in cache.stats().items():
+            print(f"{kind:<12} {count:>8} entries {size:>12} bytes")
+    elif args.command == "prune":
+        if args.timeouts:
+            print(
+                f"Deleted {cache.prune_timeouts(args.below_bin_time)} timeout entries"
+            )
+        if args.max_size is not None:
+            print(f"Evicted {cache.evict(args.max_size)} entries")
+    elif args.command == "clear":
+        cache.clear()
+
+
+if __name__ == "__main__":
+    main()
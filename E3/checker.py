@@ -1,6 +1,11 @@
 import os
 import json
+import threading
+import time
 
+from E3.cache import ResultCache
+from E3.server import LeanServerError, ServerPool
+from E3.store import ResultStore
 from E3.utils import (
     ROOT_DIR,
     format_lean_checker_file,
@@ -9,6 +14,13 @@ from E3.utils import (
 )
 from subprocess import Popen, PIPE, SubprocessError, TimeoutExpired
 
+# phases timed by E3 that do not overlap; the others are nested in one of them
+TOP_LEVEL_PHASES = ("import", "elaborate", "preprocess", "bvars", "binary", "approx")
+# bound on the number of conjuncts, hence solver queries, of a round of the approximate checker
+MAX_APPROX_CONJUNCTS = 16
+# seconds allowed to a server request on top of its solver time, for elaboration and the chooser
+REQUEST_MARGIN = 120
+
 
 class Checker:
     def __init__(
@@ -19,7 +31,45 @@ class Checker:
         mode="skipApprox",
         tmp_path=os.path.join(ROOT_DIR, "tmp", "check"),
         result_path=os.path.join(ROOT_DIR, "results"),
+        backend="subprocess",
+        cache: ResultCache | None = None,
+        chooser_budget_ms: int | None = None,
+        chooser_memo: bool = False,
+        binary_parallelism: int = 1,
+        approx_parallelism: int = 1,
+        solver_session_queries: int | None = None,
+        smt_cache: str | None = None,
+        capture_dir: str | None = None,
+        store: ResultStore | None = None,
     ):
+        """
+        :param backend: ``"subprocess"`` to run each check in a fresh ``lake env lean`` process,
+            or ``"server"`` to reuse long-lived E3 servers (see :mod:`E3.server`), falling back
+            to a subprocess if a server crashes or does not answer in time (see
+            :meth:`request_timeout`)
+        :param cache: if given, results are looked up in and added to this cache
+        :param chooser_budget_ms: if given, the permutation chooser returns the best
+            unifications it finds within this many milliseconds, and records in the result
+            how much of the search it completed
+        :param chooser_memo: if ``True``, the permutation chooser reuses the outputs it
+            memoized for the same instances in earlier runs
+        :param binary_parallelism: the number of solvers the binary checker runs
+            concurrently, for both directions of the equivalence and the unsatisfiability check
+        :param approx_parallelism: the number of solvers the approximate checker runs
+            concurrently, over all unifications and both directions of their implications
+        :param solver_session_queries: if given, SMT queries are checked in pooled, incremental
+            z3 sessions that load the Euclid theory once, each recycled after this many queries
+        :param smt_cache: if given, SMT query results are looked up in and added to the cache
+            in this directory (see :mod:`E3.smt_cache`)
+        :param capture_dir: if given, every SMT query issued by a check is saved in this
+            directory, tagged with the instance, phase and permutation, for
+            ``scripts/replay_smt.py``
+        :param store: if given, results are recorded in this store (see :mod:`E3.store`) under
+            their path in ``result_path`` instead of being written there
+        """
+        if backend not in ("subprocess", "server"):
+            raise ValueError(f"Unknown checker backend: {backend}")
+
         self.tmp_path = tmp_path
         os.makedirs(self.tmp_path, exist_ok=True)
         self.result_path = result_path
@@ -29,26 +79,51 @@ class Checker:
         self.equiv_solver_time = bin_time
         self.approx_solver_time = approx_time
         self.mode = mode
+        self.backend = backend
+        self.cache = cache
+        self.chooser_budget_ms = chooser_budget_ms
+        self.chooser_memo = chooser_memo
+        self.binary_parallelism = binary_parallelism
+        self.approx_parallelism = approx_parallelism
+        self.solver_session_queries = solver_session_queries
+        self.smt_cache = smt_cache
+        self.capture_dir = capture_dir
+        self.store = store
+        self._servers = ServerPool() if backend == "server" else None
+
+        # process groups of in-flight checks, so that they can be reaped on interrupt
+        self._active_pgids: set[int] = set()
+        self._lock = threading.Lock()
 
     def check(self, ground: str, test: str, instance_name: str) -> bool:
         """
         Check the logical equivalence of ``ground`` and ``test`` using E3, and write the
-        result to a file with the same name as the ``instance_name``.
+        result to a file with the same name as the ``instance_name`` (or record it in the store).
 
         :returns: ``True`` iff ``ground`` is equivalent to ``test``
         """
-        tmp_file = os.path.join(self.tmp_path, instance_name + ".lean")
-        with open(tmp_file, "w") as file:
-            lean_file = format_lean_checker_file(ground, test)
-            file.write(lean_file)
-        output_json_file = os.path.join(self.result_path, instance_name + ".json")
-
-        command = [
-            "lake",
-            "env",
-            "lean",
-            "--run",
-            tmp_file,
+        result = self.check_result(ground, test, instance_name)
+        return result is not None and result.get("binary_check") == "equiv"
+
+    def check_result(self, ground: str, test: str, instance_name: str) -> dict | None:
+        """
+        Like :meth:`check`, but return the E3 result, or ``None`` if the check failed.
+
+        Its ``timings`` map each phase of the check to the milliseconds it took: those measured
+        by E3, ``checker`` for the whole check as seen from Python, and ``startup`` for the part
+        of it outside the phases measured by E3 (starting Lean, and elaborating the propositions
+        when they are not elaborated by E3 itself). A result from the cache only has
+        ``checker``.
+        """
+        start = time.monotonic()
+        result_file = os.path.join(self.result_path, instance_name + ".json")
+        # with a store, E3 writes its output to a temporary file that is recorded and deleted
+        output_json_file = (
+            os.path.join(self.tmp_path, instance_name + ".json")
+            if self.store is not None
+            else result_file
+        )
+        args = [
             instance_name,
             self.mode,
             str(self.n_permutations),
@@ -57,6 +132,139 @@ class Checker:
             "true",
             output_json_file,
         ]
+        if self.chooser_budget_ms is not None:
+            args.append(f"chooserBudgetMs={self.chooser_budget_ms}")
+        if self.chooser_memo:
+            args.append("chooserMemo=true")
+        if self.binary_parallelism > 1:
+            args.append(f"binaryParallelism={self.binary_parallelism}")
+        if self.approx_parallelism > 1:
+            args.append(f"approxParallelism={self.approx_parallelism}")
+        if self.solver_session_queries is not None:
+            args.append(f"solverSessionQueries={self.solver_session_queries}")
+        if self.smt_cache is not None:
+            args.append(f"smtCache={os.path.abspath(self.smt_cache)}")
+        if self.capture_dir is not None:
+            args.append(f"smtCapture={os.path.abspath(self.capture_dir)}")
+
+        config = (
+            self.mode,
+            self.n_permutations,
+            self.equiv_solver_time,
+            self.approx_solver_time,
+        )
+        if self.cache is not None:
+            cached = self.cache.get(
+                ground, test, *config, chooser_budget_ms=self.chooser_budget_ms
+            )
+            if cached is not None:
+                cached["timings"] = {"checker": self._elapsed_ms(start)}
+                self._write_result(result_file, instance_name, cached)
+                return cached
+
+        temporary = output_json_file != result_file
+        if temporary:
+            # an output left by an earlier run must not be mistaken for this one's
+            self._remove(output_json_file)
+        try:
+            if self._servers is not None:
+                try:
+                    result = self._check_server(ground, test, args, output_json_file)
+                except LeanServerError as e:
+                    print(f"⚠️  E3 server failed, falling back to subprocess: {e}")
+                    result = self._check_subprocess(
+                        ground, test, args, output_json_file
+                    )
+            else:
+                result = self._check_subprocess(ground, test, args, output_json_file)
+        finally:
+            if temporary:
+                self._remove(output_json_file)
+
+        if result is None:
+            return None
+        if self.cache is not None:
+            self.cache.put(
+                ground, test, *config, result, chooser_budget_ms=self.chooser_budget_ms
+            )
+        self._add_wrapper_timings(result, start)
+        self._write_result(result_file, instance_name, result)
+        return result
+
+    @staticmethod
+    def _remove(file: str) -> None:
+        try:
+            os.remove(file)
+        except FileNotFoundError:
+            pass
+
+    def _write_result(self, result_file: str, instance_name: str, result: dict) -> None:
+        if self.store is not None:
+            self.store.put_json("equivalence", result_file, {instance_name: result})
+            return
+        with open(result_file, "w", encoding="utf-8") as f:
+            json.dump({instance_name: result}, f, ensure_ascii=False)
+
+    def request_timeout(self) -> float:
+        """
+        Seconds after which a check on a server is abandoned: the most solver time the check can
+        take, plus :data:`REQUEST_MARGIN`. The binary check makes three queries, and the
+        approximate checker four rounds per permutation of at most
+        :data:`MAX_APPROX_CONJUNCTS` queries each.
+        """
+        timeout = REQUEST_MARGIN
+        if self.mode in ("skipApprox", "full"):
+            timeout += 3 * self.equiv_solver_time
+        if self.mode in ("onlyApprox", "full"):
+            timeout += (
+                4 * self.n_permutations * MAX_APPROX_CONJUNCTS * self.approx_solver_time
+            )
+            if self.chooser_budget_ms is not None:
+                timeout += self.chooser_budget_ms / 1000
+        return timeout
+
+    @staticmethod
+    def _elapsed_ms(start: float) -> int:
+        return round((time.monotonic() - start) * 1000)
+
+    @classmethod
+    def _add_wrapper_timings(cls, result: dict, start: float) -> None:
+        timings = result.setdefault("timings", {})
+        checker = cls._elapsed_ms(start)
+        measured = sum(timings.get(phase, 0) for phase in TOP_LEVEL_PHASES)
+        timings["checker"] = checker
+        timings["startup"] = max(0, checker - measured)
+
+    def _check_server(
+        self, ground: str, test: str, args: list[str], output_json_file: str
+    ) -> dict | None:
+        with self._servers.server() as server:
+            response = server.request(
+                {"kind": "check", "ground": ground, "test": test, "args": args},
+                timeout=self.request_timeout(),
+            )
+
+        log = remove_error_source(response["log"].strip())
+        error = remove_error_source((response["error"] or "").strip())
+        if log:
+            print(log)
+        if error:
+            print(error)
+
+        if "error" in log or error:
+            return None
+        return self._read_result(output_json_file, args[0])
+
+    def _check_subprocess(
+        self, ground: str, test: str, args: list[str], output_json_file: str
+    ) -> dict | None:
+        instance_name = args[0]
+        tmp_file = os.path.join(self.tmp_path, instance_name + ".lean")
+        with open(tmp_file, "w") as file:
+            lean_file = format_lean_checker_file(ground, test)
+            file.write(lean_file)
+
+        command = ["lake", "env", "lean", "--run", tmp_file, *args]
 
         process: Popen[str] | None = None
         try:
@@ -69,6 +277,8 @@ class Checker:
                 text=True,
                 encoding="utf-8",
             ) as process:
+                with self._lock:
+                    self._active_pgids.add(process.pid)
                 stdout, stderr = map(
                     lambda x: remove_error_source(x.strip()), process.communicate()
                 )
@@ -79,21 +289,17 @@ class Checker:
                     print(stderr)
 
                 if "error" in stdout or stderr:
-                    return False
+                    return None
 
-                try:
-                    with open(output_json_file, "r", encoding="utf-8") as f:
-                        data = json.load(f)
-                    return data[instance_name]["binary_check"] == "equiv"
-                except (FileNotFoundError, json.JSONDecodeError, KeyError) as e:
-                    print(f"⚠️  Failed to parse output file: {e}")
-                    return False
+                return self._read_result(output_json_file, instance_name)
         except (SubprocessError, OSError) as e:
             print(f"⚠️  Failed to execute checker: {e}")
-            return False
+            return None
         finally:
             if process and process.pid:
                 kill_process_group(process.pid)
+                with self._lock:
+                    self._active_pgids.discard(process.pid)
 
                 # allow up to 2 s to consume pipes and reap process
                 try:
@@ -102,3 +308,30 @@ class Checker:
                     # if ValueError: communicate() was already called, no problem
                     # if TimeoutExpired: give up to avoid hanging the program
                     pass
+
+    @staticmethod
+    def _read_result(output_json_file: str, instance_name: str) -> dict | None:
+        """
+        Return the E3 result written for ``instance_name``, or ``None`` if it can't be read.
+        """
+        try:
+            with open(output_json_file, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            result = data[instance_name]
+            if "binary_check" not in result:
+                raise KeyError("binary_check")
+            return result
+        except (FileNotFoundError, json.JSONDecodeError, KeyError) as e:
+            print(f"⚠️  Failed to parse output file: {e}")
+            return None
+
+    def terminate(self) -> None:
+        """
+        Kill the process groups of all checks currently in flight.
+        """
+        with self._lock:
+            pgids = list(self._active_pgids)
+        for pgid in pgids:
+            kill_process_group(pgid)
+        if self._servers is not None:
+            self._servers.close()
@@ -0,0 +1,240 @@
+"""
+corpus.py
+
+The theorem statements formalized in ``Book/`` and ``UniGeo/``, and inputs for the permutation
+chooser (``E3/Engine/choosePerms.py``) built from them without running Lean, so that the chooser
+can be tuned and validated offline.
+
+Each statement gives one instance per *variant*. In the ``"perturbed"`` variant, the test
+proposition is the statement itself with its bound variables renamed by a random permutation
+within each sort and quantifier, and its hypotheses shuffled. The expected unification is thus
+known, but is not the identity, and the test is not textually identical to the ground truth. In
+the ``"self"`` variant, the test proposition is the statement itself. Statements are taken from
+the source files, so their layout differs from Lean's pretty-printer; whitespace is normalized.
+
+Synthetic statements with a given number of points, lines and circles can be generated as
+well, to measure how the chooser scales.
+
+Usage
+-----
+.. code-block:: python
+
+    from E3.corpus import instances, synthetic_instance
+
+    for name, props in instances("UniGeo", variant="self"):
+        ...
+    name, props = synthetic_instance(8, 3, 1)
+"""
+
+import os
+import random
+import re
+
+from collections.abc import Iterator
+from typing import Final
+
+from E3.utils import ROOT_DIR
+
+DATASETS: Final[tuple[str, ...]] = ("Book", "UniGeo")
+VARIANTS: Final[tuple[str, ...]] = ("perturbed", "self")
+
+THEOREM_PATTERN: Final = re.compile(r"^theorem\s+(\S+)\s*:(.*?)\s:=", re.M | re.S)
+BINDER_PATTERN: Final = re.compile(r"([∀∃])([^,]*),")
+SORTS: Final[dict[str, str]] = {"Point": "points", "Line": "lines", "Circle": "circles"}
+QUANTIFIERS: Final[dict[str, str]] = {"∀": "univ", "∃": "exist"}
+
+
+def normalize(text: str) -> str:
+    return " ".join(text.split())
+
+
+def statements(dataset: str) -> Iterator[tuple[str, str]]:
+    """
+    Yield the name (``<file>:<theorem>``) and whitespace-normalized statement of every theorem
+    in ``dataset``, in a fixed order.
+    """
+    root = os.path.join(ROOT_DIR, dataset)
+    for directory, subdirectories, files in os.walk(root):
+        subdirectories.sort()
+        for file in sorted(files):
+            if not file.endswith(".lean"):
+                continue
+            path = os.path.join(directory, file)
+            with open(path, "r", encoding="utf-8") as f:
+                source = f.read()
+            for match in THEOREM_PATTERN.finditer(source):
+                name = f"{os.path.relpath(path, ROOT_DIR)}:{match.group(1)}"
+                yield name, normalize(match.group(2))
+
+
+def bound_names(statement: str) -> dict[str, dict[str, list[str]]]:
+    """
+    Return the variables bound by the quantifiers of ``statement``, in the format of the
+    ``ground_names`` of a chooser input. Variables of other sorts are left out.
+    """
+    names = {q: {sort: [] for sort in SORTS.values()} for q in QUANTIFIERS.values()}
+    for quantifier, binders in BINDER_PATTERN.findall(statement):
+        groups = re.findall(r"\(([^():]*):\s*(\w+)\)", binders)
+        if not groups:
+            groups = re.findall(r"^([^():]*):\s*(\w+)\s*$", binders)
+        for variables, sort in groups:
+            if sort in SORTS:
+                names[QUANTIFIERS[quantifier]][SORTS[sort]] += variables.split()
+    return names
+
+
+def rename(text: str, mapping: dict[str, str]) -> str:
+    """
+    Simultaneously replace each variable of ``text`` by its image under ``mapping``, leaving
+    longer identifiers and field names (such as ``onLine`` in ``a.onLine``) alone.
+    """
+    if not mapping:
+        return text
+    alternatives = "|".join(map(re.escape, sorted(mapping, key=len, reverse=True)))
+    pattern = re.compile(rf"(?<![\w.'])({alternatives})(?![\w'])")
+    return pattern.sub(lambda m: mapping[m.group(0)], text)
+
+
+def split_top_level(text: str, separator: str) -> list[str]:
+    """
+    Split ``text`` at the occurrences of ``separator`` outside parentheses.
+    """
+    parts, depth, start, i = [], 0, 0, 0
+    while i < len(text):
+        if text[i] == "(":
+            depth += 1
+        elif text[i] == ")":
+            depth -= 1
+        elif depth == 0 and text.startswith(separator, i):
+            parts.append(text[start:i])
+            start = i = i + len(separator)
+            continue
+        i += 1
+    parts.append(text[start:])
+    return parts
+
+
+def shuffle_hypotheses(statement: str, rng: random.Random) -> str:
+    """
+    Shuffle the conjuncts of the hypothesis of ``statement``, i.e. of the part between its
+    leading binder and its first top-level ``→``.
+    """
+    binder = BINDER_PATTERN.match(statement)
+    if binder is None:
+        return statement
+    head, body = statement[: binder.end()], statement[binder.end() :]
+    parts = split_top_level(body, " → ")
+    if len(parts) < 2:
+        return statement
+    conjuncts = [c.strip() for c in split_top_level(parts[0], " ∧ ")]
+    rng.shuffle(conjuncts)
+    return head + " " + " → ".join([" ∧ ".join(conjuncts), *parts[1:]])
+
+
+def chooser_input(ground: str, test: str) -> dict:
+    """
+    Build the input of ``choosePerms.py`` for unifying the bound variables of ``test`` with
+    those of ``ground``, as E3 writes it.
+    """
+    test_names = bound_names(test)
+    guard = {
+        name: "grd_" + name
+        for sorts in test_names.values()
+        for names in sorts.values()
+        for name in names
+    }
+    return {
+        "ground": ground,
+        "guarded_test": rename(test, guard),
+        "guarded_test_names": {
+            q: {sort: [guard[n] for n in names] for sort, names in sorts.items()}
+            for q, sorts in test_names.items()
+        },
+        "ground_names": bound_names(ground),
+    }
+
+
+def perturb(statement: str, rng: random.Random) -> str:
+    """
+    Rename the bound variables of ``statement`` by a random permutation within each sort and
+    quantifier, and shuffle its hypotheses.
+    """
+    mapping = {}
+    for sorts in bound_names(statement).values():
+        for variables in sorts.values():
+            mapping.update(zip(variables, rng.sample(variables, len(variables))))
+    return shuffle_hypotheses(rename(statement, mapping), rng)
+
+
+def make_instance(name: str, statement: str, seed: int, variant: str) -> dict:
+    """
+    Build the chooser input of the ``variant`` of ``statement``.
+    """
+    if variant == "self":
+        return chooser_input(statement, statement)
+    if variant == "perturbed":
+        return chooser_input(
+            statement, perturb(statement, random.Random(f"{seed}:{name}"))
+        )
+    raise ValueError(f"Unknown instance variant: {variant}")
+
+
+def instances(
+    dataset: str, seed: int = 0, variant: str = "perturbed"
+) -> Iterator[tuple[str, dict]]:
+    """
+    Yield the name and chooser input of an instance for every statement of ``dataset`` that
+    binds geometric variables. The instances only depend on ``seed`` and the statements.
+    """
+    for name, statement in statements(dataset):
+        if any(v for sorts in bound_names(statement).values() for v in sorts.values()):
+            yield name, make_instance(name, statement, seed, variant)
+
+
+def synthetic_statement(points: int, lines: int, circles: int, seed: int = 0) -> str:
+    """
+    Generate a statement in the style of the corpus that universally quantifies over
+    ``points`` points (at least 3), ``lines`` lines and ``circles`` circles, with one
+    hypothesis per line and circle, a few betweenness hypotheses and a segment equality as
+    conclusion.
+    """
+    if points < 3:
+        raise ValueError("synthetic statements need at least 3 points")
+    rng = random.Random(f"{seed}:{points}:{lines}:{circles}")
+    ps = [f"p{i}" for i in range(points)]
+    ls = [f"L{i}" for i in range(lines)]
+    cs = [f"C{i}" for i in range(circles)]
+
+    hypotheses = []
+    for line in ls:
+        a, b = rng.sample(ps, 2)
+        hypotheses.append(f"distinctPointsOnLine {a} {b} {line}")
+    for circle in cs:
+        a, b = rng.sample(ps, 2)
+        hypotheses.append(f"{a}.onCircle {circle} ∧ {b}.insideCircle {circle}")
+    for _ in range(max(1, points // 3)):
+        a, b, c = rng.sample(ps, 3)
+        hypotheses.append(f"between {a} {b} {c}")
+    a, b = rng.sample(ps, 2)
+    c, d = rng.sample(ps, 2)
+
+    binders = [f"({' '.join(ps)} : Point)"]
+    if ls:
+        binders.append(f"({' '.join(ls)} : Line)")
+    if cs:
+        binders.append(f"({' '.join(cs)} : Circle)")
+    return (
+        f"∀ {' '.join(binders)}, {' ∧ '.join(hypotheses)} → |({a}─{b})| = |({c}─{d})|"
+    )
+
+
+def synthetic_instance(
+    points: int, lines: int, circles: int, seed: int = 0, variant: str = "perturbed"
+) -> tuple[str, dict]:
+    """
+    Return the name and chooser input of an instance built from a synthetic statement (see
+    :func:`synthetic_statement`).
+    """
+    name = f"synthetic:{points}p{lines}l{circles}c"
+    statement = synthetic_statement(points, lines, circles, seed)
+    return name, make_instance(name, statement, seed, variant)
@@ -0,0 +1,69 @@
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Iterator, NamedTuple
+
+from E3.checker import Checker
+
+
+class CheckJob(NamedTuple):
+    checker: Checker
+    ground: str
+    test: str
+    instance_name: str
+
+
+class CheckerPool:
+    """
+    Run E3 checks concurrently, keeping at most ``jobs`` Lean checker process groups in flight.
+
+    Each check already runs in its own process group (see :class:`E3.checker.Checker`), so the
+    scheduler only needs threads to wait on them. If the pool is interrupted, the process
+    groups of all in-flight checks are killed with :func:`E3.utils.kill_process_group`.
+    """
+
+    def __init__(self, jobs: int = 1):
+        if jobs < 1:
+            raise ValueError(f"jobs must be positive, got {jobs}")
+        self.jobs = jobs
+
+    def run(self, queue: list[CheckJob]) -> Iterator[tuple[CheckJob, bool | Exception]]:
+        """
+        Check every job in ``queue`` and yield ``(job, result)`` pairs as they complete.
+        ``result`` is the return value of :meth:`Checker.check`, or the exception it raised.
+        """
+        checkers = {id(job.checker): job.checker for job in queue}
+        pending = iter(queue)
+        in_flight: dict[Future, CheckJob] = {}
+
+        with ThreadPoolExecutor(max_workers=self.jobs) as executor:
+            try:
+                for job in pending:
+                    in_flight[executor.submit(self._check, job)] = job
+                    if len(in_flight) < self.jobs:
+                        continue
+
+                    # block until a slot frees up before submitting more work
+                    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        yield in_flight.pop(future), self._result(future)
+
+                while in_flight:
+                    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        yield in_flight.pop(future), self._result(future)
+            except BaseException:
+                for future in in_flight:
+                    future.cancel()
+                for checker in checkers.values():
+                    checker.terminate()
+                raise
+
+    @staticmethod
+    def _check(job: CheckJob) -> bool:
+        return job.checker.check(job.ground, job.test, job.instance_name)
+
+    @staticmethod
+    def _result(future: Future) -> bool | Exception:
+        try:
+            return future.result()
+        except Exception as e:
+            return e
@@ -0,0 +1,168 @@
+import json
+import queue
+import threading
+
+from contextlib import contextmanager
+from subprocess import Popen, PIPE, TimeoutExpired
+from typing import Iterator
+
+from E3.utils import ROOT_DIR, kill_process_group
+
+
+SERVER_FILE = "E3/Server.lean"
+
+
+class LeanServerError(Exception):
+    """
+    Raised when the E3 server crashes, times out, or replies with something unexpected.
+    """
+
+
+class LeanServer:
+    """
+    Client for a long-lived E3 server (see ``E3/Engine/Server.lean``).
+
+    The server imports ``SystemE``, ``UniGeo.Relations`` and ``E3`` once at startup, and then
+    answers requests over stdin/stdout, one JSON object per line. A server handles one request at
+    a time; use :class:`ServerPool` to share servers between threads.
+    """
+
+    def __init__(self, startup_timeout: float | None = 600):
+        self.startup_timeout = startup_timeout
+        self._process: Popen[str] | None = None
+        self._lines: queue.Queue[str | None] = queue.Queue()
+        self._stderr: list[str] = []
+        self._next_id = 0
+
+    @property
+    def alive(self) -> bool:
+        return self._process is not None and self._process.poll() is None
+
+    def start(self) -> None:
+        self._process = Popen(
+            ["lake", "env", "lean", "--run", SERVER_FILE],
+            stdin=PIPE,
+            stdout=PIPE,
+            stderr=PIPE,
+            cwd=ROOT_DIR,
+            start_new_session=True,
+            text=True,
+            encoding="utf-8",
+        )
+        self._lines = queue.Queue()
+        self._stderr = []
+        # drain both pipes in the background so that the server never blocks on a full pipe
+        threading.Thread(
+            target=self._read_stdout, args=(self._process, self._lines), daemon=True
+        ).start()
+        threading.Thread(
+            target=self._read_stderr, args=(self._process, self._stderr), daemon=True
+        ).start()
+
+    @staticmethod
+    def _read_stdout(process: Popen[str], lines: "queue.Queue[str | None]") -> None:
+        for line in process.stdout:
+            lines.put(line)
+        # EOF: the server exited
+        lines.put(None)
+
+    @staticmethod
+    def _read_stderr(process: Popen[str], lines: list[str]) -> None:
+        for line in process.stderr:
+            lines.append(line)
+
+    def request(self, payload: dict, timeout: float | None = None) -> dict:
+        """
+        Send ``payload`` to the server and return its response.
+        Lines printed by E3 while handling the request are returned under ``"log"``.
+
+        :raises LeanServerError: if the server dies or does not answer within ``timeout`` seconds
+        """
+        if not self.alive:
+            self.start()
+            # the first request also waits for the environment to be imported
+            if timeout is not None:
+                timeout = (
+                    timeout + self.startup_timeout
+                    if self.startup_timeout is not None
+                    else None
+                )
+
+        request_id = self._next_id
+        self._next_id += 1
+        try:
+            self._process.stdin.write(
+                json.dumps({"id": request_id, **payload}, ensure_ascii=False) + "\n"
+            )
+            self._process.stdin.flush()
+        except (BrokenPipeError, OSError) as e:
+            self.close()
+            raise LeanServerError(f"Failed to send request: {e}") from e
+
+        log = []
+        while True:
+            try:
+                line = self._lines.get(timeout=timeout)
+            except queue.Empty:
+                self.close()
+                raise LeanServerError(f"No response within {timeout} seconds")
+
+            if line is None:
+                self.close()
+                stderr = "".join(self._stderr).strip()
+                raise LeanServerError(f"Server exited unexpectedly: {stderr}")
+
+            try:
+                response = json.loads(line)
+            except json.JSONDecodeError:
+                log.append(line.rstrip("\n"))
+                continue
+
+            if isinstance(response, dict) and response.get("id") == request_id:
+                response["log"] = "\n".join(log)
+                return response
+            log.append(line.rstrip("\n"))
+
+    def close(self) -> None:
+        if self._process is None:
+            return
+        process, self._process = self._process, None
+        kill_process_group(process.pid)
+
+        # allow up to 2 s to reap the process; its pipes are drained by the reader threads
+        try:
+            process.wait(timeout=2)
+        except TimeoutExpired:
+            pass
+
+
+class ServerPool:
+    """
+    A set of :class:`LeanServer` instances, started on demand so that each concurrent caller
+    gets a server of its own.
+    """
+
+    def __init__(self):
+        self._idle: list[LeanServer] = []
+        self._busy: set[LeanServer] = set()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def server(self) -> Iterator[LeanServer]:
+        with self._lock:
+            server = self._idle.pop() if self._idle else LeanServer()
+            self._busy.add(server)
+        try:
+            yield server
+        finally:
+            with self._lock:
+                self._busy.discard(server)
+                # servers that crashed are restarted on their next request
+                self._idle.append(server)
+
+    def close(self) -> None:
+        with self._lock:
+            servers = self._idle + list(self._busy)
+            self._idle = []
+        for server in servers:
+            server.close()
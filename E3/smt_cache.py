@@ -0,0 +1,196 @@
+"""
+smt_cache.py
+
+Reader and writer of the on-disk cache of SMT query results that SystemE keeps when the
+``systemE.cacheDir`` option is set (``smtCache=<dir>`` in E3, see ``SystemE/Meta/Smt/Cache.lean``).
+
+An entry is keyed by the 64-bit FNV-1a hash of the key of the background theory of the query and
+of its *goal*, i.e. the declarations and assertions checked on top of the theory. The key of a theory
+is the hash of the cache version and of the theory's SMT-LIB text, so that changing the theory
+invalidates its entries. Entries are stored in ``<dir>/<first 2 hex digits>/<16 hex digits>``. Their
+first line holds ``sat``, ``unsat``, or ``unknown <timeout>``: an ``unknown`` result is only reused for
+queries given at most as many seconds. The rest of the entry is the key of the theory and the goal,
+which a lookup compares with its own, so that two queries with the same key never share a result.
+The layout and the keys must stay in sync with the Lean side.
+
+Usage
+-----
+.. code-block:: console
+
+    $ python -m E3.smt_cache stats
+    $ python -m E3.smt_cache prune --unknown
+"""
+
+import argparse
+import os
+import tempfile
+
+from collections.abc import Iterator
+from typing import Final
+
+from E3.utils import ROOT_DIR
+
+DEFAULT_SMT_CACHE_DIR: Final[str] = os.path.join(ROOT_DIR, "tmp", "cache", "smt")
+# `SystemE.Cache.version`
+CACHE_VERSION: Final[int] = 3
+VERDICTS: Final[tuple[str, ...]] = ("sat", "unsat", "unknown")
+
+FNV_OFFSET: Final[int] = 0xCBF29CE484222325
+FNV_PRIME: Final[int] = 0x100000001B3
+MASK: Final[int] = 0xFFFFFFFFFFFFFFFF
+
+
+def fnv1a64(data: bytes) -> int:
+    h = FNV_OFFSET
+    for b in data:
+        h = ((h ^ b) * FNV_PRIME) & MASK
+    return h
+
+
+def hex64(h: int) -> str:
+    return f"{h:016x}"
+
+
+def normalize_goal(goal: str) -> str:
+    """
+    Return ``goal`` as the Lean side keys and stores it, without a trailing ``(check-sat)``.
+    """
+    goal = goal.rstrip()
+    if goal.endswith("(check-sat)"):
+        goal = goal[: -len("(check-sat)")].rstrip()
+    return goal
+
+
+def theory_key(theory: str) -> str:
+    """
+    Return the key of a background theory given by its SMT-LIB text, as
+    ``SystemE.Cache.Theory.of`` computes it.
+    """
+    return hex64(fnv1a64(f"{CACHE_VERSION}\n{theory.rstrip()}".encode("utf-8")))
+
+
+def query_key(theory: str, goal: str) -> str:
+    """
+    Return the key of the query of ``goal`` on top of the theory with key ``theory``, as
+    ``SystemE.Cache.key`` computes it. A trailing ``(check-sat)`` is ignored.
+    """
+    return hex64(fnv1a64(f"{theory}\n{normalize_goal(goal)}".encode("utf-8")))
+
+
+class SmtCache:
+    def __init__(self, path: str = DEFAULT_SMT_CACHE_DIR):
+        self.path = path
+
+    def _file(self, key: str) -> str:
+        return os.path.join(self.path, key[:2], key)
+
+    def get(self, theory: str, goal: str, timeout: int) -> str | None:
+        """
+        Return the cached verdict (``"sat"``, ``"unsat"`` or ``"unknown"``) of ``goal`` on top
+        of the theory with key ``theory`` given ``timeout`` seconds, if any.
+        """
+        try:
+            with open(self._file(query_key(theory, goal)), "r", encoding="utf-8") as f:
+                verdict, _, stored = f.read().partition("\n")
+        except FileNotFoundError:
+            return None
+        if stored != f"{theory}\n{normalize_goal(goal)}":
+            return None
+        fields = verdict.split()
+        if fields in (["sat"], ["unsat"]):
+            return fields[0]
+        if len(fields) == 2 and fields[0] == "unknown" and timeout <= int(fields[1]):
+            return "unknown"
+        return None
+
+    def put(self, theory: str, goal: str, timeout: int, verdict: str) -> None:
+        if verdict not in VERDICTS:
+            raise ValueError(f"Unknown SMT verdict: {verdict}")
+        file = self._file(query_key(theory, goal))
+        os.makedirs(os.path.dirname(file), exist_ok=True)
+        line = verdict if verdict != "unknown" else f"unknown {timeout}"
+        fd, tmp = tempfile.mkstemp(
+            dir=os.path.dirname(file), prefix=os.path.basename(file), suffix=".tmp"
+        )
+        with open(fd, "w", encoding="utf-8") as f:
+            f.write(f"{line}\n{theory}\n{normalize_goal(goal)}")
+        os.replace(tmp, file)
+
+    def entries(self) -> Iterator[tuple[str, str]]:
+        """
+        Yield the path and verdict line of every entry.
+        """
+        if not os.path.isdir(self.path):
+            return
+        for shard in sorted(os.listdir(self.path)):
+            directory = os.path.join(self.path, shard)
+            if not os.path.isdir(directory):
+                continue
+            for name in sorted(os.listdir(directory)):
+                if name.endswith(".tmp"):
+                    continue
+                file = os.path.join(directory, name)
+                with open(file, "r", encoding="utf-8") as f:
+                    yield file, f.readline().strip()
+
+    def stats(self) -> dict[str, int]:
+        """
+        Return the number of entries of each verdict.
+        """
+        stats = {verdict: 0 for verdict in VERDICTS}
+        for _, content in self.entries():
+            verdict = content.split()[0] if content else ""
+            if verdict in stats:
+                stats[verdict] += 1
+        return stats
+
+    def prune(self, unknown_only: bool = False) -> int:
+        """
+        Delete entries, or only those of ``unknown`` results (which a larger timeout may decide).
+
+        :returns: the number of entries deleted
+        """
+        deleted = 0
+        for file, content in list(self.entries()):
+            if not unknown_only or content.startswith("unknown"):
+                os.remove(file)
+                deleted += 1
+        return deleted
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Inspect and prune the SMT query cache."
+    )
+    parser.add_argument(
+        "--path",
+        type=str,
+        default=DEFAULT_SMT_CACHE_DIR,
+        help="Path to the cache directory (default: %(default)s)",
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser(
+        "stats", help="Print the number of cached results of each verdict"
+    )
+    prune = subparsers.add_parser("prune", help="Delete cached results")
+    prune.add_argument(
+        "--unknown",
+        action="store_true",
+        help="Only delete unknown results, e.g. after raising the solver time budget",
+    )
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    cache = SmtCache(args.path)
+
+    if args.command == "stats":
+        for verdict, count in cache.stats().items():
+            print(f"{verdict:<8} {count:>8} entries")
+    elif args.command == "prune":
+        print(f"Deleted {cache.prune(args.unknown)} entries")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,279 @@
+"""
+store.py
+
+Append-only store of the outputs of autoformalization and evaluation runs, as an alternative to
+writing thousands of small files under ``result/``.
+
+Each record is the content of a file of the usual layout (e.g. the statement predicted for
+``result/statement/Book/text-only/0shot/Parallel/1.json``, or the E3 result for
+``result/equivalence/...``) under its path relative to the repository, along with a *kind*
+(``statement``, ``proof`` or ``equivalence``). Writing a path again appends a new record, and
+reads return the latest one, so earlier outputs remain available until ``compact``.
+
+The store is a single SQLite database in WAL mode, which several processes and threads
+(``autoformalize.py``, ``evaluate.py`` and the checkers of a :class:`CheckerPool`) can write to
+concurrently. ``export`` writes the latest records back to the per-file layout, and ``import``
+does the reverse.
+
+Usage
+-----
+.. code-block:: console
+
+    $ python -m E3.store stats
+    $ python -m E3.store import result/statement --kind statement
+    $ python -m E3.store export --prefix result/equivalence/Book
+    $ python -m E3.store compact
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+import time
+
+from collections.abc import Iterator
+from contextlib import closing
+from typing import Final
+
+from E3.utils import ROOT_DIR
+
+DEFAULT_STORE_PATH: Final[str] = os.path.join(
+    ROOT_DIR, "tmp", "store", "results.sqlite"
+)
+KINDS: Final[tuple[str, ...]] = ("statement", "proof", "equivalence")
+
+
+def store_key(path: str) -> str:
+    """
+    Return the key of the file at ``path``: its path relative to the repository, or its
+    absolute path if it is outside of it.
+    """
+    path = os.path.abspath(path)
+    relative = os.path.relpath(path, ROOT_DIR)
+    if relative == os.pardir or relative.startswith(os.pardir + os.sep):
+        return path
+    return relative
+
+
+class ResultStore:
+    def __init__(self, path: str = DEFAULT_STORE_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with closing(self._connect()) as db, db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(
+                """
+                CREATE TABLE IF NOT EXISTS records (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    key TEXT NOT NULL,
+                    kind TEXT NOT NULL,
+                    content TEXT NOT NULL,
+                    created REAL NOT NULL
+                )
+                """
+            )
+            db.execute("CREATE INDEX IF NOT EXISTS records_key ON records (key, id)")
+
+    def _connect(self) -> sqlite3.Connection:
+        # a connection per operation keeps the store safe to share between threads
+        return sqlite3.connect(self.path, timeout=30)
+
+    def put(self, kind: str, path: str, content: str) -> None:
+        """
+        Record ``content`` as the latest content of the file at ``path``.
+        """
+        if kind not in KINDS:
+            raise ValueError(f"Unknown record kind: {kind}")
+        with closing(self._connect()) as db, db:
+            db.execute(
+                "INSERT INTO records (key, kind, content, created) VALUES (?, ?, ?, ?)",
+                (store_key(path), kind, content, time.time()),
+            )
+
+    def put_json(self, kind: str, path: str, data) -> None:
+        self.put(kind, path, json.dumps(data, ensure_ascii=False))
+
+    def get(self, path: str) -> str | None:
+        """
+        Return the latest content recorded for the file at ``path``, if any.
+        """
+        with closing(self._connect()) as db:
+            row = db.execute(
+                "SELECT content FROM records WHERE key = ? ORDER BY id DESC LIMIT 1",
+                (store_key(path),),
+            ).fetchone()
+        return row[0] if row is not None else None
+
+    def get_json(self, path: str):
+        content = self.get(path)
+        return json.loads(content) if content is not None else None
+
+    def has(self, path: str) -> bool:
+        with closing(self._connect()) as db:
+            row = db.execute(
+                "SELECT 1 FROM records WHERE key = ? LIMIT 1", (store_key(path),)
+            ).fetchone()
+        return row is not None
+
+    def latest(
+        self, prefix: str = "", kind: str | None = None
+    ) -> Iterator[tuple[str, str, str]]:
+        """
+        Yield the key, kind and latest content of every file under the directory ``prefix``
+        (if given), optionally only of one ``kind``.
+        """
+        query = "SELECT key, kind, content FROM records WHERE id IN (SELECT MAX(id) FROM records"
+        params: list = []
+        if prefix:
+            # all keys under `prefix/` sort between `prefix/` and `prefix0`
+            prefix = store_key(prefix)
+            query += " WHERE key >= ? AND key < ?"
+            params += [prefix + os.sep, prefix + chr(ord(os.sep) + 1)]
+        query += " GROUP BY key)"
+        if kind is not None:
+            query += " AND kind = ?"
+            params.append(kind)
+        with closing(self._connect()) as db:
+            yield from db.execute(query + " ORDER BY key", params).fetchall()
+
+    def export(
+        self, directory: str = ROOT_DIR, prefix: str = "", kind: str | None = None
+    ) -> int:
+        """
+        Write the latest content of every file to ``directory``/``key``, i.e. back to the
+        per-file layout when ``directory`` is the repository. Files recorded from outside the
+        repository have absolute keys, and are only exported (to their original location) when
+        ``directory`` is the repository.
+
+        :returns: the number of files written
+        """
+        to_repository = os.path.abspath(directory) == ROOT_DIR
+        written = 0
+        for key, _, content in self.latest(prefix, kind):
+            if os.path.isabs(key) and not to_repository:
+                print(f"⚠️  Skipping {key}: recorded from outside the repository")
+                continue
+            file = os.path.join(directory, key)
+            os.makedirs(os.path.dirname(file), exist_ok=True)
+            with open(file, "w", encoding="utf-8") as f:
+                f.write(content)
+            written += 1
+        return written
+
+    def import_files(
+        self, directory: str, kind: str, extension: str | None = None
+    ) -> int:
+        """
+        Record the content of every file under ``directory`` (with the given ``extension``,
+        if any) that differs from its latest record.
+
+        :returns: the number of files recorded
+        """
+        imported = 0
+        for root, _, names in os.walk(directory):
+            for name in sorted(names):
+                if extension is not None and not name.endswith(extension):
+                    continue
+                file = os.path.join(root, name)
+                with open(file, "r", encoding="utf-8") as f:
+                    content = f.read()
+                if self.get(file) != content:
+                    self.put(kind, file, content)
+                    imported += 1
+        return imported
+
+    def compact(self) -> int:
+        """
+        Delete all but the latest record of each file.
+
+        :returns: the number of records deleted
+        """
+        with closing(self._connect()) as db, db:
+            cursor = db.execute(
+                "DELETE FROM records WHERE id NOT IN (SELECT MAX(id) FROM records GROUP BY key)"
+            )
+            return cursor.rowcount
+
+    def stats(self) -> dict[str, tuple[int, int]]:
+        """
+        Return the number of files and of records of each kind.
+        """
+        with closing(self._connect()) as db:
+            rows = db.execute(
+                "SELECT kind, COUNT(DISTINCT key), COUNT(*) FROM records GROUP BY kind"
+            ).fetchall()
+        stats = {kind: (0, 0) for kind in KINDS}
+        stats.update({kind: (files, records) for kind, files, records in rows})
+        return stats
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Inspect, import and export the results store."
+    )
+    parser.add_argument(
+        "--path",
+        type=str,
+        default=DEFAULT_STORE_PATH,
+        help="Path to the store database (default: %(default)s)",
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser(
+        "stats", help="Print the number of files and records of each kind"
+    )
+    export = subparsers.add_parser(
+        "export", help="Write the stored files to the per-file layout"
+    )
+    export.add_argument(
+        "--directory",
+        type=str,
+        default=ROOT_DIR,
+        help="Directory the paths of the files are relative to (default: %(default)s)",
+    )
+    export.add_argument(
+        "--prefix",
+        type=str,
+        default="",
+        help="Only export the files under this directory",
+    )
+    export.add_argument(
+        "--kind", choices=KINDS, default=None, help="Only export files of this kind"
+    )
+    import_ = subparsers.add_parser(
+        "import", help="Record the files of a per-file layout"
+    )
+    import_.add_argument("directory", type=str, help="Directory of files to record")
+    import_.add_argument(
+        "--kind", choices=KINDS, required=True, help="Kind of the files"
+    )
+    import_.add_argument(
+        "--extension",
+        type=str,
+        default=None,
+        help="Only record files with this extension",
+    )
+    subparsers.add_parser(
+        "compact", help="Delete all but the latest record of each file"
+    )
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    store = ResultStore(args.path)
+
+    if args.command == "stats":
+        for kind, (files, records) in store.stats().items():
+            print(f"{kind:<12} {files:>8} files {records:>8} records")
+    elif args.command == "export":
+        print(f"Exported {store.export(args.directory, args.prefix, args.kind)} files")
+    elif args.command == "import":
+        print(
+            f"Imported {store.import_files(args.directory, args.kind, args.extension)} files"
+        )
+    elif args.command == "compact":
+        print(f"Deleted {store.compact()} records")
+
+
+if __name__ == "__main__":
+    main()
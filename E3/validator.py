@@ -1,18 +1,58 @@
 import os
 
+from E3.server import LeanServerError, ServerPool
 from E3.utils import ROOT_DIR, format_test_file, remove_error_source, kill_process_group
 from subprocess import Popen, PIPE, SubprocessError, TimeoutExpired
 
+# seconds a server may take to elaborate an expression (on top of its startup)
+VALIDATION_TIMEOUT = 120
+
 
 class Validator:
-    def __init__(self, tmp_path=os.path.join(ROOT_DIR, "tmp", "validate")):
+    def __init__(
+        self,
+        tmp_path=os.path.join(ROOT_DIR, "tmp", "validate"),
+        backend="subprocess",
+    ):
+        """
+        :param backend: ``"subprocess"`` to validate each expression in a fresh ``lake env lean``
+            process, or ``"server"`` to reuse long-lived E3 servers (see :mod:`E3.server`),
+            falling back to a subprocess if a server crashes or does not answer within
+            ``VALIDATION_TIMEOUT`` seconds
+        """
+        if backend not in ("subprocess", "server"):
+            raise ValueError(f"Unknown validator backend: {backend}")
+
         self.tmp_path = tmp_path
         os.makedirs(self.tmp_path, exist_ok=True)
+        self.backend = backend
+        self._servers = ServerPool() if backend == "server" else None
 
     def validate(self, expression: str, instance_name: str) -> str | None:
         """
         Return ``None`` if validation succeeds. Otherwise, return a cleaned version of the error or warning that can be passed back to the model.
         """
+        if self._servers is not None:
+            try:
+                return self._validate_server(expression)
+            except LeanServerError as e:
+                print(f"⚠️  E3 server failed, falling back to subprocess: {e}")
+
+        return self._validate_subprocess(expression, instance_name)
+
+    def _validate_server(self, expression: str) -> str | None:
+        with self._servers.server() as server:
+            response = server.request(
+                {"kind": "validate", "test": expression}, timeout=VALIDATION_TIMEOUT
+            )
+
+        for message in (response["log"], response["output"], response["error"]):
+            message = remove_error_source((message or "").strip())
+            if message:
+                return message
+        return None
+
+    def _validate_subprocess(self, expression: str, instance_name: str) -> str | None:
         tmp_file = os.path.join(self.tmp_path, instance_name + ".lean")
         os.makedirs(os.path.dirname(tmp_file), exist_ok=True)
 
@@ -21,6 +61,7 @@ class Validator:
             file.write(lean_file)
 
         command = ["lake", "env", "lean", "--run", tmp_file]
+        process: Popen[str] | None = None
         try:
             with Popen(
                 command,
@@ -60,3 +101,10 @@ class Validator:
                     # if ValueError: communicate() was already called, no problem
                     # if TimeoutExpired: give up to avoid hanging the program
                     pass
+
+    def close(self) -> None:
+        """
+        Shut down any E3 servers started by this validator.
+        """
+        if self._servers is not None:
+            self._servers.close()
@@ -0,0 +1,90 @@
+import Lean
+import Smt.Solver
+
+set_option autoImplicit false
+open Lean Smt Solver
+
+register_option systemE.cacheDir : String := {
+  defValue := ""
+  descr := "Directory in which the results of SMT queries are cached across runs; empty to disable the cache (default: \"\")."
+}
+
+def getCacheDirOption : MetaM String := do
+  return systemE.cacheDir.get (← getOptions)
+
+namespace SystemE.Cache
+
+/-- Bump when the format of cached queries or results changes, to invalidate old entries -/
+def version : Nat := 3
+
+/-- 64-bit FNV-1a hash of the UTF-8 encoding of `s` -/
+def fnv1a (s : String) : UInt64 :=
+  s.toUTF8.foldl (λ h b => (h ^^^ b.toUInt64) * 0x100000001b3) 0xcbf29ce484222325
+
+/-- The 16 hexadecimal digits of `h` -/
+def hex (h : UInt64) : String :=
+  let digits := Nat.toDigits 16 h.toNat
+  String.mk (List.replicate (16 - digits.length) '0' ++ digits)
+
+/--
+  A background theory, with its SMT-LIB text and its key: a hash of the text and of the cache
+  version. Theories are top-level constants (e.g., `euclidBackground`), so that both are computed
+  once rather than for every query.
+-/
+structure Theory where
+  cmds : List Smt.Command
+  text : String
+  key : String
+
+def Theory.of (cmds : List Smt.Command) : Theory :=
+  let text := Command.cmdsAsQuery cmds.reverse
+  ⟨cmds, text, hex (fnv1a s!"{version}\n{text.trimRight}")⟩
+
+/--
+  The key of a query: a hash of the key of its background theory and of its goal, i.e. the
+  declarations and assertions checked on top of the theory (without `(check-sat)`), so that
+  changing the theory invalidates the entries checked against it.
+  Must agree with `query_key` in `E3/smt_cache.py`.
+-/
+def key (theory : Theory) (goal : String) : String :=
+  hex (fnv1a s!"{theory.key}\n{goal.trimRight}")
+
+/-- Entries are spread over 256 subdirectories named after the first two digits of their key -/
+def path (dir key : String) : System.FilePath :=
+  System.FilePath.mk dir / key.take 2 / key
+
+/--
+  Entries hold `sat`, `unsat`, or `unknown <timeout>` on their first line: the latter is only reused
+  for queries given at most the same number of seconds. The rest of the entry is the key of the
+  theory and the goal, which must be equal to those of the query for the entry to be used, so
+  that a collision of keys is a miss. The theory itself is not stored.
+-/
+def lookup (dir : String) (theory : Theory) (goal : String) (timeout : Nat) : IO (Option Result) := do
+  let file := path dir (key theory goal)
+  if !(← file.pathExists) then
+    return none
+  let content ← IO.FS.readFile file
+  let verdict := content.takeWhile (· != '\n')
+  if content.drop (verdict.length + 1) != s!"{theory.key}\n{goal.trimRight}" then
+    return none
+  match verdict.trim.splitOn " " with
+  | ["sat"] => return some .sat
+  | ["unsat"] => return some .unsat
+  | ["unknown", t] => return if timeout ≤ t.toNat! then some .unknown else none
+  | _ => return none
+
+/-- Write an entry, through a temporary file so that concurrent readers never see a partial one -/
+def store (dir : String) (theory : Theory) (goal : String) (timeout : Nat) (result : Result) : IO Unit := do
+  let file := path dir (key theory goal)
+  let verdict := match result with
+    | .sat => "sat"
+    | .unsat => "unsat"
+    | _ => s!"unknown {timeout}"
+  let content := s!"{verdict}\n{theory.key}\n{goal.trimRight}"
+  if let some parent := file.parent then
+    IO.FS.createDirAll parent
+  let tmp := file.withExtension s!"{← IO.Process.getPID}.{← IO.monoNanosNow}.tmp"
+  IO.FS.writeFile tmp content
+  IO.FS.rename tmp file
+
+end SystemE.Cache
@@ -0,0 +1,44 @@
+import Lean
+import Smt.Solver
+import SystemE.Meta.Smt.Cache
+
+set_option autoImplicit false
+open Lean Smt Solver
+
+register_option systemE.captureDir : String := {
+  defValue := ""
+  descr := "Directory in which every SMT query is saved, for offline replay; empty to disable capture (default: \"\")."
+}
+
+def getCaptureDirOption : MetaM String := do
+  return systemE.captureDir.get (← getOptions)
+
+namespace SystemE.Capture
+
+/-- Write `content` to `file` unless it exists, through a temporary file so that readers never see a partial one -/
+def writeOnce (file : System.FilePath) (content : String) : IO Unit := do
+  if !(← file.pathExists) then
+    let tmp := file.withExtension s!"{← IO.Process.getPID}.{← IO.monoNanosNow}.tmp"
+    IO.FS.writeFile tmp content
+    IO.FS.rename tmp file
+
+/--
+  Save `goal` to `<dir>/<key>.smt2` (once per distinct query) and `theory` to
+  `<dir>/theory-<theory key>.smt2` (once per theory), and append a line describing this occurrence of
+  the query to `<dir>/index.jsonl`: its key, the key of its theory, its `tags` (e.g., the instance
+  and phase of E3 that issued it), the timeout, the result and how long it took in milliseconds.
+  Lines are written with a single append, so concurrent processes can share a directory.
+-/
+def record (dir : String) (theory : Cache.Theory) (goal : String) (tags : List (String × String)) (timeout : Nat) (result : Result) (elapsed : Nat) : IO Unit := do
+  IO.FS.createDirAll dir
+  let key := Cache.key theory goal
+  writeOnce (System.FilePath.mk dir / s!"theory-{theory.key}.smt2") s!"{theory.text}\n"
+  writeOnce (System.FilePath.mk dir / s!"{key}.smt2") s!"{goal}\n(check-sat)\n"
+  let entry := Json.mkObj <|
+    [("key", toJson key), ("theory", toJson theory.key)] ++ tags.map (λ ⟨k, v⟩ => (k, toJson v)) ++
+    [("timeout", toJson timeout), ("result", toJson s!"{result}"), ("ms", toJson elapsed)]
+  let index ← IO.FS.Handle.mk (System.FilePath.mk dir / "index.jsonl") .append
+  index.putStr s!"{entry.compress}\n"
+  index.flush
+
+end SystemE.Capture
@@ -0,0 +1,113 @@
+import Lean
+import Smt.Solver
+
+set_option autoImplicit false
+open Lean Smt Solver
+
+register_option systemE.portfolio : Bool := {
+  defValue := false
+  descr := "Race z3 and cvc5 on each SMT query, and take the first `sat` or `unsat` (default: false)."
+}
+
+register_option systemE.portfolioSeeds : Nat := {
+  defValue := 1
+  descr := "Number of random seeds with which each solver of the portfolio is run (default: 1)."
+}
+
+initialize registerTraceClass `systemE.portfolio
+
+def getPortfolioOption : MetaM Bool := do
+  match (← getOptions).getBool `systemE.portfolio with
+  | true => return true
+  | _ => return false
+
+def getPortfolioSeedsOption : MetaM Nat := do
+  match systemE.portfolioSeeds.get? (← getOptions) with
+  | none => return 1
+  | some x => return max x 1
+
+namespace SystemE.Portfolio
+
+inductive Backend
+| z3
+| cvc5
+deriving BEq, Inhabited
+
+instance : ToString Backend := ⟨λ | .z3 => "z3" | .cvc5 => "cvc5"⟩
+
+/-- One solver process of the portfolio -/
+structure Entrant where
+  backend : Backend
+  seed : Nat
+deriving Inhabited
+
+def Entrant.name (e : Entrant) : String :=
+  if e.seed == 0 then toString e.backend else s!"{e.backend} (seed {e.seed})"
+
+/--
+  Both solvers read the query on stdin, and give up after `timeout` seconds.
+  Each runs in a process group of its own, which `Child.kill` kills as a whole.
+-/
+def Entrant.spawnArgs (e : Entrant) (timeout : Nat) : IO.Process.SpawnArgs :=
+  let args := match e.backend with
+    | .z3 => #["-in", "-smt2", s!"-T:{timeout}", s!"smt.random_seed={e.seed}", s!"sat.random_seed={e.seed}"]
+    | .cvc5 => #["--lang", "smt2", s!"--tlimit={timeout * 1000}", s!"--seed={e.seed}"]
+  { cmd := toString e.backend, args := args, stdin := .piped, stdout := .piped, stderr := .null, setsid := true }
+
+/-- z3 and cvc5 with each of the first `seeds` random seeds -/
+def entrants (seeds : Nat) : Array Entrant := Id.run do
+  let mut es := #[]
+  for seed in [:seeds] do
+    for backend in [Backend.z3, .cvc5] do
+      es := es.push ⟨backend, seed⟩
+  return es
+
+/-- The verdict printed by a solver, or `none` if it is neither `sat` nor `unsat` (e.g., a timeout) -/
+def parseResult (out : String) : Option Result :=
+  match out.trim.splitOn "\n" |>.head!.trim with
+  | "sat" => some .sat
+  | "unsat" => some .unsat
+  | _ => none
+
+/--
+  Run `query` on every entrant at once, and return the first `sat` or `unsat` (or `unknown` if
+  none of them decides it), the name of the entrant that returned it, and the time it took in milliseconds.
+  The other solvers are killed, with their process groups, as soon as one of them decides the query.
+  The query is followed by `(exit)`, so that each solver exits once it has answered rather than
+  waiting for the end of its input.
+-/
+def race (entrants : Array Entrant) (timeout : Nat) (query : String) : IO (Result × Option String × Nat) := do
+  let start ← IO.monoMsNow
+  let mut children := #[]
+  for e in entrants do
+    let (stdin, child) ← (← IO.Process.spawn (e.spawnArgs timeout)).takeStdin
+    stdin.putStr s!"{query}\n(exit)\n"
+    stdin.flush
+    children := children.push child
+  let winner : IO.Ref (Option (Nat × Result × Nat)) ← IO.mkRef none
+  let finished ← IO.mkRef (mkArray children.size false)
+  let mut tasks := #[]
+  for h : i in [:children.size] do
+    let child := children[i]'h.2
+    tasks := tasks.push <| ← IO.asTask (prio := .dedicated) do
+      let out ← child.stdout.readToEnd
+      let _ ← child.wait
+      finished.modify (·.set! i true)
+      let some result := parseResult out | return
+      let elapsed := (← IO.monoMsNow) - start
+      let first ← winner.modifyGet λ
+        | none => (true, some (i, result, elapsed))
+        | w => (false, w)
+      if first then
+        -- kill the losers still running
+        let done ← finished.get
+        for h : j in [:children.size] do
+          if !done[j]! then
+            try (children[j]'h.2).kill catch _ => pure ()
+  for task in tasks do
+    let _ ← IO.wait task
+  match ← winner.get with
+  | some ⟨i, result, elapsed⟩ => return ⟨result, some entrants[i]!.name, elapsed⟩
+  | none => return ⟨.unknown, none, (← IO.monoMsNow) - start⟩
+
+end SystemE.Portfolio
@@ -0,0 +1,119 @@
+import Lean
+import Smt.Solver
+
+set_option autoImplicit false
+open Lean Smt Solver
+
+register_option systemE.incremental : Bool := {
+  defValue := false
+  descr := "Check SMT queries in pooled, incremental z3 sessions that load the background theory once (default: false)."
+}
+
+register_option systemE.sessionQueries : Nat := {
+  defValue := 100
+  descr := "Number of queries after which an incremental z3 session is replaced by a fresh one (default: 100)."
+}
+
+def getIncrementalOption : MetaM Bool := do
+  match (← getOptions).getBool `systemE.incremental with
+  | true => return true
+  | _ => return false
+
+def getSessionQueriesOption : MetaM Nat := do
+  match systemE.sessionQueries.get? (← getOptions) with
+  | none => return 100
+  | some x => return max x 1
+
+namespace SystemE.Session
+
+/--
+  A running `z3 -in` process in which a background theory has been asserted.
+  Each query is checked between `(push 1)` and `(pop 1)`, so the theory is only parsed once.
+-/
+structure Session where
+  -- key of the background theory (see `SystemE.Cache.Theory`)
+  base : String
+  stdin : IO.FS.Handle
+  child : IO.Process.Child {stdin := .null, stdout := .piped, stderr := .null}
+  queries : Nat := 0
+
+/- Idle sessions, shared by all threads of the process -/
+initialize pool : IO.Ref (List Session) ← IO.mkRef []
+
+def spawn (base background : String) : IO Session := do
+  let child ← IO.Process.spawn {cmd := "z3", args := #["-in", "-smt2"], stdin := .piped, stdout := .piped, stderr := .null}
+  let (stdin, child) ← child.takeStdin
+  stdin.putStrLn background
+  stdin.flush
+  return {base := base, stdin := stdin, child := child}
+
+def Session.kill (s : Session) : IO Unit :=
+  try s.child.kill catch _ => pure ()
+
+/-- Remove the first session with the background theory `base` from `ss` -/
+def take (base : String) : List Session → Option Session × List Session
+| [] => (none, [])
+| s :: ss =>
+  if s.base == base then (some s, ss)
+  else let ⟨r, rest⟩ := take base ss; (r, s :: rest)
+
+/-- An idle session with the theory `background` of key `base` loaded, or a fresh one if there is none -/
+def acquire (base background : String) : IO Session := do
+  match ← pool.modifyGet (take base) with
+  | some s => return s
+  | none => spawn base background
+
+/-- Seconds a session may run past its own `:timeout` before it is considered hung and killed -/
+def grace : Nat := 5
+
+/--
+  The verdict of the last `(check-sat)`, or `none` if z3 reported an error, died, or printed nothing
+  within `timeout + grace` seconds (in which case it is killed).
+-/
+def readVerdict (s : Session) (timeout : Nat) : IO (Option Result) := do
+  -- whichever of the reader and the watchdog sets it first decides whether the verdict is in time
+  let settled ← IO.mkRef false
+  let deadline := (← IO.monoMsNow) + (timeout + grace) * 1000
+  let _ ← IO.asTask (prio := .dedicated) do
+    -- wake up often, so that the thread exits soon after the verdict arrives
+    while !(← settled.get) && (← IO.monoMsNow) < deadline do
+      IO.sleep 100
+    if !(← settled.modifyGet (λ b => (b, true))) then
+      s.kill
+  let line ← s.child.stdout.getLine
+  if ← settled.modifyGet (λ b => (b, true)) then
+    return none
+  match line.trim with
+  | "sat" => return some .sat
+  | "unsat" => return some .unsat
+  | "unknown" | "timeout" => return some .unknown
+  | _ => return none
+
+/--
+  Check `query` on top of the theory `background` of key `base` within `timeout` seconds, in an idle
+  session if there is one.
+  Sessions return to the pool, until they have checked `maxQueries` queries (to bound the memory z3 accumulates).
+  A session in which something went wrong (z3 died, reported an error or hung) is discarded, and the result is
+  `none`, unlike a timeout of z3, which is `some .unknown`.
+-/
+def check (base background query : String) (timeout : Nat) (maxQueries : Nat) : IO (Option Result) := do
+  let s ← acquire base background
+  try
+    s.stdin.putStrLn s!"(push 1)\n(set-option :timeout {timeout * 1000})\n{query}\n(check-sat)\n(pop 1)"
+    s.stdin.flush
+    match ← readVerdict s timeout with
+    | none =>
+      s.kill
+      return none
+    | some result =>
+      let s := {s with queries := s.queries + 1}
+      if s.queries < maxQueries then
+        pool.modify (s :: ·)
+      else
+        s.kill
+      return some result
+  catch _ =>
+    s.kill
+    return none
+
+end SystemE.Session
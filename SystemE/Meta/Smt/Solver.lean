@@ -1,6 +1,10 @@
 import Lean
 import Smt.Solver
 import SystemE.Meta.Smt.EuclidTheory
+import SystemE.Meta.Smt.Portfolio
+import SystemE.Meta.Smt.Session
+import SystemE.Meta.Smt.Cache
+import SystemE.Meta.Smt.Capture
 import SystemE.Meta.Smt.Translator
 
 set_option autoImplicit false
@@ -61,15 +65,68 @@ def emitGoalAndCloseWithSorry (g : MVarId) : MetaM Unit := do
   logError m!"Could not prove: {e}"
   admitGoal g
 
+/-- The Euclid theory, as the background of queries -/
+def euclidBackground : Cache.Theory := .of euclidTheory
+
+/--
+  Check whether `theory.cmds ++ cmds` are satisfiable within `timeout` seconds, without the cache.
+  If `systemE.portfolio` is set, z3 and cvc5 race on the query (see `SystemE.Portfolio.race`),
+  and the winner is traced under `trace.systemE.portfolio`.
+  Otherwise, if `systemE.incremental` is set, `cmds` are checked in a pooled z3 session in which
+  the theory is already loaded (see `SystemE.Session.check`), or by a fresh solver if the session fails.
+-/
+def solveCommands (theory : Cache.Theory) (cmds : List Smt.Command) (timeout : Nat) : MetaM Result := do
+  if ← getPortfolioOption then
+    let query := s!"{theory.text}\n{Command.cmdsAsQuery cmds.reverse}\n(check-sat)\n"
+    let entrants := Portfolio.entrants (← getPortfolioSeedsOption)
+    let ⟨result, winner, elapsed⟩ ← Portfolio.race entrants timeout query
+    trace[systemE.portfolio] "{winner.getD "no solver"} returned {result} after {elapsed} ms"
+    return result
+  if ← getIncrementalOption then
+    let maxQueries ← getSessionQueriesOption
+    if let some result ← Session.check theory.key theory.text (Command.cmdsAsQuery cmds.reverse) timeout maxQueries then
+      return result
+  let query := addCommands (theory.cmds ++ cmds) *> checkSat
+  let solverState ← Smt.Solver.create timeout
+  (StateT.run' query solverState : MetaM _)
+
+/--
+  Check whether `theory.cmds ++ cmds` are satisfiable within `timeout` seconds (see `solveCommands`).
+  If `systemE.cacheDir` is set, the result is looked up in and added to the cache of query results
+  in that directory (see `SystemE.Cache`), keyed by the theory and `cmds`.
+-/
+def lookupOrSolve (theory : Cache.Theory) (cmds : List Smt.Command) (timeout : Nat) : MetaM Result := do
+  let dir ← getCacheDirOption
+  if dir.isEmpty then
+    return ← solveCommands theory cmds timeout
+  let goal := Command.cmdsAsQuery cmds.reverse
+  if let some result ← Cache.lookup dir theory goal timeout then
+    return result
+  let result ← solveCommands theory cmds timeout
+  Cache.store dir theory goal timeout result
+  return result
+
+/--
+  Check whether `theory.cmds ++ cmds` are satisfiable within `timeout` seconds (see `lookupOrSolve`).
+  If `systemE.captureDir` is set, the query is saved there along with `tags`, its result and
+  its running time (see `SystemE.Capture`).
+-/
+def checkCommands (theory : Cache.Theory) (cmds : List Smt.Command) (timeout : Nat) (tags : List (String × String) := []) : MetaM Result := do
+  let dir ← getCaptureDirOption
+  if dir.isEmpty then
+    return ← lookupOrSolve theory cmds timeout
+  let start ← IO.monoMsNow
+  let result ← lookupOrSolve theory cmds timeout
+  Capture.record dir theory (Command.cmdsAsQuery cmds.reverse) tags timeout result ((← IO.monoMsNow) - start)
+  return result
+
 /-- Given the chosen  solver and current Esmt context, check whether it is satisfiable-/
 def evalSmt (Γ : Esmt) : TacticM Result := do
   -- Choose the background theory depending on the solver, they differ only in the patterns used
   let cmds : List Smt.Command := euclidTheory ++ fromEsmt Γ
   if ← getTraceOption then
     logInfo $ (Command.cmdsAsQuery cmds.reverse) ++ "\n(check-sat)"
-  let query := addCommands cmds *> checkSat
-  let solverState ← Smt.Solver.create (← getTimeOption)
-  let result ← (StateT.run' query solverState : MetaM _)
+  let result ← checkCommands euclidBackground (fromEsmt Γ) (← getTimeOption)
   if ← getTraceOption then
     logInfo s!"{result}"
   return result
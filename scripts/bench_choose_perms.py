@@ -0,0 +1,328 @@
+"""
+bench_choose_perms.py
+
+Benchmark of ``E3/Engine/choosePerms.py`` on chooser inputs built from every statement in
+``Book/`` and ``UniGeo/`` (see :mod:`E3.corpus`), in their ``self`` and ``perturbed`` variants,
+and on synthetic instances of increasing size. Each instance is run with each strategy in a
+fresh process, as E3 runs it, recording the wall time, the peak RSS, and the candidates scored
+per second.
+
+A run can be saved as a baseline, and later runs compared with it: the script fails (exit status
+1) if the total time of a strategy grew by more than ``--tolerance``, if any instance got twice
+as much slower (and by at least ``--min-seconds``) or used that much more memory, or if any
+instance chose different unifications. Timings only compare meaningfully on the same machine.
+
+Usage
+-----
+.. code-block:: console
+
+    $ python -m scripts.bench_choose_perms --save-baseline
+    $ python -m scripts.bench_choose_perms --baseline
+    $ python -m scripts.bench_choose_perms --suite synthetic --synthetic 6,2,1 9,3,1 \\
+        --strategy bnb murty --args="--cascade-depth"
+
+The script prints a summary like::
+
+    strategy     instances   wall (s)   candidates/s   peak RSS (MB)
+    exhaustive         245      61.32         412003            31.4
+    bnb                245      20.15          20311            30.9
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from collections.abc import Iterator
+
+from E3.corpus import DATASETS, VARIANTS, instances, synthetic_instance
+from E3.Engine.choosePerms import (
+    STRATEGIES,
+    CandidateSpace,
+    getPermutations,
+    parseData,
+)
+from E3.utils import ROOT_DIR
+
+CHOOSER = os.path.join(ROOT_DIR, "E3", "Engine", "choosePerms.py")
+DEFAULT_BASELINE = os.path.join(ROOT_DIR, "tmp", "bench", "choose_perms_baseline.json")
+# points, lines and circles of the default synthetic instances
+DEFAULT_SYNTHETIC = ["4,1,0", "6,2,0", "6,2,1", "7,3,1", "8,3,1"]
+
+
+def candidate_count(props: dict) -> int:
+    _, _, ground, _ = parseData(props)
+    return len(
+        CandidateSpace(
+            getPermutations(ground.univNames), getPermutations(ground.existNames)
+        )
+    )
+
+
+def suite(args: argparse.Namespace) -> Iterator[tuple[str, dict]]:
+    """
+    Yield the name and chooser input of every instance selected by ``args``.
+    """
+    for variant in args.variant:
+        if "corpus" in args.suite:
+            for dataset in args.dataset:
+                for name, props in instances(dataset, args.seed, variant):
+                    yield f"{name}:{variant}", props
+        if "synthetic" in args.suite:
+            for size in args.synthetic:
+                points, lines, circles = map(int, size.split(","))
+                name, props = synthetic_instance(
+                    points, lines, circles, args.seed, variant
+                )
+                yield f"{name}:{variant}", props
+
+
+def run_chooser(
+    props: dict, N: int, strategy: str, extra_args: list[str], workdir: str
+) -> dict:
+    """
+    Run ``choosePerms.py`` on one instance in a fresh process.
+
+    :returns: the wall time, peak RSS, statistics and chosen unifications of the run
+    """
+    in_file = os.path.join(workdir, "in.json")
+    out_file = os.path.join(workdir, "out.json")
+    err_file = os.path.join(workdir, "err.txt")
+    with open(in_file, "w", encoding="utf-8") as f:
+        json.dump(props, f, ensure_ascii=False)
+    command = [
+        sys.executable,
+        CHOOSER,
+        "--inFile",
+        in_file,
+        "--outFile",
+        out_file,
+        "--N",
+        str(N),
+        "--strategy",
+        strategy,
+        *extra_args,
+    ]
+
+    with open(err_file, "w+", encoding="utf-8") as err:
+        start = time.perf_counter()
+        process = subprocess.Popen(
+            command, cwd=ROOT_DIR, stdout=subprocess.DEVNULL, stderr=err
+        )
+        # wait4 reports the resource usage of this child alone
+        _, status, usage = os.wait4(process.pid, 0)
+        wall = time.perf_counter() - start
+        process.returncode = os.waitstatus_to_exitcode(status)
+        err.seek(0)
+        error = err.read().strip()
+
+    if process.returncode != 0 or error:
+        raise RuntimeError(f"choosePerms.py failed: {error}")
+    with open(out_file, "r", encoding="utf-8") as f:
+        output = json.load(f)
+    explored = output["stats"]["explored"]
+    return {
+        "wall_s": wall,
+        # kilobytes on Linux
+        "peak_rss_kb": usage.ru_maxrss,
+        "explored": explored,
+        "candidates_per_s": explored / wall if wall else 0.0,
+        "perms": output["perms"],
+    }
+
+
+def summarize(runs: dict[str, dict]) -> None:
+    print(
+        f"{'strategy':<12} {'instances':>9} {'wall (s)':>10} {'candidates/s':>14} "
+        f"{'peak RSS (MB)':>15}"
+    )
+    for strategy in STRATEGIES:
+        selected = [r for r in runs.values() if r["strategy"] == strategy]
+        if not selected:
+            continue
+        wall = sum(r["wall_s"] for r in selected)
+        rate = sum(r["explored"] for r in selected) / wall if wall else 0.0
+        rss = max(r["peak_rss_kb"] for r in selected) / 1024
+        print(
+            f"{strategy:<12} {len(selected):>9} {wall:>10.2f} {rate:>14.0f} {rss:>15.1f}"
+        )
+
+
+def compare(
+    runs: dict[str, dict],
+    baseline: dict[str, dict],
+    tolerance: float,
+    min_seconds: float,
+) -> list[str]:
+    """
+    Compare ``runs`` with the runs of the same instances and strategies in ``baseline``.
+
+    :returns: a description of every regression
+    """
+    regressions = []
+    # single instances are noisier than totals
+    instance_tolerance = 2 * tolerance
+    totals = {}
+    for key, run in runs.items():
+        base = baseline.get(key)
+        if base is None:
+            continue
+        total = totals.setdefault(run["strategy"], [0.0, 0.0])
+        total[0] += base["wall_s"]
+        total[1] += run["wall_s"]
+        if run["perms"] != base["perms"]:
+            regressions.append(f"{key}: chose different unifications")
+        slower = run["wall_s"] - base["wall_s"]
+        if slower > min_seconds and run["wall_s"] > base["wall_s"] * (
+            1 + instance_tolerance
+        ):
+            regressions.append(
+                f"{key}: wall time {base['wall_s']:.3f}s -> {run['wall_s']:.3f}s"
+            )
+        if run["peak_rss_kb"] > base["peak_rss_kb"] * (1 + instance_tolerance):
+            regressions.append(
+                f"{key}: peak RSS {base['peak_rss_kb']} kB -> {run['peak_rss_kb']} kB"
+            )
+    for strategy, (before, after) in totals.items():
+        if after > before * (1 + tolerance):
+            regressions.append(
+                f"{strategy}: total wall time {before:.2f}s -> {after:.2f}s"
+            )
+    missing = len(runs.keys() - baseline.keys())
+    if missing:
+        print(f"⚠️  {missing} runs have no baseline to compare with")
+    return regressions
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark the permutation chooser.")
+    parser.add_argument(
+        "--suite",
+        nargs="+",
+        choices=["corpus", "synthetic"],
+        default=["corpus", "synthetic"],
+    )
+    parser.add_argument(
+        "--dataset", nargs="+", choices=DATASETS, default=list(DATASETS)
+    )
+    parser.add_argument(
+        "--variant", nargs="+", choices=VARIANTS, default=list(VARIANTS)
+    )
+    parser.add_argument(
+        "--synthetic",
+        nargs="+",
+        default=DEFAULT_SYNTHETIC,
+        metavar="POINTS,LINES,CIRCLES",
+        help="Sizes of the synthetic instances",
+    )
+    parser.add_argument("--strategy", nargs="+", choices=STRATEGIES, default=STRATEGIES)
+    parser.add_argument("--N", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=3,
+        help="Run each instance this many times, and keep the fastest run",
+    )
+    parser.add_argument(
+        "--max-candidates",
+        type=int,
+        default=100000,
+        help="Skip instances with more candidate unifications than this",
+    )
+    parser.add_argument(
+        "--args",
+        default="",
+        help="Extra arguments for choosePerms.py, e.g. --args='--cascade-depth 1000'",
+    )
+    parser.add_argument(
+        "--output", default=None, help="Write the results of this run to this file"
+    )
+    parser.add_argument(
+        "--save-baseline",
+        nargs="?",
+        const=DEFAULT_BASELINE,
+        default=None,
+        help="Save this run as the baseline (default when given: %(const)s)",
+    )
+    parser.add_argument(
+        "--baseline",
+        nargs="?",
+        const=DEFAULT_BASELINE,
+        default=None,
+        help="Fail on regressions against this baseline (default when given: %(const)s)",
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.25,
+        help="Relative slowdown of the total time of a strategy allowed before failing "
+        "(twice as much for single instances)",
+    )
+    parser.add_argument(
+        "--min-seconds",
+        type=float,
+        default=0.1,
+        help="Ignore slowdowns of single instances by fewer seconds than this",
+    )
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    extra_args = args.args.split()
+
+    runs: dict[str, dict] = {}
+    skipped = 0
+    with tempfile.TemporaryDirectory() as workdir:
+        for name, props in suite(args):
+            total = candidate_count(props)
+            if total > args.max_candidates:
+                skipped += 1
+                continue
+            for strategy in args.strategy:
+                run = min(
+                    (
+                        run_chooser(props, args.N, strategy, extra_args, workdir)
+                        for _ in range(args.repeat)
+                    ),
+                    key=lambda r: r["wall_s"],
+                )
+                runs[f"{name}|{strategy}"] = {
+                    "instance": name,
+                    "strategy": strategy,
+                    "candidates": total,
+                    **run,
+                }
+    print(f"{len(runs)} runs, {skipped} instances skipped")
+    summarize(runs)
+
+    report = {"args": extra_args, "N": args.N, "runs": runs}
+    for path in (args.output, args.save_baseline):
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(report, f, ensure_ascii=False, indent=1)
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        if (baseline["args"], baseline["N"]) != (extra_args, args.N):
+            print(
+                f"⚠️  the baseline was run with --N {baseline['N']} "
+                f"--args='{' '.join(baseline['args'])}'"
+            )
+        regressions = compare(runs, baseline["runs"], args.tolerance, args.min_seconds)
+        for regression in regressions:
+            print(f"⚠️  regression: {regression}")
+        if regressions:
+            print(f"⚠️  {len(regressions)} regressions against {args.baseline}")
+            sys.exit(1)
+        print(f"No regressions against {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
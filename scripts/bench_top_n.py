@@ -0,0 +1,101 @@
+"""
+bench_top_n.py
+
+Microbenchmark of the per-candidate cost of keeping the best ``N`` chooser candidates, comparing
+:class:`TopN` from ``E3/Engine/choosePerms.py`` with the list-based ``checkAndInsert`` it
+replaced (reproduced below), which scanned the heap for duplicates on every insertion. Both
+use the fixed ``NameMap.__eq__``, so both actually deduplicate.
+
+Usage
+-----
+.. code-block:: console
+
+    $ python -m scripts.bench_top_n --candidates 200000 --N 3 10 100
+
+The script prints a report like::
+
+        N   before (ns)    after (ns)   speedup
+        3        2496.4         569.3      4.38
+       10        4466.3         548.6      8.14
+      100       34410.4         863.9     39.83
+"""
+
+import argparse
+import heapq
+import random
+import time
+
+from E3.Engine.choosePerms import NameMap, TopN
+
+
+def checkAndInsert(heap, name, N):
+    # the implementation replaced by `TopN.push`
+    if name in heap:
+        return ()
+    if len(heap) < N:
+        heapq.heappush(heap, name)
+    else:
+        k = heapq.nsmallest(1, heap)
+        if k[0] < name:
+            heapq.heapreplace(heap, name)
+
+
+def make_candidates(n: int, n_names: int, seed: int) -> list[NameMap]:
+    """
+    Generate ``n`` candidates with random names drawn from ``n_names`` distinct permutations,
+    and random similarities rounded as coarsely as string similarities of short statements.
+    """
+    rng = random.Random(seed)
+    letters = "abcdefghij"
+    names = [tuple(rng.sample(letters, len(letters))) for _ in range(n_names)]
+    return [NameMap(rng.choice(names), round(rng.random(), 3), -i) for i in range(n)]
+
+
+def time_per_candidate(insert, candidates: list[NameMap], repeat: int) -> float:
+    """
+    Return the best time in nanoseconds per candidate over ``repeat`` runs of ``insert``.
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter_ns()
+        insert(candidates)
+        best = min(best, time.perf_counter_ns() - start)
+    return best / len(candidates)
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Benchmark the top-N container of the permutation chooser."
+    )
+    parser.add_argument("--candidates", type=int, default=200000)
+    parser.add_argument("--names", type=int, default=50000)
+    parser.add_argument("--N", type=int, nargs="+", default=[3, 10, 100])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    candidates = make_candidates(args.candidates, args.names, args.seed)
+
+    print(f"{'N':>5} {'before (ns)':>13} {'after (ns)':>13} {'speedup':>9}")
+    for N in args.N:
+
+        def before(xs):
+            heap = []
+            for x in xs:
+                checkAndInsert(heap, x, N)
+
+        def after(xs):
+            top = TopN(N)
+            for x in xs:
+                top.push(x)
+
+        t_before = time_per_candidate(before, candidates, args.repeat)
+        t_after = time_per_candidate(after, candidates, args.repeat)
+        print(f"{N:>5} {t_before:>13.1f} {t_after:>13.1f} {t_before / t_after:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
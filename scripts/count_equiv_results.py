@@ -11,7 +11,7 @@ Usage
 -----
 .. code-block:: console
 
-    $ python analyze_equiv.py /path/to/json_dir
+    $ python -m scripts.count_equiv_results /path/to/json_dir
 
 The script prints a report like::
 
@@ -20,22 +20,61 @@ The script prints a report like::
     test_imp_ground   9
     no_conclusion    20
 
+With ``--timings``, it also aggregates the per-phase timings recorded in the results (see
+``Checker.check_result``), in milliseconds::
+
+    phase                 count      p50      p90      p99      max    total (s)
+    startup                  38     9120    11804    12510    12510       351.2
+    binary                   38     2210    15022    15040    15040       201.7
+
+Rounds of the approximate checker (``approx/<round>/<permutation>``) are aggregated over
+permutations.
+
+Directories deeper than ``--max-depth`` are not traversed, and files are parsed by ``--workers``
+processes. With ``--index [PATH]``, the verdicts and timings are kept in a SQLite index (by default
+``tmp/index/results.sqlite``) along with the modification time and size of each file, so that a
+rescan only re-parses the files that changed and drops those that are gone; one index can hold any
+number of results directories.
+
+With ``--group-depth N``, it also reports the counts of each configuration, i.e. of each directory
+``N`` levels below the results directory (e.g. ``2`` for ``<model>/<category>``), and with
+``--compare OTHER`` it lists the results whose verdict differs in another results directory of the
+same layout::
+
+    $ python -m scripts.count_equiv_results result/eval/gpt-4 --index --group-depth 2 \\
+        --compare result/eval/gpt-4-rag
+
 Exit status is non‑zero on error.
 """
 
 import argparse
 import json
+import math
+import os
+import sqlite3
 import sys
 from pathlib import Path
-from collections import Counter
+from collections import Counter, defaultdict
+from collections.abc import Iterator
+from concurrent.futures import ProcessPoolExecutor
 from typing import Final
 
+from E3.utils import ROOT_DIR
+
 ALLOWED_VALUES: Final[list[str]] = [
     "equiv",
     "ground_imp_test",
     "test_imp_ground",
     "no_conclusion",
 ]
+DEFAULT_INDEX_PATH: Final[str] = os.path.join(
+    ROOT_DIR, "tmp", "index", "results.sqlite"
+)
+# below this many files to parse, starting worker processes costs more than it saves
+PARALLEL_THRESHOLD: Final[int] = 256
+
+# the relative path, binary_check and timings (if recorded) of a result
+Record = tuple[str, str, dict | None]
 
 
 def parse_args() -> argparse.Namespace:
@@ -49,15 +88,48 @@ def parse_args() -> argparse.Namespace:
         "--max-depth",
         type=int,
         default=2,
-        help="Maximum directory depth to read results from, doesn't affect search performance "
-        "(default: %(default)s)",
+        help="Maximum directory depth to read results from; deeper directories are not "
+        "traversed (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--timings",
+        action="store_true",
+        help="Also report percentiles of the time spent in each phase of the checks",
+    )
+    parser.add_argument(
+        "--index",
+        nargs="?",
+        const=DEFAULT_INDEX_PATH,
+        default=None,
+        help="Read results through an incremental index that only re-parses changed files "
+        "(default when given: %(const)s)",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="Number of processes parsing result files (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--group-depth",
+        type=int,
+        default=None,
+        help="Also report the counts of each configuration, i.e. of each directory this many "
+        "levels below DIRECTORY",
+    )
+    parser.add_argument(
+        "--compare",
+        type=Path,
+        default=None,
+        metavar="OTHER",
+        help="Also list the results whose binary_check differs in OTHER, matched by relative path",
     )
     return parser.parse_args()
 
 
-def extract_binary_check(file_path: Path) -> str:
+def read_result(file_path: Path) -> dict:
     """
-    Return the *binary_check* value from ``file_path`` or raise on invalid schema.
+    Return the E3 result in ``file_path`` or raise on invalid schema.
     """
     try:
         data = json.loads(file_path.read_text())
@@ -70,46 +142,321 @@ def extract_binary_check(file_path: Path) -> str:
     inner_object = next(iter(data.values()))
     if not isinstance(inner_object, dict) or "binary_check" not in inner_object:
         raise ValueError(f"'binary_check' missing in {file_path}")
+    return inner_object
 
-    value = inner_object["binary_check"]
+
+def extract_binary_check(file_path: Path) -> str:
+    """
+    Return the *binary_check* value from ``file_path`` or raise on invalid schema.
+    """
+    value = read_result(file_path)["binary_check"]
     if value not in ALLOWED_VALUES:
         raise ValueError(f"Unknown binary_check value '{value}' in {file_path}")
 
     return value
 
 
-def count_binary_checks(directory: Path, max_depth: int) -> Counter[str]:
+def parse_result_file(path: str) -> tuple[str, dict | None]:
     """
-    Traverse ``directory`` recursively up to depth ``max_depth`` and accumulate
-    *binary_check* value frequencies.
+    Return the *binary_check* value and timings (if recorded) of the result in ``path``.
+    """
+    result = read_result(Path(path))
+    value = result["binary_check"]
+    if value not in ALLOWED_VALUES:
+        raise ValueError(f"Unknown binary_check value '{value}' in {path}")
+    timings = result.get("timings")
+    return value, timings if isinstance(timings, dict) else None
+
+
+def parse_result_files(paths: list[str], workers: int) -> list[tuple[str, dict | None]]:
+    """
+    Parse ``paths`` with :func:`parse_result_file`, in ``workers`` processes if there are many.
+    """
+    if workers <= 1 or len(paths) < PARALLEL_THRESHOLD:
+        return [parse_result_file(path) for path in paths]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        chunksize = max(1, len(paths) // (workers * 8))
+        return list(executor.map(parse_result_file, paths, chunksize=chunksize))
+
+
+def walk_results(
+    directory: Path, max_depth: int
+) -> Iterator[tuple[str, os.stat_result]]:
+    """
+    Yield the path and stat of the result files (``N.json``) in ``directory`` up to depth
+    ``max_depth``, without descending into deeper directories or following symlinks.
     """
     if not directory.is_dir():
         raise ValueError(f"{directory} is not a directory")
 
-    counter: Counter[str] = Counter()
-    for path in directory.rglob("*.json"):
-        if (
-            path.is_file()
-            and path.stem.isdigit()
-            and len(path.relative_to(directory).parts) <= max_depth
+    stack = [(str(directory), 1)]
+    while stack:
+        current, depth = stack.pop()
+        with os.scandir(current) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    if depth < max_depth:
+                        stack.append((entry.path, depth + 1))
+                elif (
+                    entry.name.endswith(".json")
+                    and entry.name[: -len(".json")].isdigit()
+                    and entry.is_file()
+                ):
+                    yield entry.path, entry.stat()
+
+
+def result_files(directory: Path, max_depth: int) -> list[Path]:
+    """
+    Return the result files (``N.json``) in ``directory`` up to depth ``max_depth``.
+    """
+    return [Path(path) for path, _ in walk_results(directory, max_depth)]
+
+
+def scan_results(directory: Path, max_depth: int, workers: int = 1) -> list[Record]:
+    """
+    Parse every result file in ``directory`` up to depth ``max_depth``.
+    """
+    paths = sorted(path for path, _ in walk_results(directory, max_depth))
+    parsed = parse_result_files(paths, workers)
+    return [
+        (os.path.relpath(path, directory), value, timings)
+        for path, (value, timings) in zip(paths, parsed)
+    ]
+
+
+class ResultsIndex:
+    """
+    SQLite index of the verdicts and timings of result files, keyed by absolute path.
+    """
+
+    def __init__(self, path: str = DEFAULT_INDEX_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            "path TEXT PRIMARY KEY, mtime_ns INTEGER NOT NULL, size INTEGER NOT NULL, "
+            "binary_check TEXT NOT NULL, timings TEXT)"
+        )
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def _rows(self, directory: Path, max_depth: int) -> Iterator[tuple]:
+        """
+        Yield the rows of the files in ``directory`` up to depth ``max_depth``, with the path
+        relative to ``directory`` first.
+        """
+        root = os.path.abspath(directory)
+        # all paths under `root/` sort between `root/` and `root0`
+        for row in self.conn.execute(
+            "SELECT path, mtime_ns, size, binary_check, timings FROM results "
+            "WHERE path >= ? AND path < ? ORDER BY path",
+            (root + os.sep, root + chr(ord(os.sep) + 1)),
         ):
-            value = extract_binary_check(path)
-            counter[value] += 1
+            relative = os.path.relpath(row[0], root)
+            if len(Path(relative).parts) <= max_depth:
+                yield relative, *row
+
+    def update(
+        self, directory: Path, max_depth: int, workers: int = 1
+    ) -> dict[str, int]:
+        """
+        Bring the index up to date with ``directory`` up to depth ``max_depth``: parse the files
+        that are new or whose modification time or size changed, and forget those that are gone.
+
+        :returns: the number of files ``parsed``, ``removed`` and ``unchanged``
+        """
+        on_disk = {
+            os.path.abspath(path): (stat.st_mtime_ns, stat.st_size)
+            for path, stat in walk_results(directory, max_depth)
+        }
+        indexed = {row[1]: (row[2], row[3]) for row in self._rows(directory, max_depth)}
+        changed = sorted(
+            path for path, key in on_disk.items() if indexed.get(path) != key
+        )
+        removed = [path for path in indexed if path not in on_disk]
+
+        parsed = parse_result_files(changed, workers)
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?)",
+                [
+                    (
+                        path,
+                        *on_disk[path],
+                        value,
+                        json.dumps(timings) if timings else None,
+                    )
+                    for path, (value, timings) in zip(changed, parsed)
+                ],
+            )
+            self.conn.executemany(
+                "DELETE FROM results WHERE path = ?", [(p,) for p in removed]
+            )
+        return {
+            "parsed": len(changed),
+            "removed": len(removed),
+            "unchanged": len(on_disk) - len(changed),
+        }
+
+    def records(self, directory: Path, max_depth: int) -> list[Record]:
+        """
+        Return the indexed results in ``directory`` up to depth ``max_depth``.
+        """
+        return [
+            (relative, value, json.loads(timings) if timings else None)
+            for relative, _, _, _, value, timings in self._rows(directory, max_depth)
+        ]
+
+
+def load_records(
+    directory: Path, max_depth: int, workers: int = 1, index: ResultsIndex | None = None
+) -> list[Record]:
+    """
+    Return the results in ``directory``, parsing them all or only the changed ones through
+    ``index``.
+    """
+    if index is None:
+        return scan_results(directory, max_depth, workers)
+    stats = index.update(directory, max_depth, workers)
+    print(
+        f"Indexed {directory}: {stats['parsed']} parsed, {stats['removed']} removed, "
+        f"{stats['unchanged']} unchanged",
+        file=sys.stderr,
+    )
+    return index.records(directory, max_depth)
+
+
+def count_binary_checks(directory: Path, max_depth: int) -> Counter[str]:
+    """
+    Traverse ``directory`` recursively up to depth ``max_depth`` and accumulate
+    *binary_check* value frequencies.
+    """
+    return Counter(value for _, value, _ in scan_results(directory, max_depth))
+
+
+def group_counts(records: list[Record], depth: int) -> dict[str, Counter[str]]:
+    """
+    Count the *binary_check* values of each configuration, i.e. of the results under each
+    directory ``depth`` levels deep.
+    """
+    groups: dict[str, Counter[str]] = defaultdict(Counter)
+    for relative, value, _ in records:
+        parts = Path(relative).parts[:-1]
+        if len(parts) >= depth:
+            groups[os.path.join(*parts[:depth]) if depth else "."][value] += 1
+    return groups
+
+
+def compare_records(
+    records: list[Record], others: list[Record]
+) -> list[tuple[str, str, str]]:
+    """
+    Return the relative path and both verdicts of the results present in both lists whose
+    *binary_check* differs.
+    """
+    other_values = {relative: value for relative, value, _ in others}
+    return [
+        (relative, value, other_values[relative])
+        for relative, value, _ in records
+        if relative in other_values and other_values[relative] != value
+    ]
+
+
+def phase_name(phase: str) -> str:
+    """
+    Aggregate the rounds of all permutations, e.g. ``approx/fwdLHS/2`` into ``approx/fwdLHS``.
+    """
+    head, _, last = phase.rpartition("/")
+    return head if head and last.isdigit() else phase
+
+
+def collect_timings(records: list[Record]) -> dict[str, list[int]]:
+    """
+    Return the milliseconds spent in each phase by every result that records timings, summing
+    the rounds of all permutations of a result.
+    """
+    timings: dict[str, list[int]] = defaultdict(list)
+    for _, _, recorded in records:
+        if recorded is None:
+            continue
+        per_phase: Counter[str] = Counter()
+        for phase, ms in recorded.items():
+            per_phase[phase_name(phase)] += ms
+        for phase, ms in per_phase.items():
+            timings[phase].append(ms)
+    return timings
+
+
+def percentile(values: list[int], q: float) -> int:
+    """
+    Nearest-rank percentile of ``values``, ``q`` in [0, 100].
+    """
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)]
+
 
-    return counter
+def print_timings(timings: dict[str, list[int]]) -> None:
+    print(
+        f"{'phase':<20} {'count':>6} {'p50':>8} {'p90':>8} {'p99':>8} {'max':>8} "
+        f"{'total (s)':>12}"
+    )
+    # phases that took the most time overall first
+    for phase, values in sorted(timings.items(), key=lambda x: -sum(x[1])):
+        print(
+            f"{phase:<20} {len(values):>6} {percentile(values, 50):>8} "
+            f"{percentile(values, 90):>8} {percentile(values, 99):>8} {max(values):>8} "
+            f"{sum(values) / 1000:>12.1f}"
+        )
+
+
+def print_groups(groups: dict[str, Counter[str]]) -> None:
+    print(f"{'configuration':<40} " + " ".join(f"{v:>16}" for v in ALLOWED_VALUES))
+    for group, counts in sorted(groups.items()):
+        print(
+            f"{group:<40} "
+            + " ".join(f"{counts.get(v, 0):>16}" for v in ALLOWED_VALUES)
+        )
 
 
 def main() -> None:
     args = parse_args()
+    index = ResultsIndex(args.index) if args.index else None
     try:
-        counts = count_binary_checks(args.directory, args.max_depth)
+        records = load_records(args.directory, args.max_depth, args.workers, index)
+        others = (
+            load_records(args.compare, args.max_depth, args.workers, index)
+            if args.compare
+            else None
+        )
     except Exception as e:
         print(f"Error: {e}", file=sys.stderr)
         sys.exit(1)
+    finally:
+        if index is not None:
+            index.close()
 
+    counts = Counter(value for _, value, _ in records)
     for value in ALLOWED_VALUES:
         print(f"{value:<16} {counts.get(value, 0)}")
 
+    if args.group_depth is not None:
+        print()
+        print_groups(group_counts(records, args.group_depth))
+
+    if args.timings:
+        print()
+        print_timings(collect_timings(records))
+
+    if others is not None:
+        differences = compare_records(records, others)
+        print()
+        print(f"{len(differences)} results differ in {args.compare}:")
+        for relative, value, other in differences:
+            print(f"{relative:<40} {value:>16} -> {other}")
+
 
 if __name__ == "__main__":
     main()
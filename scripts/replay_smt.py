@@ -0,0 +1,270 @@
+"""
+replay_smt.py
+
+Replay a corpus of SMT queries captured from E3 runs (``smtCapture=<dir>`` in E3,
+``Checker(capture_dir=...)`` or ``--capture-smt`` in ``evaluate.py``) against the local z3 and
+cvc5, to tune ``equivSolverTime``/``approxSolverTime`` and the choice of solver without re-running
+Lean.
+
+A corpus directory holds one ``theory-<key>.smt2`` file per background theory, one ``<key>.smt2``
+file per distinct query with the declarations and assertions checked on top of its theory, and an
+``index.jsonl`` line per occurrence of a query, tagged with the key of its theory and the instance,
+phase (``binary_fwd``, ``fwdLHS``, ...) and permutation that issued it. Each distinct query is run
+once per solver and timeout, in parallel, each solver in its own process group and given its theory
+and query on stdin.
+
+Usage
+-----
+.. code-block:: console
+
+    $ python -m scripts.replay_smt tmp/capture --solver z3 cvc5 --timeout 5 15 \\
+        --output tmp/replay.csv
+
+The script prints a summary like::
+
+    solver     timeout  queries  decided    p50 (s)    p90 (s)    max (s)
+    z3               5      412      371      0.081      1.204      5.012
+    cvc5             5      412      359      0.143      2.511      5.020
+    portfolio        5      412      380      0.075      0.933      5.012
+
+where ``portfolio`` is the fastest of the solvers on each query, then the same per phase.
+"""
+
+import argparse
+import csv
+import functools
+import json
+import math
+import os
+import subprocess
+import time
+
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Final
+
+from E3.utils import kill_process_group
+
+SOLVERS: Final[tuple[str, ...]] = ("z3", "cvc5")
+DECIDED: Final[tuple[str, ...]] = ("sat", "unsat")
+# seconds allowed past the solver's own timeout before it is killed
+GRACE: Final[float] = 5.0
+
+
+def load_corpus(directory: str) -> dict[str, dict]:
+    """
+    Return the distinct queries of a corpus by key, each with the tags of its first occurrence,
+    its number of occurrences, and the result and time of its first run under E3.
+    """
+    queries: dict[str, dict] = {}
+    with open(os.path.join(directory, "index.jsonl"), "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            query = queries.get(entry["key"])
+            if query is None:
+                queries[entry["key"]] = {
+                    "file": os.path.join(directory, entry["key"] + ".smt2"),
+                    "theory": os.path.join(directory, f"theory-{entry['theory']}.smt2"),
+                    "instance": entry.get("instance", ""),
+                    "phase": entry.get("phase", ""),
+                    "occurrences": 1,
+                    "captured_result": entry["result"],
+                    "captured_ms": entry["ms"],
+                }
+            else:
+                query["occurrences"] += 1
+    return queries
+
+
+def solver_command(solver: str, timeout: int) -> list[str]:
+    # both solvers read the query on stdin
+    if solver == "z3":
+        return ["z3", "-in", "-smt2", f"-T:{timeout}"]
+    if solver == "cvc5":
+        return ["cvc5", "--lang", "smt2", f"--tlimit={timeout * 1000}"]
+    raise ValueError(f"Unknown solver: {solver}")
+
+
+@functools.cache
+def read_theory(file: str) -> str:
+    # theories are shared by many queries, so each is only read once
+    with open(file, "r", encoding="utf-8") as f:
+        return f.read()
+
+
+def query_text(query: dict) -> str:
+    """
+    Return the full SMT-LIB text of a query: its theory, then its goal.
+    """
+    with open(query["file"], "r", encoding="utf-8") as f:
+        return read_theory(query["theory"]) + f.read()
+
+
+def run_query(solver: str, timeout: int, text: str) -> tuple[str, float]:
+    """
+    Run ``solver`` on the SMT-LIB query ``text``.
+
+    :returns: the verdict (``sat``, ``unsat``, ``unknown`` or ``error``) and the wall time
+    """
+    start = time.perf_counter()
+    try:
+        process = subprocess.Popen(
+            solver_command(solver, timeout),
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            start_new_session=True,
+            text=True,
+        )
+    except OSError as e:
+        print(f"⚠️  Failed to execute {solver}: {e}")
+        return "error", 0.0
+    try:
+        stdout, _ = process.communicate(text, timeout=timeout + GRACE)
+    except subprocess.TimeoutExpired:
+        stdout = ""
+    finally:
+        kill_process_group(process.pid)
+        process.wait()
+    wall = time.perf_counter() - start
+    lines = stdout.strip().splitlines()
+    verdict = lines[0].strip() if lines else "unknown"
+    if verdict not in (*DECIDED, "unknown"):
+        # z3 prints `timeout` when it runs out of time, anything else is an error message
+        verdict = "unknown" if verdict == "timeout" else "error"
+    return verdict, wall
+
+
+def percentile(values: list[float], q: float) -> float:
+    """
+    Nearest-rank percentile of ``values``, ``q`` in [0, 100].
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, math.ceil(q / 100 * len(ordered)) - 1)
+    return ordered[rank]
+
+
+def summarize(rows: list[dict], solvers: list[str], group: str | None = None) -> None:
+    """
+    Print the number of decided queries and latency percentiles per solver and timeout, and
+    per value of the ``group`` column if given. The ``portfolio`` rows take the fastest decided
+    verdict of any solver on each query.
+    """
+    by_query: dict[tuple, list[dict]] = defaultdict(list)
+    for row in rows:
+        by_query[(row["key"], row["timeout"])].append(row)
+    portfolio = []
+    for runs in by_query.values():
+        decided = [r for r in runs if r["verdict"] in DECIDED]
+        best = min(decided or runs, key=lambda r: r["seconds"])
+        portfolio.append({**best, "solver": "portfolio"})
+
+    header = f"{'solver':<10} {'timeout':>7} {'queries':>8} {'decided':>8} "
+    header += f"{'p50 (s)':>10} {'p90 (s)':>10} {'max (s)':>10}"
+    if group:
+        header = f"{group:<12} " + header
+    print(header)
+    table: dict[tuple, list[dict]] = defaultdict(list)
+    for row in rows + (portfolio if len(solvers) > 1 else []):
+        table[(row[group] if group else "", row["solver"], row["timeout"])].append(row)
+    order = {s: i for i, s in enumerate([*solvers, "portfolio"])}
+    for (value, solver, timeout), runs in sorted(
+        table.items(), key=lambda x: (x[0][0], x[0][2], order[x[0][1]])
+    ):
+        seconds = [r["seconds"] for r in runs]
+        decided = sum(r["verdict"] in DECIDED for r in runs)
+        line = f"{solver:<10} {timeout:>7} {len(runs):>8} {decided:>8} "
+        line += f"{percentile(seconds, 50):>10.3f} {percentile(seconds, 90):>10.3f} "
+        line += f"{max(seconds):>10.3f}"
+        print(f"{value:<12} " + line if group else line)
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Replay captured SMT queries.")
+    parser.add_argument("corpus", type=str, help="Directory of captured queries")
+    parser.add_argument("--solver", nargs="+", choices=SOLVERS, default=list(SOLVERS))
+    parser.add_argument(
+        "--timeout",
+        nargs="+",
+        type=int,
+        default=[5],
+        help="Solver timeouts to replay with, in seconds (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--phase", nargs="+", default=None, help="Only replay queries of these phases"
+    )
+    parser.add_argument(
+        "--limit", type=int, default=None, help="Only replay this many distinct queries"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="Number of solvers run in parallel (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--output",
+        type=str,
+        default=None,
+        help="Write the latency of every run to this CSV file",
+    )
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    queries = load_corpus(args.corpus)
+    keys = [
+        k for k, q in queries.items() if args.phase is None or q["phase"] in args.phase
+    ]
+    keys = keys[: args.limit] if args.limit is not None else keys
+    print(f"Replaying {len(keys)} of {len(queries)} distinct queries")
+
+    jobs = [(k, s, t) for k in keys for t in args.timeout for s in args.solver]
+    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+        results = list(
+            executor.map(
+                lambda job: run_query(job[1], job[2], query_text(queries[job[0]])),
+                jobs,
+            )
+        )
+
+    rows = []
+    for (key, solver, timeout), (verdict, seconds) in zip(jobs, results):
+        query = queries[key]
+        rows.append(
+            {
+                "key": key,
+                "instance": query["instance"],
+                "phase": query["phase"],
+                "occurrences": query["occurrences"],
+                "solver": solver,
+                "timeout": timeout,
+                "verdict": verdict,
+                "seconds": seconds,
+                "captured_result": query["captured_result"],
+                "captured_ms": query["captured_ms"],
+            }
+        )
+    errors = sum(r["verdict"] == "error" for r in rows)
+    if errors:
+        print(f"⚠️  {errors} runs failed")
+
+    summarize(rows, args.solver)
+    print()
+    summarize(rows, args.solver, group="phase")
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w", encoding="utf-8", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=list(rows[0]) if rows else ["key"])
+            writer.writeheader()
+            writer.writerows(rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+validate_cascade.py
+
+Check that the scoring cascade of ``E3/Engine/choosePerms.py`` (``--cascade-depth``) chooses the
+same top ``N`` unifications as scoring every candidate by string similarity, on instances built
+from the Book and UniGeo statements (see :mod:`E3.corpus`).
+
+Usage
+-----
+.. code-block:: console
+
+    $ python -m scripts.validate_cascade --dataset Book UniGeo --N 3 --cascade-depth 5000
+
+The script prints every instance on which the two disagree, then a summary per dataset, and
+exits with status 1 if there was any disagreement.
+"""
+
+import argparse
+import contextlib
+import io
+import sys
+import time
+
+from E3.corpus import DATASETS, instances
+from E3.Engine.choosePerms import (
+    CASCADE_DEPTH,
+    CandidateSpace,
+    choosePermutations,
+    getPermutations,
+    parseData,
+)
+
+
+def top_n(props: dict, N: int, cascade_depth: int | None) -> list[tuple[float, tuple]]:
+    """
+    Return the similarity and values of the best ``N`` unifications of an instance, best first.
+    """
+    target, reference, ground, test = parseData(props)
+    univ = getPermutations(ground.univNames)
+    exist = getPermutations(ground.existNames)
+    # `choosePermutations` reports exact matches on stdout
+    with contextlib.redirect_stdout(io.StringIO()):
+        perms, *_ = choosePermutations(
+            ground, test, univ, exist, target, reference, N, cascade_depth=cascade_depth
+        )
+    return [(x.sim, tuple(x.name)) for x in sorted(perms, reverse=True)]
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Validate the scoring cascade of the permutation chooser."
+    )
+    parser.add_argument(
+        "--dataset", nargs="+", choices=DATASETS, default=list(DATASETS)
+    )
+    parser.add_argument("--N", type=int, default=3)
+    parser.add_argument("--cascade-depth", type=int, default=CASCADE_DEPTH)
+    parser.add_argument(
+        "--max-candidates",
+        type=int,
+        default=1000000,
+        help="Skip instances with more candidate unifications than this",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    failed = False
+
+    for dataset in args.dataset:
+        checked = skipped = mismatches = 0
+        exact_time = cascade_time = 0.0
+        for name, props in instances(dataset, args.seed):
+            _, _, ground, _ = parseData(props)
+            space = CandidateSpace(
+                getPermutations(ground.univNames), getPermutations(ground.existNames)
+            )
+            if len(space) > args.max_candidates:
+                skipped += 1
+                continue
+
+            start = time.perf_counter()
+            exact = top_n(props, args.N, None)
+            exact_time += time.perf_counter() - start
+            start = time.perf_counter()
+            cascade = top_n(props, args.N, args.cascade_depth)
+            cascade_time += time.perf_counter() - start
+
+            checked += 1
+            if exact != cascade:
+                mismatches += 1
+                print(f"⚠️  {name}: cascade chose a different top {args.N}")
+                print(f"    exhaustive: {exact}")
+                print(f"    cascade:    {cascade}")
+
+        failed = failed or mismatches > 0
+        print(
+            f"{dataset}: {checked} checked, {skipped} skipped, {mismatches} mismatches, "
+            f"exhaustive {exact_time:.2f}s, cascade {cascade_time:.2f}s"
+        )
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
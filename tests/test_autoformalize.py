@@ -0,0 +1,135 @@
+import argparse
+import asyncio
+import json
+import threading
+import time
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+pytest.importorskip("openai")
+
+from AutoFormalization.statement.autoformalize import (  # noqa: E402
+    formalize_all,
+    pending_statements,
+)
+from E3.store import ResultStore  # noqa: E402
+
+PREDICTION = "∀ (a b : Point), a ≠ b → ∃ L : Line, a.onLine L ∧ b.onLine L"
+
+
+class Gauge:
+    """
+    Counts the calls in progress, and the most that were in progress at once.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.current = 0
+        self.peak = 0
+        self.total = 0
+
+    def __enter__(self):
+        with self.lock:
+            self.current += 1
+            self.total += 1
+            self.peak = max(self.peak, self.current)
+
+    def __exit__(self, *_):
+        with self.lock:
+            self.current -= 1
+
+
+class StubValidator:
+    def __init__(self):
+        self.gauge = Gauge()
+
+    def validate(self, pred, name):
+        with self.gauge:
+            time.sleep(0.02)
+        return None
+
+
+@pytest.fixture
+def endpoint():
+    """
+    An OpenAI-compatible chat completions endpoint that answers every request with
+    ``PREDICTION`` after a short delay, and its gauge of requests.
+    """
+    gauge = Gauge()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            self.rfile.read(int(self.headers["Content-Length"]))
+            with gauge:
+                time.sleep(0.05)
+            body = json.dumps(
+                {
+                    "id": "stub",
+                    "object": "chat.completion",
+                    "created": 0,
+                    "model": "stub",
+                    "choices": [
+                        {
+                            "index": 0,
+                            "finish_reason": "stop",
+                            "message": {
+                                "role": "assistant",
+                                "content": f"<<< {PREDICTION} >>>",
+                            },
+                        }
+                    ],
+                }
+            ).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *_):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/v1", gauge
+    server.shutdown()
+    server.server_close()
+
+
+def test_formalize_all_bounds_requests_and_validations(endpoint, tmp_path, monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "stub")
+    base_url, requests = endpoint
+    args = argparse.Namespace(
+        dataset="Book",
+        reasoning="text-only",
+        model="stub",
+        num_query=1,
+        concurrency=3,
+        validation_jobs=1,
+        base_url=base_url,
+    )
+    validator = StubValidator()
+    indices = [1, 3, 4, 5, 7, 8, 9, 10]
+    asyncio.run(
+        formalize_all(args, "", indices, "", [], validator, str(tmp_path), None)
+    )
+
+    assert requests.total == len(indices)
+    assert requests.peak == 3
+    assert validator.gauge.total == len(indices)
+    assert validator.gauge.peak == 1
+    for i in indices:
+        result = json.loads((tmp_path / f"{i}.json").read_text(encoding="utf-8"))
+        assert result["prediction"] == PREDICTION
+
+
+def test_pending_statements_skips_existing_results(tmp_path):
+    (tmp_path / "1.json").write_text("{}")
+    assert pending_statements([1, 2, 3], str(tmp_path), None) == [2, 3]
+
+    store = ResultStore(str(tmp_path / "results.sqlite"))
+    store.put_json("statement", str(tmp_path / "3.json"), {})
+    assert pending_statements([1, 2, 3], str(tmp_path), store) == [1, 2]
@@ -0,0 +1,83 @@
+import itertools
+
+import pytest
+
+from E3 import cache
+from E3.cache import DEFINITIVE, TIMEOUT, ResultCache
+
+GROUND = "∀ (a b : Point), a ≠ b → ∃ L : Line, a.onLine L ∧ b.onLine L"
+TEST = "∀ (a b : Point),  a ≠ b →\n  ∃ L : Line, a.onLine L ∧ b.onLine L"
+EQUIV = {"binary_check": "equiv"}
+NO_CONCLUSION = {"binary_check": "no_conclusion"}
+
+
+@pytest.fixture
+def results(tmp_path) -> ResultCache:
+    return ResultCache(str(tmp_path / "e3.sqlite"))
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    # distinct access times, so that the least recently used entry is well defined
+    ticks = itertools.count()
+    monkeypatch.setattr(cache.time, "time", lambda: float(next(ticks)))
+
+
+def test_definitive_results_ignore_the_time_budget(results):
+    results.put(GROUND, TEST, "full", 3, 10, 5, EQUIV)
+    assert results.get(GROUND, TEST, "full", 3, 10, 5) == EQUIV
+    assert results.get(GROUND, TEST, "full", 3, 60, 30) == EQUIV
+    assert results.get(GROUND, TEST, "full", 4, 10, 5) is None
+    assert results.stats() == {
+        DEFINITIVE: (1, len('{"binary_check": "equiv"}')),
+        TIMEOUT: (0, 0),
+    }
+
+
+def test_keys_ignore_whitespace(results):
+    results.put(GROUND, GROUND, "full", 3, 10, 5, EQUIV)
+    assert results.get(GROUND, TEST, "full", 3, 10, 5) == EQUIV
+
+
+def test_other_results_are_keyed_by_the_time_budget(results):
+    results.put(GROUND, TEST, "full", 3, 10, 5, NO_CONCLUSION)
+    assert results.get(GROUND, TEST, "full", 3, 10, 5) == NO_CONCLUSION
+    assert results.get(GROUND, TEST, "full", 3, 60, 5) is None
+    assert results.get(GROUND, TEST, "full", 3, 10, 5, chooser_budget_ms=100) is None
+
+
+def test_definitive_results_take_precedence(results):
+    results.put(GROUND, TEST, "full", 3, 10, 5, NO_CONCLUSION)
+    results.put(GROUND, TEST, "full", 3, 60, 5, EQUIV)
+    assert results.get(GROUND, TEST, "full", 3, 10, 5) == EQUIV
+
+
+def test_evict_deletes_the_least_recently_used(results, clock):
+    for n_perms in range(3):
+        results.put(GROUND, TEST, "full", n_perms, 10, 5, EQUIV)
+    results.get(GROUND, TEST, "full", 0, 10, 5)
+    size = results.stats()[DEFINITIVE][1] // 3
+    assert results.evict(2 * size) == 1
+    assert results.get(GROUND, TEST, "full", 1, 10, 5) is None
+    assert results.get(GROUND, TEST, "full", 0, 10, 5) == EQUIV
+    assert results.get(GROUND, TEST, "full", 2, 10, 5) == EQUIV
+
+
+def test_put_enforces_the_size_bound(tmp_path, clock):
+    size = len('{"binary_check": "equiv"}')
+    results = ResultCache(str(tmp_path / "e3.sqlite"), max_bytes=2 * size)
+    for n_perms in range(3):
+        results.put(GROUND, TEST, "full", n_perms, 10, 5, EQUIV)
+    assert results.stats()[DEFINITIVE] == (2, 2 * size)
+    assert results.get(GROUND, TEST, "full", 0, 10, 5) is None
+
+
+def test_prune_timeouts(results):
+    results.put(GROUND, TEST, "full", 3, 10, 5, EQUIV)
+    results.put(GROUND, TEST, "full", 3, 10, 5, NO_CONCLUSION)
+    results.put(GROUND, TEST, "full", 4, 60, 5, NO_CONCLUSION)
+    assert results.prune_timeouts(below_bin_time=30) == 1
+    assert results.get(GROUND, TEST, "full", 4, 60, 5) == NO_CONCLUSION
+    assert results.prune_timeouts() == 1
+    assert results.stats()[TIMEOUT] == (0, 0)
+    assert results.get(GROUND, TEST, "full", 3, 10, 5) == EQUIV
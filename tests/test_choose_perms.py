@@ -0,0 +1,196 @@
+import contextlib
+import io
+import itertools
+import math
+
+import pytest
+
+from E3.corpus import DATASETS, instances
+from E3.Engine import choosePerms
+from E3.Engine.choosePerms import (
+    CandidateSpace,
+    ChooserMemo,
+    NameMap,
+    Symmetry,
+    TopN,
+    choose,
+    choosePermutations,
+    getPermutations,
+    parseData,
+)
+
+N = 3
+MAX_CANDIDATES = 5000
+
+
+def small_instances(
+    datasets=("Book",), count: int | None = 8, min_candidates: int = 24
+) -> list[tuple[str, dict]]:
+    """
+    Return the first ``count`` (or all) instances of ``datasets`` with between
+    ``min_candidates`` and ``MAX_CANDIDATES`` candidate unifications.
+    """
+    chosen = []
+    for dataset in datasets:
+        for name, props in instances(dataset):
+            _, _, ground, _ = parseData(props)
+            space = CandidateSpace(
+                getPermutations(ground.univNames), getPermutations(ground.existNames)
+            )
+            if min_candidates <= len(space) <= MAX_CANDIDATES:
+                chosen.append((name, props))
+            if len(chosen) == count:
+                return chosen
+    return chosen
+
+
+# a few instances where every strategy has a choice to make
+INSTANCES = small_instances()
+# every instance of the corpus small enough to search exhaustively
+CORPUS = small_instances(DATASETS, count=None, min_candidates=2)
+
+
+def top_n(props: dict, **options) -> list[tuple[float, tuple]]:
+    """
+    Return the similarity and values of the best ``N`` unifications of an instance, best first.
+    """
+    target, reference, ground, test = parseData(props)
+    univ = getPermutations(ground.univNames)
+    exist = getPermutations(ground.existNames)
+    # `choosePermutations` reports exact matches on stdout
+    with contextlib.redirect_stdout(io.StringIO()):
+        perms, *_ = choosePermutations(
+            ground, test, univ, exist, target, reference, N, **options
+        )
+    return [(x.sim, tuple(x.name)) for x in sorted(perms, reverse=True)]
+
+
+@pytest.mark.parametrize("name, props", INSTANCES, ids=[n for n, _ in INSTANCES])
+def test_sharded_matches_exhaustive(monkeypatch, name, props):
+    monkeypatch.setattr(choosePerms, "SHARD_THRESHOLD", 1)
+    assert top_n(props, workers=2) == top_n(props)
+
+
+def test_top_n_keeps_the_best_distinct_candidates():
+    top = TopN(2)
+    assert top.push(NameMap(("a", "b"), 0.5, 0))
+    assert not top.push(NameMap(("a", "b"), 0.9, -1))
+    assert top.floor() == 0.0
+    assert top.push(NameMap(("b", "a"), 0.7, -2))
+    assert top.floor() == 0.5
+    assert top.push(NameMap(("c", "a"), 0.6, -3))
+    assert not top.push(NameMap(("a", "c"), 0.4, -4))
+    assert sorted((x.sim, x.name) for x in top) == [
+        (0.6, ("c", "a")),
+        (0.7, ("b", "a")),
+    ]
+    # the evicted candidate may enter again
+    assert top.push(NameMap(("a", "b"), 0.8, -5))
+    assert {x.name for x in top} == {("a", "b"), ("b", "a")}
+
+
+def test_top_n_breaks_ties_by_tiebreak():
+    top = TopN(1)
+    top.push(NameMap(("b", "a"), 0.5, -1))
+    assert top.push(NameMap(("a", "b"), 0.5, 0))
+    assert not top.push(NameMap(("c", "a"), 0.5, -2))
+    assert [x.name for x in top] == [("a", "b")]
+
+
+def test_top_n_deduplicates_by_key():
+    top = TopN(3, key=lambda name: tuple(sorted(name)))
+    assert top.push(NameMap(("a", "b"), 0.5, 0))
+    assert not top.push(NameMap(("b", "a"), 0.9, -1))
+    assert len(top) == 1
+
+
+@pytest.mark.parametrize("name, props", CORPUS, ids=[n for n, _ in CORPUS])
+def test_branch_and_bound_matches_exhaustive(name, props):
+    assert top_n(props, strategy="bnb") == top_n(props)
+
+
+@pytest.mark.parametrize("name, props", CORPUS, ids=[n for n, _ in CORPUS])
+def test_unbounded_beam_matches_exhaustive(name, props):
+    # a beam as wide as the space keeps every partial assignment
+    assert top_n(props, strategy="beam", beam_width=MAX_CANDIDATES) == top_n(props)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    # distinct access times, so that the least recently used entry is well defined
+    ticks = itertools.count()
+    monkeypatch.setattr(choosePerms.time, "time", lambda: float(next(ticks)))
+
+
+def test_memo_returns_what_was_put(tmp_path):
+    memo = ChooserMemo(str(tmp_path / "memo.sqlite"))
+    assert memo.get("key") is None
+    memo.put("key", {"perms": [["a", "b"]], "stats": {}})
+    assert memo.get("key") == {"perms": [["a", "b"]], "stats": {}}
+
+
+def test_memo_evicts_the_least_recently_used(tmp_path, clock):
+    output = {"perms": [["a", "b"]], "stats": {}}
+    size = len(choosePerms.json.dumps(output))
+    memo = ChooserMemo(str(tmp_path / "memo.sqlite"), max_bytes=2 * size)
+    memo.put("first", output)
+    memo.put("second", output)
+    assert memo.get("first") == output
+    memo.put("third", output)
+    assert memo.get("second") is None
+    assert memo.get("first") == output
+    assert memo.get("third") == output
+
+
+def test_choose_answers_from_the_memo(tmp_path):
+    memo = ChooserMemo(str(tmp_path / "memo.sqlite"))
+    _, props = INSTANCES[0]
+    with contextlib.redirect_stdout(io.StringIO()):
+        first = choose(props, N, memo=memo)
+        second = choose(props, N, memo=memo)
+        other = choose(props, N, strategy="bnb", memo=memo)
+    assert "memoized" not in first["stats"]
+    assert second["stats"].pop("memoized")
+    assert second == first
+    assert "memoized" not in other["stats"]
+
+
+def symmetric_instance():
+    """
+    Return the symmetry of the reference of a corpus instance that has one, and its space.
+    """
+    for name, props in CORPUS:
+        target, reference, ground, test = parseData(props)
+        univ = getPermutations(ground.univNames)
+        exist = getPermutations(ground.existNames)
+        names = [
+            *ground.univNames.points,
+            *ground.univNames.lines,
+            *ground.univNames.circles,
+            *ground.existNames.points,
+            *ground.existNames.lines,
+            *ground.existNames.circles,
+        ]
+        space = CandidateSpace(univ, exist)
+        symmetry = Symmetry.fromProposition(reference, names, space.bounds())
+        if symmetry:
+            return props, space, symmetry
+    pytest.skip("no corpus instance has a symmetry")
+
+
+def test_canonical_candidates_are_generated_with_their_indices():
+    _, space, symmetry = symmetric_instance()
+    expected = [(i, v) for i, v in enumerate(space) if symmetry.isCanonical(v)]
+    assert 0 < len(expected) < len(space)
+    assert list(space.indexed(symmetry=symmetry)) == expected
+    for prefix in space.shards(16):
+        shard = [(i, v) for i, v in expected if v[: len(prefix)] == prefix]
+        assert list(space.indexed(prefix, symmetry)) == shard
+
+
+@pytest.mark.parametrize("options", [{}, {"workers": 2}, {"deadline": math.inf}])
+def test_symmetry_keeps_the_best_scores(monkeypatch, options):
+    monkeypatch.setattr(choosePerms, "SHARD_THRESHOLD", 1)
+    props, _, _ = symmetric_instance()
+    exhaustive = [sim for sim, _ in top_n(props)]
+    assert [sim for sim, _ in top_n(props, symmetry=True, **options)] == exhaustive
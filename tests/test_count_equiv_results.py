@@ -0,0 +1,74 @@
+import json
+import os
+
+import pytest
+
+from scripts.count_equiv_results import ResultsIndex, scan_results
+
+
+def write_result(path, binary_check: str, timings: dict | None = None) -> None:
+    result = {"binary_check": binary_check}
+    if timings is not None:
+        result["timings"] = timings
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps({"proposition_1": result}))
+
+
+@pytest.fixture
+def results(tmp_path):
+    directory = tmp_path / "result"
+    write_result(directory / "gpt-4" / "Book" / "1.json", "equiv", {"binary": 12})
+    write_result(directory / "gpt-4" / "Book" / "2.json", "no_conclusion")
+    write_result(directory / "gpt-4" / "UniGeo" / "1.json", "ground_imp_test")
+    return directory
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = ResultsIndex(str(tmp_path / "index.sqlite"))
+    yield index
+    index.close()
+
+
+def test_first_update_parses_every_file(results, index):
+    assert index.update(results, 3) == {"parsed": 3, "removed": 0, "unchanged": 0}
+    assert index.records(results, 3) == scan_results(results, 3)
+
+
+def test_rescan_only_parses_changed_files(results, index):
+    index.update(results, 3)
+    assert index.update(results, 3) == {"parsed": 0, "removed": 0, "unchanged": 3}
+
+    changed = results / "gpt-4" / "Book" / "2.json"
+    write_result(changed, "test_imp_ground")
+    # a rewrite within the timestamp granularity is detected by its size or mtime
+    stat = changed.stat()
+    os.utime(changed, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+    assert index.update(results, 3) == {"parsed": 1, "removed": 0, "unchanged": 2}
+    assert index.records(results, 3) == scan_results(results, 3)
+
+
+def test_rescan_forgets_removed_files(results, index):
+    index.update(results, 3)
+    (results / "gpt-4" / "UniGeo" / "1.json").unlink()
+    assert index.update(results, 3) == {"parsed": 0, "removed": 1, "unchanged": 2}
+    assert [r[0] for r in index.records(results, 3)] == [
+        os.path.join("gpt-4", "Book", "1.json"),
+        os.path.join("gpt-4", "Book", "2.json"),
+    ]
+
+
+def test_directories_are_indexed_separately(results, index, tmp_path):
+    other = tmp_path / "result-rag"
+    write_result(other / "gpt-4" / "Book" / "1.json", "no_conclusion")
+    index.update(results, 3)
+    index.update(other, 3)
+    assert index.records(other, 3) == scan_results(other, 3)
+    assert index.update(results, 3) == {"parsed": 0, "removed": 0, "unchanged": 3}
+
+
+def test_records_respect_max_depth(results, index):
+    write_result(results / "1.json", "equiv")
+    index.update(results, 3)
+    assert index.records(results, 1) == [("1.json", "equiv", None)]
+    assert index.update(results, 1) == {"parsed": 0, "removed": 0, "unchanged": 1}
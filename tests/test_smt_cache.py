@@ -0,0 +1,84 @@
+import os
+
+import pytest
+
+from E3.smt_cache import SmtCache, fnv1a64, query_key, theory_key
+
+THEORY = "(declare-sort Point 0)\n(declare-fun between (Point Point Point) Bool)\n"
+GOAL = "(declare-const a Point)\n(assert (not (= a a)))\n"
+OTHER_GOAL = GOAL.replace("(= a a)", "(= a b)")
+# `SystemE.Cache.Theory.of` and `SystemE.Cache.key` of `THEORY` and `GOAL`: the FNV-1a hashes of
+# "3\n" and the trimmed theory, then of the theory key, "\n" and the trimmed goal
+THEORY_KEY = "1b8273e29943f88c"
+GOAL_KEY = "e88a6d1c9ff10c5c"
+
+
+@pytest.fixture
+def smt(tmp_path) -> SmtCache:
+    return SmtCache(str(tmp_path / "smt"))
+
+
+def test_fnv1a64_matches_the_reference_vectors():
+    assert fnv1a64(b"") == 0xCBF29CE484222325
+    assert fnv1a64(b"a") == 0xAF63DC4C8601EC8C
+    assert fnv1a64(b"foobar") == 0x85944171F73967E8
+
+
+def test_keys_match_the_lean_keys():
+    assert theory_key(THEORY) == THEORY_KEY
+    assert query_key(THEORY_KEY, GOAL) == GOAL_KEY
+    assert query_key(THEORY_KEY, GOAL + "(check-sat)\n") == GOAL_KEY
+    assert query_key(THEORY_KEY, OTHER_GOAL) != GOAL_KEY
+    assert query_key(theory_key(THEORY + "(declare-sort Line 0)"), GOAL) != GOAL_KEY
+
+
+def test_reads_entries_in_the_lean_layout(smt):
+    file = os.path.join(smt.path, GOAL_KEY[:2], GOAL_KEY)
+    os.makedirs(os.path.dirname(file))
+    with open(file, "w", encoding="utf-8") as f:
+        f.write(f"unsat\n{THEORY_KEY}\n{GOAL.rstrip()}")
+    assert smt.get(THEORY_KEY, GOAL + "(check-sat)", 10) == "unsat"
+
+
+def test_entries_hold_the_goal_but_not_the_theory(smt):
+    smt.put(THEORY_KEY, GOAL, 10, "sat")
+    with open(os.path.join(smt.path, GOAL_KEY[:2], GOAL_KEY), encoding="utf-8") as f:
+        assert f.read() == f"sat\n{THEORY_KEY}\n{GOAL.rstrip()}"
+
+
+def test_put_and_get(smt):
+    assert smt.get(THEORY_KEY, GOAL, 10) is None
+    smt.put(THEORY_KEY, GOAL, 10, "sat")
+    assert smt.get(THEORY_KEY, GOAL, 10) == "sat"
+    assert smt.get(THEORY_KEY, GOAL, 60) == "sat"
+    assert smt.get(theory_key(THEORY + "(declare-sort Line 0)"), GOAL, 10) is None
+    with pytest.raises(ValueError):
+        smt.put(THEORY_KEY, GOAL, 10, "timeout")
+
+
+def test_unknown_is_only_reused_for_smaller_timeouts(smt):
+    smt.put(THEORY_KEY, GOAL, 10, "unknown")
+    assert smt.get(THEORY_KEY, GOAL, 5) == "unknown"
+    assert smt.get(THEORY_KEY, GOAL, 10) == "unknown"
+    assert smt.get(THEORY_KEY, GOAL, 11) is None
+
+
+def test_a_colliding_query_misses(smt):
+    smt.put(THEORY_KEY, GOAL, 10, "unsat")
+    # move the entry to where the other goal is looked up, as if the keys collided
+    other_key = query_key(THEORY_KEY, OTHER_GOAL)
+    source = os.path.join(smt.path, GOAL_KEY[:2], GOAL_KEY)
+    target = os.path.join(smt.path, other_key[:2], other_key)
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    os.replace(source, target)
+    assert smt.get(THEORY_KEY, OTHER_GOAL, 10) is None
+
+
+def test_stats_and_prune(smt):
+    smt.put(THEORY_KEY, GOAL, 10, "unsat")
+    smt.put(THEORY_KEY, OTHER_GOAL, 10, "unknown")
+    assert smt.stats() == {"sat": 0, "unsat": 1, "unknown": 1}
+    assert smt.prune(unknown_only=True) == 1
+    assert smt.stats() == {"sat": 0, "unsat": 1, "unknown": 0}
+    assert smt.prune() == 1
+    assert list(smt.entries()) == []
@@ -0,0 +1,77 @@
+import os
+
+import pytest
+
+from E3.store import ResultStore, store_key
+from E3.utils import ROOT_DIR
+
+STATEMENT = os.path.join(ROOT_DIR, "result", "statement", "Book", "Parallel", "1.json")
+EQUIVALENCE = os.path.join(ROOT_DIR, "result", "equivalence", "Book", "1.json")
+
+
+@pytest.fixture
+def store(tmp_path) -> ResultStore:
+    return ResultStore(str(tmp_path / "results.sqlite"))
+
+
+def test_store_key(tmp_path):
+    assert store_key(STATEMENT) == os.path.join(
+        "result", "statement", "Book", "Parallel", "1.json"
+    )
+    assert store_key(str(tmp_path / "1.json")) == str(tmp_path / "1.json")
+
+
+def test_get_returns_the_latest_record(store):
+    assert store.get(STATEMENT) is None
+    assert not store.has(STATEMENT)
+    store.put("statement", STATEMENT, "first")
+    store.put_json("statement", STATEMENT, {"prediction": "second"})
+    assert store.has(STATEMENT)
+    assert store.get_json(STATEMENT) == {"prediction": "second"}
+    with pytest.raises(ValueError):
+        store.put("prediction", STATEMENT, "third")
+
+
+def test_latest_filters_by_prefix_and_kind(store):
+    store.put("statement", STATEMENT, "statement")
+    store.put("equivalence", EQUIVALENCE, "old")
+    store.put("equivalence", EQUIVALENCE, "new")
+    assert list(store.latest(os.path.join(ROOT_DIR, "result", "equivalence"))) == [
+        (store_key(EQUIVALENCE), "equivalence", "new")
+    ]
+    assert [key for key, _, _ in store.latest(kind="statement")] == [
+        store_key(STATEMENT)
+    ]
+    # a prefix is a directory, not a string prefix
+    assert list(store.latest(os.path.join(ROOT_DIR, "result", "equiv"))) == []
+
+
+def test_compact_keeps_the_latest_records(store):
+    store.put("equivalence", EQUIVALENCE, "old")
+    store.put("equivalence", EQUIVALENCE, "new")
+    store.put("statement", STATEMENT, "statement")
+    assert store.stats()["equivalence"] == (1, 2)
+    assert store.compact() == 1
+    assert store.stats()["equivalence"] == (1, 1)
+    assert store.get(EQUIVALENCE) == "new"
+
+
+def test_import_then_export(store, tmp_path):
+    source = tmp_path / "source"
+    (source / "Book").mkdir(parents=True)
+    (source / "Book" / "1.json").write_text("{}")
+    (source / "Book" / "notes.txt").write_text("notes")
+    assert store.import_files(str(source), "proof", ".json") == 1
+    # unchanged files are not recorded again
+    assert store.import_files(str(source), "proof", ".json") == 0
+    (source / "Book" / "1.json").write_text('{"changed": true}')
+    assert store.import_files(str(source), "proof", ".json") == 1
+
+    store.put("proof", STATEMENT, "inside")
+    target = tmp_path / "target"
+    # files recorded from outside the repository only go back to their own location
+    assert store.export(str(target)) == 1
+    assert (target / store_key(STATEMENT)).read_text() == "inside"
+    (source / "Book" / "1.json").unlink()
+    assert store.export(ROOT_DIR, prefix=str(source)) == 1
+    assert (source / "Book" / "1.json").read_text() == '{"changed": true}'